@@ -0,0 +1,73 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from lib.preprocessing.encode import get_encoded_actors_df
+from loguru import logger
+
+
+def make_synthetic_movies(n_movies: int, n_actors: int, seed: int = 0) -> pd.DataFrame:
+    '''
+    Build a fake catalog with the columns used by `get_encoded_actors_df`
+
+    Parameters
+    ----------
+    n_movies: int
+        Number of movies
+    n_actors: int
+        Number of distinct actors to draw the casts from
+    seed: int, default 0
+        Random seed
+
+    Returns
+    -------
+    df: pd.DataFrame
+        Movies with `cast`, `release_date` and `sales`
+    '''
+    rng = np.random.default_rng(seed)
+    cast_ids = rng.integers(0, n_actors, size=(n_movies, 3))
+    release_dates = pd.Timestamp('2000-01-01') + pd.to_timedelta(rng.integers(0, 7300, n_movies), unit='D')
+    return pd.DataFrame({
+        'cast': [[{'name': f'actor_{actor_id}'} for actor_id in movie_cast] for movie_cast in cast_ids],
+        'release_date': release_dates.strftime('%Y-%m-%d'),
+        'sales': rng.integers(1000, 1000000, n_movies).astype(float),
+    })
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Time get_encoded_actors_df on synthetic catalogs of growing size')
+    parser.add_argument("-n", "--sizes", type=int, nargs='+', default=[10000, 20000, 40000, 80000, 160000],
+        help='Number of movies of each synthetic catalog')
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+        help='Number of runs per size, the best one is kept')
+
+    args = parser.parse_args()
+
+    for n_movies in args.sizes:
+        # Keep the actors / movies ratio close to the real catalog one
+        movies = make_synthetic_movies(n_movies, n_actors=n_movies)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            get_encoded_actors_df(movies.copy())
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        logger.info(f'{n_movies:>8} movies: {best:.3f}s ({best / n_movies * 1e6:.2f} µs/movie)')
@@ -0,0 +1,86 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from lib.preprocessing.encode import get_mean_popularities
+from loguru import logger
+
+
+def get_mean_popularity_per_movie(df_all, top_n: int):
+    # Former implementation, one python lambda per movie and one run per top_n
+    df_all[f'mean_{top_n}_popularity'] = df_all['cast'].map(
+        lambda x: np.mean([np.log(el['tmdb_popularity']) if np.log(el['tmdb_popularity']) > 0 else 0 for el in x[:top_n]])) \
+            .fillna(0)
+    return df_all
+
+
+def make_synthetic_casts(n_movies: int, seed: int = 0) -> pd.DataFrame:
+    '''
+    Build fake casts of 0 to 150 members, as found in TMDb credits
+
+    Parameters
+    ----------
+    n_movies: int
+        Number of movies
+    seed: int, default 0
+        Random seed
+
+    Returns
+    -------
+    df: pd.DataFrame
+        Movies with a `cast` column
+    '''
+    rng = np.random.default_rng(seed)
+    cast_sizes = rng.integers(0, 150, n_movies)
+    popularity = rng.lognormal(1, 1, cast_sizes.sum())
+    offsets = np.concatenate([[0], np.cumsum(cast_sizes)])
+    return pd.DataFrame({
+        'cast': [
+            [{'tmdb_popularity': p} for p in popularity[start:end]]
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+    })
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Compare cast popularity features implementations')
+    parser.add_argument("-n", "--n-movies", type=int, default=100000,
+        help='Number of movies of the synthetic catalog')
+    parser.add_argument("--top-n", type=int, nargs='+', default=[3, 5],
+        help='Numbers of top cast members to average')
+
+    args = parser.parse_args()
+    movies = make_synthetic_casts(args.n_movies)
+
+    start = time.perf_counter()
+    expected = movies.copy()
+    for top_n in args.top_n:
+        expected = get_mean_popularity_per_movie(expected, top_n)
+    per_movie_time = time.perf_counter() - start
+    logger.info(f'per movie lambdas: {per_movie_time:.3f}s')
+
+    start = time.perf_counter()
+    result = get_mean_popularities(movies.copy(), args.top_n)
+    vectorized_time = time.perf_counter() - start
+    logger.info(f'vectorized: {vectorized_time:.3f}s (x{per_movie_time / vectorized_time:.1f})')
+
+    cols = [f'mean_{top_n}_popularity' for top_n in args.top_n]
+    assert np.allclose(result[cols], expected[cols]), 'Implementations disagree'
@@ -0,0 +1,105 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from lib.crawling.movie_features.records import parse_movie_record
+from lib.crawling.movie_features.tmdb.stub_server import get_stub_movie_details
+from lib.crawling.movie_features.types import unmarshal_card
+from loguru import logger
+
+
+def make_raw_responses(n_movies: int, cast_size: int) -> list:
+    '''
+    Build raw TMDb details responses with appended credits
+
+    Parameters
+    ----------
+    n_movies: int
+        Number of movies
+    cast_size: int
+        Number of cast members of each movie
+
+    Returns
+    -------
+    responses: list
+        json bodies, as bytes
+    '''
+    responses = []
+    for movie_id in range(1, n_movies + 1):
+        details = get_stub_movie_details(movie_id)
+        details['credits'] = {'id': movie_id, 'crew': [], 'cast': [{
+            'adult': False,
+            'id': movie_id * cast_size + order,
+            'name': f'Actor {movie_id * cast_size + order}',
+            'gender': order % 3,
+            'popularity': order / 3,
+            'known_for_department': 'Acting',
+            'character': f'Character {order}',
+            'credit_id': f'{movie_id:012d}{order:012d}',
+            'order': order,
+        } for order in range(cast_size)]}
+        responses.append(json.dumps(details).encode('utf-8'))
+    return responses
+
+
+def measure(parse, responses: list) -> tuple:
+    # Time of parsing, without garbage collection passes as timeit does, then memory
+    # held by the parsed movies, traced separately as tracing slows parsing down
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    movies = [parse(response) for response in responses]
+    elapsed = time.perf_counter() - start
+    gc.enable()
+    del movies
+    gc.collect()
+    tracemalloc.start()
+    movies = [parse(response) for response in responses]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, memory
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Compare movie cards and lean movie records, in unmarshal time and memory')
+    parser.add_argument("-n", "--n-movies", type=int, default=5000,
+        help='Number of movies')
+    parser.add_argument("--cast-size", type=int, default=40,
+        help='Number of cast members of each movie')
+    parser.add_argument("-k", "--top-k-cast", type=int, default=5,
+        help='Number of cast members kept in the records')
+
+    args = parser.parse_args()
+    responses = make_raw_responses(args.n_movies, args.cast_size)
+
+    # Json decoding is shared by both, time it apart from unmarshalling
+    start = time.perf_counter()
+    decoded = [json.loads(response) for response in responses]
+    logger.info(f'json decoding: {time.perf_counter() - start:.3f}s')
+
+    card_time, card_memory = measure(unmarshal_card, decoded)
+    logger.info(f'movie cards: {card_time:.3f}s, {card_memory / args.n_movies / 1024:.1f} KiB per movie')
+
+    for top_k_cast in [None, args.top_k_cast]:
+        record_time, record_memory = measure(lambda details: parse_movie_record(details, top_k_cast), decoded)
+        logger.info(f'movie records, top {top_k_cast or "all"} cast: {record_time:.3f}s (x{card_time / record_time:.1f}), '
+                    f'{record_memory / args.n_movies / 1024:.1f} KiB per movie (x{card_memory / record_memory:.1f})')
@@ -0,0 +1,73 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import time
+from lib.crawling.movie_features.tmdb.async_client import AsyncTMDbClient
+from lib.crawling.movie_features.tmdb.client import TMDbClient
+from lib.crawling.movie_features.tmdb.rate_limiter import TokenBucketRateLimiter
+from lib.crawling.movie_features.tmdb.stub_server import start_stub_server
+from loguru import logger
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Compare sequential and concurrent TMDb enrichment against a local stub server')
+    parser.add_argument("-n", "--n-titles", type=int, default=500,
+        help='Number of titles to enrich')
+    parser.add_argument("-c", "--concurrency", type=int, nargs='+', default=[1, 5, 10, 20, 40],
+        help='Concurrency limits of the async client')
+    parser.add_argument("-l", "--latency", type=float, default=0.05,
+        help='Delay in seconds added by the stub server to each response')
+    parser.add_argument("-r", "--rate", type=float, default=10000,
+        help='Number of requests per second allowed by the client rate limiter')
+    parser.add_argument("--server-rate-limit", type=int, default=None,
+        help='Number of requests per second accepted by the stub server, the others get a 429')
+    parser.add_argument("--skip-sequential", action='store_true',
+        help='Do not time the sequential client')
+
+    args = parser.parse_args()
+    server = start_stub_server(latency=args.latency, rate_limit=args.server_rate_limit)
+    titles = [f'Movie title {i}' for i in range(args.n_titles)]
+
+    expected = None
+    if not args.skip_sequential:
+        client = TMDbClient(api_key='stub', base_url=server.url, rate_limiter=TokenBucketRateLimiter(args.rate),
+                            append_credits=False)
+        start = time.perf_counter()
+        expected = [client.find_movie_features(title) for title in titles]
+        sequential_time = time.perf_counter() - start
+        logger.info(f'sequential: {sequential_time:.2f}s ({args.n_titles / sequential_time:.1f} titles/s)')
+
+    for concurrency in args.concurrency:
+        for append_credits in [False, True]:
+            client = AsyncTMDbClient(api_key='stub', base_url=server.url, concurrency=concurrency,
+                                     rate_limiter=TokenBucketRateLimiter(args.rate), append_credits=append_credits)
+            requests_count = server.requests_count
+            start = time.perf_counter()
+            cards = asyncio.run(client.find_movies_features(titles))
+            elapsed = time.perf_counter() - start
+            client.close()
+            mode = 'append_to_response' if append_credits else 'separate credits'
+            logger.info(f'async, concurrency {concurrency}, {mode}: {elapsed:.2f}s '
+                        f'({args.n_titles / elapsed:.1f} titles/s, {server.requests_count - requests_count} requests)')
+            if expected is not None:
+                assert cards == expected, 'Sequential and async clients disagree'
+
+    logger.info(f'stub server: {server.requests_count} requests, {server.rejected_count} rejected with a 429')
+    server.shutdown()
@@ -0,0 +1,35 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+from config import CAST_TABLE_FILEPATH, MOVIE_FEATURES_FILEPATH
+from lib.preprocessing.cast_table import CastTable
+from loguru import logger
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Build the columnar cast table of a movie features dump')
+    parser.add_argument("-i", "--input", type=str, default=MOVIE_FEATURES_FILEPATH,
+        help='Path to the movie features json saved by bin/get_movie_features.py')
+    parser.add_argument("-o", "--output", type=str, default=CAST_TABLE_FILEPATH,
+        help='A path where the cast table is saved, as .npz')
+
+    args = parser.parse_args()
+    cast_table = CastTable.from_movie_features_json(args.input)
+    cast_table.save(args.output)
+    logger.info(f"{len(cast_table)} movies and {len(cast_table.actor_ids)} cast members in the cast table")
@@ -0,0 +1,46 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+from config import TMDB_TITLE_INDEX_FILEPATH
+from lib.crawling.movie_features.tmdb.title_index import TitleIndex
+from lib.utils.io import iter_json_records
+from loguru import logger
+import os.path
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Build the local title to TMDb id index from movie features dumps')
+    parser.add_argument("-i", "--inputs", type=str, nargs='+', default=[],
+        help='Paths to movie features json saved by bin/get_movie_features.py')
+    parser.add_argument("--indexes", type=str, nargs='+', default=[],
+        help='Paths to title indexes to merge, e.g. the ones saved by the shards of a crawl')
+    parser.add_argument("-o", "--output", type=str, default=TMDB_TITLE_INDEX_FILEPATH,
+        help='A path where the index is saved. If it already exists, new titles are added to it.')
+
+    args = parser.parse_args()
+    if not args.inputs and not args.indexes:
+        parser.error('Give at least one of --inputs or --indexes')
+    title_index = TitleIndex.load(args.output) if os.path.isfile(args.output) else TitleIndex()
+    n_titles = len(title_index)
+    for path in args.inputs:
+        title_index.add_movie_features(iter_json_records(path))
+    for path in args.indexes:
+        title_index.update(TitleIndex.load(path))
+    title_index.save(args.output)
+    logger.info(f"Added {len(title_index) - n_titles} titles to the index, {len(title_index)} in total")
@@ -15,11 +15,22 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
+import asyncio
+import datetime
 import json
-import time
+import zlib
 from typing import Union
+from loguru import logger
 from tqdm import tqdm
-from lib.crawling.movie_features.tmdb.client import TMDbClient
+from config import TMDB_CACHE_FILEPATH, TMDB_RATE_LIMIT, TMDB_RATE_LIMITER_FILEPATH, TMDB_TITLE_INDEX_FILEPATH
+from lib.crawling.movie_features.journal import (MovieJournal, compact_journal, iter_journal, load_sync_watermark,
+                                                 read_journal_ids, save_sync_watermark)
+from lib.crawling.movie_features.tmdb.async_client import AsyncTMDbClient
+from lib.crawling.movie_features.tmdb.cache import ResponseCache
+from lib.crawling.movie_features.tmdb.rate_limiter import TokenBucketRateLimiter
+from lib.crawling.movie_features.tmdb.title_index import TitleIndex, get_shard_index_path
+from lib.crawling.movie_features.tmdb.client import TMDB_API_URL
+from lib.utils.io import iter_json_records
 import os.path
 
 
@@ -28,57 +39,204 @@ def read_from_json(path: str) -> Union[list, dict]:
         data = json.load(infile)
     return data
 
-def save_json_file(payload: Union[list, dict], path: str) -> None:
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(payload, f, ensure_ascii=False, indent=4)
 
+def get_shard(movie_id: str, num_shards: int) -> int:
+    # A stable hash, unlike hash() which changes between processes
+    return zlib.crc32(str(movie_id).encode('utf-8')) % num_shards
+
+
+async def find_movie_card(tmdb_client: AsyncTMDbClient, movie: dict) -> Union[dict, None]:
+    # Movies with a known tmdb id skip the search request
+    if movie.get('tmdb_id'):
+        return await tmdb_client.get_movie_card(movie['tmdb_id'])
+    return await tmdb_client.find_movie_features(movie['title'], movie.get('year'))
+
+
+async def crawl_batch(tmdb_client: AsyncTMDbClient, batch: list, journal: MovieJournal, progress: tqdm) -> int:
+    '''
+    Query a batch of movies concurrently, journaling each movie card as soon as it is found
+
+    Returns
+    -------
+    n_found: int
+        Number of movies found
+    '''
+    # Bound the movies in flight too, so that they complete one after the other
+    # instead of all searches being sent before any details
+    semaphore = asyncio.Semaphore(tmdb_client.concurrency)
+
+    async def crawl_movie(movie: dict) -> bool:
+        async with semaphore:
+            movie_card = await find_movie_card(tmdb_client, movie)
+        progress.update(1)
+        # If response is not null, write to results
+        if movie_card:
+            movie_card['id'] = movie['id']
+            movie_card['query'] = movie['title']
+            journal.append(movie_card)
+        return movie_card is not None
+
+    return sum(await asyncio.gather(*[crawl_movie(movie) for movie in batch]))
+
+
+async def refresh_changed_movies(tmdb_client: AsyncTMDbClient, journal_path: str, since: str, until: str,
+                                 journal: MovieJournal) -> int:
+    '''
+    Fetch again the journaled movies changed on TMDb between two dates, appending their new
+    cards to the journal, which supersede the former ones on compaction
+
+    Returns
+    -------
+    n_refreshed: int
+        Number of movies refreshed
+    '''
+    changed_ids = await tmdb_client.get_changed_movie_ids(since, until)
+    stored = {}
+    for movie in iter_journal(journal_path):
+        if movie.get('tmdb_id') in changed_ids:
+            stored[movie['id']] = movie
+    logger.info(f"{len(changed_ids)} movies changed on TMDb since {since}, {len(stored)} of them crawled")
+    semaphore = asyncio.Semaphore(tmdb_client.concurrency)
+
+    async def refresh_movie(movie: dict) -> bool:
+        async with semaphore:
+            movie_card = await tmdb_client.refresh_movie_card(movie['tmdb_id'])
+        if movie_card:
+            movie_card['id'] = movie['id']
+            movie_card['query'] = movie.get('query')
+            if 'match_strategy' in movie:
+                movie_card['match_strategy'] = movie['match_strategy']
+            journal.append(movie_card)
+        return movie_card is not None
+
+    return sum(await asyncio.gather(*[refresh_movie(movie) for movie in stored.values()]))
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(
         description='Extract relevant movie features from TMDb API based on a list of movie titles')
-    parser.add_argument("-t", "--titles", type=str, required=True,
-        help='A path to a json with movie titles and custom ids [{"id": "2ff8d8f6-bc8d-4b9e-a415-e0d4f87f0c53", "title": "Mission: Impossible 2"}]')
+    parser.add_argument("-t", "--titles", type=str, default=None,
+        help='A path to a json with movie titles and custom ids [{"id": "2ff8d8f6-bc8d-4b9e-a415-e0d4f87f0c53", "title": "Mission: Impossible 2"}]. '
+             'Movies with a known "tmdb_id" are fetched directly, without searching their title, and a "year" helps searching the others.')
     parser.add_argument("-o", "--output", type=str, required=True,
-        help='A path where you would like the results to be saved. In case the file already exists, the script will try to parse it and only send a request for movies not already crawled.')
+        help='A path where you would like the results to be saved, as a json array compacted from the journal at the end of the run.')
+    parser.add_argument("-j", "--journal", type=str, default=None,
+        help='A path to the json lines journal results are appended to as they come, the output path with a .jsonl extension by default. '
+             'In case the journal already exists, only movies not already crawled are requested.')
+    parser.add_argument("--shard", type=int, default=0,
+        help='Index of the slice of titles to crawl, from 0 to --num-shards - 1')
+    parser.add_argument("--num-shards", type=int, default=1,
+        help='Number of slices the titles are partitioned into by a hash of their id, each crawled by its own process '
+             'into its own output. Outputs are then merged with bin/merge_movie_features.py.')
+    parser.add_argument("--refresh", action='store_true',
+        help='Instead of crawling new titles, fetch again the movies changed on TMDb since the last sync')
+    parser.add_argument("--since", type=str, default=None,
+        help='Date from which to look for changes when refreshing, formatted as YYYY-MM-DD. Defaults to the last sync.')
+    parser.add_argument("--compact-only", action='store_true',
+        help='Only compact the journal into the output, without querying TMDb')
+    parser.add_argument("-c", "--concurrency", type=int, default=10,
+        help='Maximum number of concurrent requests to TMDb')
+    parser.add_argument("--batch-size", type=int, default=1000,
+        help='Number of movies queried concurrently, within the concurrency limit')
+    parser.add_argument("--fsync-every", type=int, default=100,
+        help='Number of results appended to the journal between two syncs to disk')
+    parser.add_argument("--api-url", type=str, default=TMDB_API_URL,
+        help='Root url of TMDb API, e.g. the one of a local stub server')
+    parser.add_argument("--cache", type=str, default=TMDB_CACHE_FILEPATH,
+        help='A path to the SQLite cache of TMDb responses')
+    parser.add_argument("--no-cache", action='store_true',
+        help='Always query TMDb, without reading nor filling the cache')
+    parser.add_argument("-r", "--rate", type=float, default=TMDB_RATE_LIMIT,
+        help='Maximum number of requests per second, shared with the other TMDb clients of the host')
+    parser.add_argument("--title-index", type=str, default=TMDB_TITLE_INDEX_FILEPATH,
+        help='A path to the local index of titles already matched, see bin/build_title_index.py. '
+             'Shards save theirs next to it, suffixed with _shard{k}')
+    parser.add_argument("--no-title-index", action='store_true',
+        help='Always search titles on TMDb, without reading nor filling the title index')
 
     args = parser.parse_args()
-    tmdb_client = TMDbClient()
-
-    # Read requested scope
-    scope = read_from_json(args.titles)
-    
-    # See if we already have some data
-    if os.path.isfile(args.output):
-        results = read_from_json(args.output)
-        existing_ids = set([ movie['id'] for movie in results ])
-    else:
-        results = []
-        existing_ids = set()
-
-    # For all movies listed send a request
-    for i, movie in enumerate(tqdm(scope)):
-
-        movie_id = movie['id']
-        if movie_id not in existing_ids:
-            movie_card = tmdb_client.find_movie_features(movie['title'])
-
-            # If response is not null, write to results
-            if movie_card:
-                movie_card['id'] = movie_id
-                movie_card['query'] = movie['title']
-
-                results.append(movie_card)
-
-            # Give some rest to TMDB
-            time.sleep(0.1)
-        
-        if i != 0 and i % 1000 == 0:
-            save_json_file(results, args.output)
-        
-
-
-    
+    if not 0 <= args.shard < args.num_shards:
+        parser.error('--shard must be between 0 and --num-shards - 1')
+    if args.titles is None and not (args.refresh or args.compact_only):
+        parser.error('--titles is required, unless refreshing or compacting')
+    journal_path = args.journal or os.path.splitext(args.output)[0] + '.jsonl'
+    watermark_path = os.path.splitext(args.output)[0] + '.sync.json'
+    run_date = datetime.date.today().isoformat()
+
+    # Results of runs before the journal existed
+    if os.path.isfile(args.output) and not os.path.isfile(journal_path):
+        with MovieJournal(journal_path) as journal:
+            for movie in iter_json_records(args.output):
+                journal.append(movie)
+
+    if args.refresh:
+        since = args.since or load_sync_watermark(watermark_path)
+        if since is None:
+            parser.error(f'No previous sync found in {watermark_path}, give a --since date')
+
+    if not args.compact_only:
+
+        # Each shard saves its own index, merged afterwards with bin/build_title_index.py --indexes
+        title_index = None
+        title_index_path = args.title_index
+        if args.num_shards > 1:
+            title_index_path = get_shard_index_path(args.title_index, args.shard)
+        if not args.no_title_index and not args.refresh:
+            if os.path.isfile(title_index_path):
+                title_index = TitleIndex.load(title_index_path)
+            elif os.path.isfile(args.title_index):
+                title_index = TitleIndex.load(args.title_index)
+            else:
+                title_index = TitleIndex()
+                if os.path.isfile(journal_path):
+                    title_index.add_movie_features(iter_journal(journal_path))
+
+        cache = None if args.no_cache else ResponseCache(args.cache)
+        rate_limiter = TokenBucketRateLimiter(args.rate, path=TMDB_RATE_LIMITER_FILEPATH)
+        tmdb_client = AsyncTMDbClient(base_url=args.api_url, concurrency=args.concurrency, cache=cache,
+                                      rate_limiter=rate_limiter, title_index=title_index)
+
+        if args.refresh:
+            with MovieJournal(journal_path, fsync_every=args.fsync_every) as journal:
+                n_refreshed = asyncio.run(refresh_changed_movies(tmdb_client, journal_path, since, run_date, journal))
+            logger.info(f"Refreshed {n_refreshed} movies")
+        else:
+
+            # Read requested scope
+            scope = read_from_json(args.titles)
+            if args.num_shards > 1:
+                scope = [movie for movie in scope if get_shard(movie['id'], args.num_shards) == args.shard]
+
+            # See if we already have some data
+            existing_ids = read_journal_ids(journal_path)
+
+            # Send requests for all movies not crawled yet, one batch at a time
+            todo = [movie for movie in scope if movie['id'] not in existing_ids]
+            n_found = 0
+            with MovieJournal(journal_path, fsync_every=args.fsync_every) as journal, tqdm(total=len(todo)) as progress:
+                for start in range(0, len(todo), args.batch_size):
+                    batch = todo[start:start + args.batch_size]
+                    n_found += asyncio.run(crawl_batch(tmdb_client, batch, journal, progress))
+                    if title_index is not None and title_index.dirty:
+                        title_index.save(title_index_path)
+
+            logger.info(f"Found {n_found} movies out of {len(todo)} requested")
+            logger.info(f"Search strategies: {dict(tmdb_client.client.strategy_counts)}")
+            if title_index is not None:
+                logger.info(f"Title index: {title_index.hits} titles found locally, {title_index.misses} searched on TMDb")
+
+        tmdb_client.close()
+        if cache is not None:
+            logger.info(f"TMDb cache: {cache.stats()}")
+            cache.close()
+
+        # Movies crawled or refreshed today are up to date with the changes before today.
+        # A first crawl only sets the watermark, so that the next refresh looks for changes since then.
+        if args.refresh or load_sync_watermark(watermark_path) is None:
+            save_sync_watermark(watermark_path, run_date)
+
     # Finally write results to disk
-    save_json_file(results, args.output)
+    if os.path.isfile(journal_path):
+        n_movies = compact_journal(journal_path, args.output)
+        logger.info(f"Compacted {n_movies} movies into {args.output}")
@@ -0,0 +1,48 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import tempfile
+from lib.crawling.movie_features.journal import MovieJournal, compact_journal
+from lib.utils.io import iter_json_records
+from loguru import logger
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Merge the outputs of several bin/get_movie_features.py runs, e.g. one per shard, keeping one movie per id')
+    parser.add_argument("-i", "--inputs", type=str, nargs='+', required=True,
+        help='Paths to movie features json arrays or json lines journals. When an id appears several times, the last one wins.')
+    parser.add_argument("-o", "--output", type=str, required=True,
+        help='A path where the merged json array is saved')
+
+    args = parser.parse_args()
+
+    # Chain the inputs into one journal, which compaction deduplicates by id without loading every movie
+    output_dirpath = os.path.dirname(os.path.abspath(args.output))
+    with tempfile.TemporaryDirectory(dir=output_dirpath) as tmp_dirpath:
+        journal_path = os.path.join(tmp_dirpath, 'merge.jsonl')
+        n_records = 0
+        with MovieJournal(journal_path, fsync_every=10000) as journal:
+            for path in args.inputs:
+                for movie in iter_json_records(path):
+                    journal.append(movie)
+                    n_records += 1
+        n_movies = compact_journal(journal_path, args.output)
+
+    logger.info(f"Merged {n_records} movies from {len(args.inputs)} files into {n_movies} distinct movies")
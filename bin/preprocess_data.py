@@ -14,23 +14,79 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import argparse
+import hashlib
+import json
 import pandas as pd
-from config import TRAINING_DATASET_FILEPATH, ROOT_DIRPATH
-from lib.preprocessing.encode import encode_movie_data
-from lib.utils.io import read_movies_entrees, read_movies_features
-import os
+from config import (BOX_OFFICE_FILEPATH, COLLECTION_STORE_FILEPATH, MOVIE_ENCODER_FILEPATH, MOVIE_FEATURES_FILEPATH,
+                    TRAINING_DATASET_FILEPATH)
+from lib.preprocessing.collection_features import CollectionStore
+from lib.preprocessing.encoder import DATASET_SCHEMA, ENCODING_CONFIG, MovieFeatureEncoder
+from lib.preprocessing.incremental import (combine_hashes, get_movies_to_encode, load_record_hashes,
+                                           read_records_with_hashes, remove_record_hashes, save_record_hashes)
+from lib.utils.io import (MOVIE_ENTREES_DTYPES, MOVIE_FEATURES_DTYPES, get_dataset_cache_key,
+                          get_dataset_cache_key_on_disk, patch_dataset, project_movie_entree, project_movie_features,
+                          read_movies_entrees, read_movies_features, save_dataset)
+from loguru import logger
 
 
-def main():
+def main(incremental: bool = False):
     """This script does the encoding of the features, for the training dataset.
     """
-    df_boxoffice = read_movies_entrees(os.path.join(ROOT_DIRPATH, 'data', 'french-box-office-29nov2020.json'))
-    df_features = read_movies_features(os.path.join(ROOT_DIRPATH, 'data', 'movie-features-29nov2020.json'))
+    # Skip encoding if neither raw data nor encoding configuration changed since last run
+    cache_key = get_dataset_cache_key([BOX_OFFICE_FILEPATH, MOVIE_FEATURES_FILEPATH], ENCODING_CONFIG)
+    if cache_key == get_dataset_cache_key_on_disk(TRAINING_DATASET_FILEPATH):
+        logger.info(f'{TRAINING_DATASET_FILEPATH} is up to date')
+        return
+
+    # Raw records are only hashed for incremental runs
+    if incremental:
+        df_boxoffice, boxoffice_hashes = read_records_with_hashes(
+            BOX_OFFICE_FILEPATH, project_movie_entree, MOVIE_ENTREES_DTYPES)
+        df_features, features_hashes = read_records_with_hashes(
+            MOVIE_FEATURES_FILEPATH, project_movie_features, MOVIE_FEATURES_DTYPES)
+    else:
+        df_boxoffice = read_movies_entrees(BOX_OFFICE_FILEPATH)
+        df_features = read_movies_features(MOVIE_FEATURES_FILEPATH)
     data = pd.merge(df_boxoffice, df_features, on='id')
     data = data.loc[(data['sales'] != 0) & (data['sales'].notna())]
-    data_final_cal = encode_movie_data(data)
-    data_final_cal.to_csv(TRAINING_DATASET_FILEPATH, index=None)
+
+    previous_hashes = None
+    if incremental:
+        hashes = combine_hashes(boxoffice_hashes, features_hashes)
+        hashes = {movie_id: hashes[movie_id] for movie_id in set(data['id'])}
+        encoding_config_key = hashlib.sha256(json.dumps(ENCODING_CONFIG, sort_keys=True).encode('utf-8')).hexdigest()
+        previous_hashes = load_record_hashes(TRAINING_DATASET_FILEPATH, encoding_config_key)
+    if previous_hashes is None:
+        encoder = MovieFeatureEncoder().fit(data)
+        encoder.save(MOVIE_ENCODER_FILEPATH)
+        data_final_cal = encoder.transform_df(data)
+        data_final_cal.insert(0, 'id', data['id'])
+        save_dataset(data_final_cal, TRAINING_DATASET_FILEPATH, DATASET_SCHEMA, cache_key)
+    else:
+        # Only encode new or changed movies, with the frozen encoder
+        encoder = MovieFeatureEncoder.load(MOVIE_ENCODER_FILEPATH)
+        movies_to_encode = data.loc[data['id'].isin(get_movies_to_encode(previous_hashes, hashes))]
+        data_final_cal = encoder.transform_df(movies_to_encode)
+        data_final_cal.insert(0, 'id', movies_to_encode['id'])
+        patch_dataset(TRAINING_DATASET_FILEPATH, data_final_cal, data['id'].to_numpy(), DATASET_SCHEMA, cache_key)
+    if incremental:
+        save_record_hashes(TRAINING_DATASET_FILEPATH, hashes, encoding_config_key)
+    else:
+        remove_record_hashes(TRAINING_DATASET_FILEPATH)
+
+    # Keep the state of collections to compute collection features of new movies
+    collection_store = CollectionStore()
+    collection_store.get_and_update_features(data)
+    collection_store.save(COLLECTION_STORE_FILEPATH)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description='Encode the features of the training dataset')
+    parser.add_argument("--incremental", action='store_true',
+        help='Only encode movies that are new or changed since the last run, '
+             'then patch the processed dataset. Falls back to a full run when there is no previous run.')
+
+    args = parser.parse_args()
+    main(incremental=args.incremental)
@@ -19,8 +19,21 @@ from lib.utils.path import get_project_root
 
 # Paths
 ROOT_DIRPATH = get_project_root()
-TRAINING_DATASET_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "processed_dataset.csv")
+BOX_OFFICE_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "french-box-office-29nov2020.json")
+MOVIE_FEATURES_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "movie-features-29nov2020.json")
+TRAINING_DATASET_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "processed_dataset")
 LGBM_MODEL_FILEPATH = os.path.join(ROOT_DIRPATH, "models", "light_gbm_model.txt")
+MOVIE_ENCODER_FILEPATH = os.path.join(ROOT_DIRPATH, "models", "movie_feature_encoder.json")
+COLLECTION_STORE_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "collection_store.json")
+CALENDAR_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "calendar_features_{start_year}_{end_year}.npy")
+TMDB_CACHE_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "tmdb_cache.sqlite")
+TMDB_TITLE_INDEX_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "tmdb_title_index.json")
+TMDB_RATE_LIMITER_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "tmdb_rate_limiter.sqlite")
+CAST_TABLE_FILEPATH = os.path.join(ROOT_DIRPATH, 'data', "cast_table.npz")
+
+# TMDb API
+TMDB_RATE_LIMIT = 40  # Requests per second, shared by all the clients of the host
+TMDB_MAX_RETRIES = 5  # Retries of a request answered with a 429 or 5xx status
 
 # Training
 BEST_K_FEATURES = 36  # K best features sorted by feature importance
@@ -106,6 +119,17 @@ DICT_GENRES = {
     "Documentaire": "Other",
     "Téléfilm": "Other",
 }
+CALENDAR_START_YEAR = 2000  # Calendar features are precomputed for every day of this range of years,
+CALENDAR_END_YEAR = 2030  # including future years for inference
+CALENDAR_COLS = [
+    "vacances_zone_a",
+    "vacances_zone_b",
+    "vacances_zone_c",
+    "jour_ferie",
+    "holiday",
+    "month",
+    "cos_month",
+]
 BUDGET_MEDIAN = 25000000.0
 RUNTIME_MEAN = 101.67367174781708
 
@@ -0,0 +1,132 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import time
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from boxoffice.spiders.jpbox import JpboxSpider
+from boxoffice.tables import extract_ranking_rows, extract_sales_rows
+from loguru import logger
+
+# Synthetic pages reproducing the jpbox markup the spider relies on (a 100 rows ranking
+# and a movie page), not captured ones: replace them with pages recorded in an HTTP archive
+FIXTURES_DIRPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURES = {
+    'parse': ('charts_france_2019.html', 'http://jpbox-office.com/charts_france.php?variable=2019', {'year': 2019}),
+    'parse_movie_page': ('fichfilm_17007.html', 'http://jpbox-office.com/fichfilm.php?id=17007&view=2', {'movie_card': {'id': '17007'}}),
+}
+
+
+def load_fixture(callback: str) -> HtmlResponse:
+    '''
+    Build the response of a saved page
+
+    Parameters
+    ----------
+    callback: str
+        spider callback parsing the page, parse or parse_movie_page
+
+    Returns
+    -------
+    response: HtmlResponse
+        The response, with the meta the callback expects
+    '''
+    filename, url, meta = FIXTURES[callback]
+    with open(os.path.join(FIXTURES_DIRPATH, filename), 'rb') as f:
+        body = f.read()
+    return HtmlResponse(url=url, body=body, encoding='utf-8', request=Request(url, meta=meta))
+
+
+def legacy_parse_rows(response) -> list:
+    '''
+    Former ranking rows extraction, with four relative XPath queries per row
+    '''
+    rows = response.xpath('//table[@class="tablesmall tablesmall5"]/tr')
+    results = []
+    for row in rows:
+        rank = row.xpath('td[@class="col_poster_compteur "]/div/text()').get()
+        sales = row.xpath('td[@class="col_poster_contenu_majeur "]/text()').get()
+        title = row.xpath('td[@class="col_poster_titre "]/h3/a/text()').get()
+        movie_page_url = row.xpath('td[@class="col_poster_titre "]/h3/a/@href').get()
+        if rank and title and sales and movie_page_url:
+            results.append((rank, title, sales, movie_page_url))
+    return results
+
+
+def legacy_parse_movie_page(response) -> list:
+    '''
+    Former movie page sales extraction, with two relative XPath queries per row
+    '''
+    rows = response.xpath('//table[@class="tablesmall tablesmall2"]/tr')
+    return [
+        (row.xpath('td[@class="col_poster_titre"]//text()').get(), row.xpath('td[@class="col_poster_contenu_majeur"]/text()').get())
+        for row in rows]
+
+
+def parse_rows(response) -> list:
+    '''
+    Ranking rows extraction of the spider, walking the table once
+    '''
+    return [row for row in extract_ranking_rows(response.selector.root) if all(row)]
+
+
+def parse_movie_page(response) -> list:
+    '''
+    Movie page sales extraction of the spider, walking the table once
+    '''
+    return list(extract_sales_rows(response.selector.root))
+
+
+def time_callback(callback, response, n_runs: int) -> float:
+    '''
+    Time a callback on a response, parsing the html again on each run as the spider would
+
+    Returns
+    -------
+    pages_per_sec: float
+        The parsing throughput
+    '''
+    start = time.perf_counter()
+    for _ in range(n_runs):
+        fresh_response = response.replace(body=response.body)
+        for _ in callback(fresh_response) or []:
+            pass
+    return n_runs / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measure the jpbox spider parsing throughput on fixture pages')
+    parser.add_argument('-n', '--n_runs', type=int, default=200, help='Number of times each page is parsed')
+    args = parser.parse_args()
+
+    spider = JpboxSpider.from_crawler(get_crawler(JpboxSpider))
+    extractions = {
+        'parse': (legacy_parse_rows, parse_rows),
+        'parse_movie_page': (legacy_parse_movie_page, parse_movie_page),
+    }
+
+    for callback_name, (legacy_extraction, extraction) in extractions.items():
+        response = load_fixture(callback_name)
+        callback = getattr(spider, callback_name)
+        n_rows = len(extraction(response))
+        if n_rows != len(legacy_extraction(response)):
+            logger.warning(f'{callback_name}: the legacy and current extractions disagree on the number of rows')
+        for name, function in [('legacy extraction', legacy_extraction), ('extraction', extraction), ('spider callback', callback)]:
+            pages_per_sec = time_callback(function, response, args.n_runs)
+            logger.info(f'{callback_name} ({n_rows} rows) - {name}: {pages_per_sec:.0f} pages/s, {1000/pages_per_sec:.2f} ms/page')
@@ -0,0 +1,141 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+from typing import Optional
+from w3lib.url import canonicalize_url
+
+
+def get_request_key(method: str, url: str, body: bytes = b'') -> str:
+    '''
+    Key of a request in an archive, stable across crawls and scrapy versions
+
+    Parameters
+    ----------
+    method: str
+        http method
+    url: str
+        requested url, canonicalized so that query parameters order does not matter
+    body: bytes, default b''
+        request body
+
+    Returns
+    -------
+    key: str
+        sha1 hex digest
+    '''
+    key = hashlib.sha1()
+    key.update(method.upper().encode('utf-8'))
+    key.update(canonicalize_url(url).encode('utf-8'))
+    key.update(body or b'')
+    return key.hexdigest()
+
+
+class HttpArchive:
+
+    def __init__(self, path: str, mode: str = 'r'):
+        '''
+        Responses stored in a zip file, compressed one by one, so that a single
+        response can be read without decompressing the whole archive
+
+        Each response is stored as two entries: `<key>.json` with its url, status
+        and headers, and `<key>.body` with its raw body.
+
+        Responses are added to a copy of the archive, which replaces it on `close`,
+        as a zip file is unreadable until its central directory is written. A crawl
+        killed while recording keeps the archive of the previous crawls.
+
+        Parameters
+        ----------
+        path: str
+            path to the archive
+        mode: str, default 'r'
+            'r' to read responses, 'a' to add responses to a new or existing archive
+        '''
+        self.path = path
+        self.writing_path = path
+        if mode == 'a':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.writing_path = f'{path}.tmp'
+            if os.path.isfile(path):
+                shutil.copyfile(path, self.writing_path)
+            elif os.path.isfile(self.writing_path):
+                os.remove(self.writing_path)
+        self.zip = zipfile.ZipFile(self.writing_path, mode, compression=zipfile.ZIP_DEFLATED)
+        self.keys = {name[:-len('.json')] for name in self.zip.namelist() if name.endswith('.json')}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def add(self, key: str, url: str, status: int, headers: dict, body: bytes) -> bool:
+        '''
+        Store a response, unless one is already stored for this key
+
+        Parameters
+        ----------
+        key: str
+            request key, see `get_request_key`
+        url: str
+            response url
+        status: int
+            http status
+        headers: dict
+            response headers, each name mapped to its list of values
+        body: bytes
+            raw response body
+
+        Returns
+        -------
+        is_added: bool
+            Whether the response was stored
+        '''
+        if key in self.keys:
+            return False
+        self.zip.writestr(f'{key}.body', body)
+        self.zip.writestr(f'{key}.json', json.dumps({'url': url, 'status': status, 'headers': headers}))
+        self.keys.add(key)
+        return True
+
+    def get(self, key: str) -> Optional[tuple]:
+        '''
+        Read a stored response
+
+        Parameters
+        ----------
+        key: str
+            request key, see `get_request_key`
+
+        Returns
+        -------
+        response: Optional[tuple]
+            The url, status, headers and body of the response, None if it is not stored
+        '''
+        if key not in self.keys:
+            return None
+        meta = json.loads(self.zip.read(f'{key}.json'))
+        return meta['url'], meta['status'], meta['headers'], self.zip.read(f'{key}.body')
+
+    def close(self) -> None:
+        self.zip.close()
+        if self.writing_path != self.path:
+            os.replace(self.writing_path, self.path)
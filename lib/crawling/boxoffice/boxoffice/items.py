@@ -3,10 +3,20 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+import datetime
 import scrapy
 
 
 class BoxofficeItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+    # Fields yielded by the jpbox spider, with the type the pipeline casts them to
+    id = scrapy.Field(type=str, required=True)
+    year = scrapy.Field(type=int, required=True)
+    title = scrapy.Field(type=str, required=True)
+    rank = scrapy.Field(type=int)
+    total_sales = scrapy.Field(type=int)
+    release_date = scrapy.Field(type=datetime.date)
+    first_day_sales = scrapy.Field(type=int)
+    first_weekend_sales = scrapy.Field(type=int)
+    first_week_sales = scrapy.Field(type=int)
+    first_screening_sales = scrapy.Field(type=int)
+    max_theaters_used = scrapy.Field(type=int)
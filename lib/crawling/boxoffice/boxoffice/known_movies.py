@@ -0,0 +1,138 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import os
+from boxoffice.partitions import iter_partitions
+from typing import Iterator, Optional
+
+# Opening figures of a movie page, see `JpboxSpider.field_renames`. The first screening
+# figure is not always published, so it does not make a movie incomplete.
+SALES_FIELDS = ['first_day_sales', 'first_weekend_sales', 'first_week_sales']
+
+
+def iter_box_office_records(path: str) -> Iterator[dict]:
+    '''
+    Iterate over the movies of a box office dump, either a json array
+    as written by `scrapy crawl -o file.json`, json lines or a dataset
+    partitioned by `BoxofficePipeline`
+
+    Parameters
+    ----------
+    path: str
+        path to the dump
+
+    Returns
+    -------
+    movies: Iterator[dict]
+        The movies, one at a time
+    '''
+    if os.path.isdir(path):
+        yield from iter_partitions(path)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        first_char = f.read(1)
+        f.seek(0)
+        if first_char == '[':
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class KnownMovies:
+
+    def __init__(self, refresh_weeks: int = 8, today: Optional[datetime.date] = None):
+        '''
+        Movies already crawled, by jpbox id, so that the spider only requests
+        the pages of new movies, of movies with missing figures and of recent
+        releases whose figures can still change
+
+        Parameters
+        ----------
+        refresh_weeks: int, default 8
+            Movies released less than this many weeks ago are crawled again
+        today: Optional[datetime.date], default None
+            Reference date of recent releases, today if None
+        '''
+        self.refresh_weeks = refresh_weeks
+        self.today = today or datetime.date.today()
+        self.movies = {}
+
+    def __len__(self) -> int:
+        return len(self.movies)
+
+    def __contains__(self, jpbox_id: str) -> bool:
+        return jpbox_id in self.movies
+
+    def add(self, movie: dict) -> None:
+        self.movies[str(movie['id'])] = movie
+
+    @classmethod
+    def from_dumps(cls, paths: list, refresh_weeks: int = 8) -> 'KnownMovies':
+        '''
+        Load known movies from box office dumps. When a movie appears several
+        times, the last one wins.
+
+        Parameters
+        ----------
+        paths: list
+            paths to the dumps, missing ones are ignored
+        refresh_weeks: int, default 8
+            see `KnownMovies`
+
+        Returns
+        -------
+        known_movies: KnownMovies
+            The known movies
+        '''
+        known_movies = cls(refresh_weeks)
+        for path in paths:
+            if os.path.exists(path):
+                for movie in iter_box_office_records(path):
+                    known_movies.add(movie)
+        return known_movies
+
+    def is_complete(self, movie: dict) -> bool:
+        return bool(movie.get('release_date')) and all(movie.get(field) is not None for field in SALES_FIELDS)
+
+    def is_recent(self, movie: dict) -> bool:
+        try:
+            release_date = datetime.date.fromisoformat(movie['release_date'])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return (self.today - release_date).days < 7 * self.refresh_weeks
+
+    def get_up_to_date(self, jpbox_id: str) -> Optional[dict]:
+        '''
+        A known movie whose page does not need to be crawled again
+
+        Parameters
+        ----------
+        jpbox_id: str
+            the jpbox id of the movie
+
+        Returns
+        -------
+        movie: Optional[dict]
+            The known movie, None if unknown, with missing figures or recently released
+        '''
+        movie = self.movies.get(jpbox_id)
+        if movie is None or not self.is_complete(movie) or self.is_recent(movie):
+            return None
+        return movie
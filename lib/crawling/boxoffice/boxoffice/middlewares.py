@@ -3,7 +3,14 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+import time
+from boxoffice.http_archive import HttpArchive, get_request_key
+from boxoffice.telemetry import CrawlTelemetry
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
@@ -101,3 +108,117 @@ class BoxofficeDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class HttpArchiveDownloaderMiddleware:
+    # Records every downloaded response to a compressed archive when
+    # HTTP_ARCHIVE_MODE is 'record', and serves the crawl from it without
+    # any network access nor download delay when it is 'replay'.
+    # Disabled when HTTP_ARCHIVE_MODE is not set.
+
+    def __init__(self, path, mode, stats):
+        self.path = path
+        self.mode = mode
+        self.stats = stats
+        self.archive = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mode = crawler.settings.get('HTTP_ARCHIVE_MODE')
+        if not mode:
+            raise NotConfigured('HTTP_ARCHIVE_MODE is not set')
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"HTTP_ARCHIVE_MODE must be 'record' or 'replay', not {mode!r}")
+        path = crawler.settings.get('HTTP_ARCHIVE_FILEPATH')
+        if mode == 'replay' and not os.path.isfile(path):
+            raise FileNotFoundError(f'No HTTP archive to replay at {path}, record one with HTTP_ARCHIVE_MODE=record')
+        s = cls(path, mode, crawler.stats)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_request(self, request, spider):
+        if self.mode != 'replay':
+            return None
+        stored = self.archive.get(get_request_key(request.method, request.url, request.body))
+        if stored is None:
+            self.stats.inc_value('http_archive/misses')
+            raise IgnoreRequest(f'{request.url} is not in {self.path}')
+        url, status, headers, body = stored
+        self.stats.inc_value('http_archive/hits')
+        headers = Headers(headers)
+        response_class = responsetypes.from_args(headers=headers, url=url, body=body)
+        return response_class(url=url, status=status, headers=headers, body=body, request=request, flags=['replayed'])
+
+    def process_response(self, request, response, spider):
+        if self.mode == 'record':
+            headers = {
+                name.decode('latin1'): [value.decode('latin1') for value in values]
+                for name, values in response.headers.items()
+            }
+            key = get_request_key(request.method, request.url, request.body)
+            if self.archive.add(key, response.url, response.status, headers, response.body):
+                self.stats.inc_value('http_archive/recorded')
+        return response
+
+    def spider_opened(self, spider):
+        self.archive = HttpArchive(self.path, 'a' if self.mode == 'record' else 'r')
+        if self.mode == 'replay':
+            # Responses come from disk, politeness delay is pointless
+            spider.download_delay = 0
+        spider.logger.info(f'HTTP archive {self.path} opened to {self.mode}, {len(self.archive)} responses stored')
+
+    def spider_closed(self, spider):
+        self.archive.close()
+
+
+class CallbackTimingSpiderMiddleware:
+    # Times the spider callbacks, including the iteration of their
+    # generators, and reports it to the CrawlTelemetry extension.
+    # Must be the closest middleware to the spider, so that other
+    # middlewares are not timed. Disabled with the extension.
+
+    def __init__(self, telemetry):
+        self.telemetry = telemetry
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        telemetry = next((extension for extension in crawler.extensions.middlewares if isinstance(extension, CrawlTelemetry)), None)
+        if telemetry is None:
+            raise NotConfigured('CrawlTelemetry extension is not enabled')
+        return cls(telemetry)
+
+    def process_spider_output(self, response, result, spider):
+        elapsed = 0.
+        iterator = iter(result)
+        while True:
+            start = time.perf_counter()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            yield output
+        self.observe(response, spider, elapsed)
+
+    async def process_spider_output_async(self, response, result, spider):
+        # Used instead of process_spider_output by Scrapy >= 2.7 for asynchronous spider output
+        elapsed = 0.
+        iterator = result.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                output = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            yield output
+        self.observe(response, spider, elapsed)
+
+    def observe(self, response, spider, elapsed):
+        # Start requests have no response
+        if response is not None:
+            callback = response.request.callback or spider.parse
+            self.telemetry.observe_callback(callback.__name__, elapsed)
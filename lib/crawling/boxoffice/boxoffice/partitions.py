@@ -0,0 +1,213 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import os
+from typing import Iterator, Optional
+
+INDEX_FILENAME = 'index.json'
+
+
+def get_partition_path(dirpath: str, year: int) -> str:
+    return os.path.join(dirpath, f'{year}.jsonl')
+
+
+def load_index(dirpath: str) -> dict:
+    '''
+    Load the index of a partitioned box office dataset
+
+    Parameters
+    ----------
+    dirpath: str
+        path to the dataset directory
+
+    Returns
+    -------
+    index: dict
+        'movies' maps each jpbox id to the year and byte offset of its latest record,
+        'sizes' the size of each partition when the last crawl ended and
+        'crawls' the partitions offsets each crawl started writing at.
+        Empty if the dataset does not exist yet.
+    '''
+    path = os.path.join(dirpath, INDEX_FILENAME)
+    if not os.path.isfile(path):
+        return {'movies': {}, 'sizes': {}, 'crawls': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_index(dirpath: str, index: dict) -> None:
+    path = os.path.join(dirpath, INDEX_FILENAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+class PartitionedJsonLines:
+
+    def __init__(self, dirpath: str):
+        '''
+        Box office dataset written as one json lines file per year, with an index
+        of the latest record of each movie, so that a year, a movie or the latest
+        crawl can be read without parsing the whole dataset.
+
+        Records of a movie crawled again are appended, if they changed, and the index
+        points to the new one. Lines written after the last saved index, by an interrupted crawl,
+        are discarded when the dataset is opened again.
+
+        Parameters
+        ----------
+        dirpath: str
+            path to the dataset directory, created if needed
+        '''
+        self.dirpath = dirpath
+        self.index = None
+        self.files = {}
+        self.crawl_offsets = {}
+
+    def open(self) -> None:
+        os.makedirs(self.dirpath, exist_ok=True)
+        self.index = load_index(self.dirpath)
+        # Partitions not in the index were only written by an interrupted crawl
+        for filename in os.listdir(self.dirpath):
+            if filename.endswith('.jsonl'):
+                path = os.path.join(self.dirpath, filename)
+                size = self.index['sizes'].get(filename[:-len('.jsonl')], 0)
+                if os.path.getsize(path) > size:
+                    with open(path, 'r+b') as f:
+                        f.truncate(size)
+        self.crawl_offsets = {}
+
+    def append(self, record: dict) -> bool:
+        '''
+        Append a record to its year partition, unless it is already stored as is
+
+        Parameters
+        ----------
+        record: dict
+            box office record, with str id and int year
+
+        Returns
+        -------
+        is_appended: bool
+            Whether the record is new or changed
+        '''
+        if self.get(record['id']) == record:
+            return False
+        year = str(record['year'])
+        if year not in self.files:
+            path = get_partition_path(self.dirpath, year)
+            self.files[year] = open(path, 'ab')
+            self.crawl_offsets[year] = self.files[year].tell()
+        f = self.files[year]
+        offset = f.tell()
+        f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.index['movies'][str(record['id'])] = [year, offset]
+        return True
+
+    def get(self, jpbox_id: str) -> Optional[dict]:
+        '''
+        Latest record of a movie, None if it is unknown
+        '''
+        location = self.index['movies'].get(str(jpbox_id))
+        # Records of this crawl may still be buffered
+        if location is not None and location[0] in self.files:
+            self.files[location[0]].flush()
+        return get_movie(self.dirpath, jpbox_id, self.index)
+
+    def close(self) -> None:
+        for year, f in self.files.items():
+            f.flush()
+            os.fsync(f.fileno())
+            self.index['sizes'][year] = f.tell()
+            f.close()
+        self.files = {}
+        # Crawls that changed nothing are recorded too, so that their delta is empty
+        self.index['crawls'].append({
+            'finished_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'offsets': self.crawl_offsets
+        })
+        save_index(self.dirpath, self.index)
+
+
+def iter_partitions(dirpath: str, years: Optional[list] = None, latest_crawl: bool = False) -> Iterator[dict]:
+    '''
+    Iterate over the latest record of each movie of a partitioned box office dataset
+
+    Parameters
+    ----------
+    dirpath: str
+        path to the dataset directory
+    years: Optional[list], default None
+        years to read, all of them if None
+    latest_crawl: bool, default False
+        only read the records written by the latest crawl
+
+    Returns
+    -------
+    records: Iterator[dict]
+        The records, one at a time, year by year
+    '''
+    index = load_index(dirpath)
+    if latest_crawl:
+        offsets = index['crawls'][-1]['offsets'] if index['crawls'] else {}
+    else:
+        offsets = {year: 0 for year in index['sizes']}
+    if years is not None:
+        offsets = {year: offset for year, offset in offsets.items() if int(year) in {int(y) for y in years}}
+    movies = index['movies']
+
+    for year in sorted(offsets):
+        with open(get_partition_path(dirpath, year), 'rb') as f:
+            f.seek(offsets[year])
+            offset = offsets[year]
+            end = index['sizes'][year]
+            while offset < end:
+                line = f.readline()
+                record = json.loads(line)
+                # Older records of movies crawled again are superseded
+                if movies.get(str(record['id'])) == [year, offset]:
+                    yield record
+                offset += len(line)
+
+
+def get_movie(dirpath: str, jpbox_id: str, index: Optional[dict] = None) -> Optional[dict]:
+    '''
+    Read the latest record of a movie with a single seek
+
+    Parameters
+    ----------
+    dirpath: str
+        path to the dataset directory
+    jpbox_id: str
+        jpbox id of the movie
+    index: Optional[dict], default None
+        index of the dataset, loaded from disk if None
+
+    Returns
+    -------
+    record: Optional[dict]
+        The record, None if the movie is unknown
+    '''
+    index = index if index is not None else load_index(dirpath)
+    location = index['movies'].get(str(jpbox_id))
+    if location is None:
+        return None
+    year, offset = location
+    with open(get_partition_path(dirpath, year), 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.readline())
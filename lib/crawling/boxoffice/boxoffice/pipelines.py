@@ -3,11 +3,80 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
-
-# useful for handling different item types with a single interface
+import datetime
+from boxoffice.items import BoxofficeItem
+from boxoffice.partitions import PartitionedJsonLines
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+
+
+def cast_value(value, field_type):
+    '''
+    Cast a scraped value, None if it cannot be cast.
+    Dates are kept as iso formatted strings once validated.
+    '''
+    if value is None:
+        return None
+    try:
+        if field_type is datetime.date:
+            return datetime.date.fromisoformat(str(value)).isoformat()
+        return field_type(value)
+    except (TypeError, ValueError):
+        return None
 
 
 class BoxofficePipeline:
+
+    def __init__(self, dirpath: str):
+        '''
+        Deduplicate movies by jpbox id, cast their fields once and write them
+        to a dataset partitioned by year as they are scraped
+
+        Parameters
+        ----------
+        dirpath: str
+            path to the partitioned dataset, see `PartitionedJsonLines`
+        '''
+        self.partitions = PartitionedJsonLines(dirpath)
+        self.kept_years = {}  # jpbox id -> year of the ranking kept during this crawl
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dirpath = crawler.settings.get('BOXOFFICE_PARTITIONS_DIRPATH')
+        if not dirpath:
+            raise NotConfigured('BOXOFFICE_PARTITIONS_DIRPATH is not set')
+        pipeline = cls(dirpath)
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def open_spider(self, spider):
+        self.partitions.open()
+
+    def close_spider(self, spider):
+        self.partitions.close()
+
     def process_item(self, item, spider):
-        return item
+        adapter = ItemAdapter(item)
+        record = {}
+        for name, field in BoxofficeItem.fields.items():
+            value = cast_value(adapter.get(name), field['type'])
+            if value is None and field.get('required'):
+                self.stats.inc_value('boxoffice/invalid_items')
+                raise DropItem(f'Invalid {name} {adapter.get(name)!r} for movie {adapter.get("title")!r}')
+            record[name] = value
+
+        # A movie can be ranked in several years, the earliest ranking is kept whatever the
+        # order of the responses, replacing a later one kept before
+        kept_year = self.kept_years.get(record['id'])
+        if kept_year is None:
+            # Compare with the previous crawls, whose earlier ranking should be scraped again
+            stored = self.partitions.get(record['id'])
+            kept_year = stored['year'] if stored is not None and stored['year'] < record['year'] else None
+        if kept_year is not None and kept_year <= record['year']:
+            self.stats.inc_value('boxoffice/duplicate_items')
+            raise DropItem(f'Movie {record["id"]} already kept with its {kept_year} ranking')
+        self.kept_years[record['id']] = record['year']
+
+        if not self.partitions.append(record):
+            self.stats.inc_value('boxoffice/unchanged_items')
+        return record
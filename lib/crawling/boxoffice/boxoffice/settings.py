@@ -7,6 +7,8 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 BOT_NAME = 'boxoffice'
 
 SPIDER_MODULES = ['boxoffice.spiders']
@@ -44,27 +46,47 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
+SPIDER_MIDDLEWARES = {
 #    'boxoffice.middlewares.BoxofficeSpiderMiddleware': 543,
-#}
+    # Closest to the spider, so that only callbacks are timed
+    'boxoffice.middlewares.CallbackTimingSpiderMiddleware': 950,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
+DOWNLOADER_MIDDLEWARES = {
 #    'boxoffice.middlewares.BoxofficeDownloaderMiddleware': 543,
-#}
+    # Close to the downloader, so that raw responses are recorded and replayed
+    'boxoffice.middlewares.HttpArchiveDownloaderMiddleware': 950,
+}
+
+# Record responses with -s HTTP_ARCHIVE_MODE=record, replay them with -s HTTP_ARCHIVE_MODE=replay
+HTTP_ARCHIVE_MODE = None
+HTTP_ARCHIVE_FILEPATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '..', 'data', 'jpbox-http-archive.zip')
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
+EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+    'boxoffice.telemetry.CrawlTelemetry': 500,
+}
+
+# Crawl telemetry snapshots, every TELEMETRY_INTERVAL seconds, and final summary
+TELEMETRY_ENABLED = True
+TELEMETRY_INTERVAL = 60
+TELEMETRY_FILEPATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '..', 'data', 'jpbox-telemetry.jsonl')
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    'boxoffice.pipelines.BoxofficePipeline': 300,
-#}
+ITEM_PIPELINES = {
+    'boxoffice.pipelines.BoxofficePipeline': 300,
+}
+
+# Movies are written by year to this directory, see boxoffice.partitions
+BOXOFFICE_PARTITIONS_DIRPATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '..', 'data', 'french-box-office')
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
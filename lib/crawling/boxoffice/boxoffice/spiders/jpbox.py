@@ -17,6 +17,8 @@
 import scrapy
 from typing import Optional
 from urllib.parse import urljoin, urlparse, parse_qs
+from boxoffice.known_movies import KnownMovies
+from boxoffice.tables import extract_ranking_rows, extract_sales_rows
 
 
 class JpboxSpider(scrapy.Spider):
@@ -31,9 +33,23 @@ class JpboxSpider(scrapy.Spider):
         'Combinaison max.': 'max_theaters_used'
     }
 
-    def __init__(self, start_year:int=2015, end_year:int=2020, **kwargs):
+    def __init__(self, start_year:int=2015, end_year:int=2020, known:Optional[str]=None, refresh_weeks:int=8, **kwargs):
+        '''
+        Parameters
+        ----------
+        start_year: int, default 2015
+            First year of the french rankings to crawl
+        end_year: int, default 2020
+            Last year of the french rankings to crawl
+        known: Optional[str], default None
+            Comma separated paths to previous box office dumps. Their movies with a release date
+            and opening figures are merged with the fresh ranking data instead of crawling their page again.
+        refresh_weeks: int, default 8
+            Known movies released less than this many weeks ago are crawled again
+        '''
         self.start_year = int(start_year)
         self.end_year = int(end_year)
+        self.known_movies = KnownMovies.from_dumps(known.split(',') if known else [], int(refresh_weeks))
         super().__init__(**kwargs)
 
     def start_requests(self):
@@ -54,18 +70,17 @@ class JpboxSpider(scrapy.Spider):
         
         # Extract ranked rows
         year = response.meta['year']
-        rows = response.xpath('//table[@class="tablesmall tablesmall5"]/tr')
+        n_rows = 0
 
-        # Parse rows
-        for row in rows:
+        # Parse rows, walking the ranking table once
+        for rank, title, sales, movie_page_url in extract_ranking_rows(response.selector.root):
+            n_rows += 1
 
-            # Mind the extra whitespace in tags
-            rank = row.xpath('td[@class="col_poster_compteur "]/div/text()').get()
-            sales = row.xpath('td[@class="col_poster_contenu_majeur "]/text()').get()
-            title = row.xpath('td[@class="col_poster_titre "]/h3/a/text()').get()
-            movie_page_url = row.xpath('td[@class="col_poster_titre "]/h3/a/@href').get()
+            if not (rank and title and sales and movie_page_url):
+                self.crawler.stats.inc_value('jpbox/dropped_rows')
+                self.logger.warning(f'Dropped a ranking row of {response.url}, markup may have changed')
 
-            if rank and title and sales and movie_page_url:
+            else:
 
                 self.log(f'Found a new movie!')
 
@@ -80,8 +95,14 @@ class JpboxSpider(scrapy.Spider):
                     'id': jpbox_id
                 }
 
+                # Known movies whose figures can no longer change are merged with the fresh ranking data
+                known_movie = self.known_movies.get_up_to_date(jpbox_id)
+                if known_movie:
+                    self.crawler.stats.inc_value('jpbox/known_movies_merged')
+                    yield {**known_movie, **movie_card}
+
                 # If the movie has its own webpage, go extract further info, else return
-                if movie_page_url:
+                elif movie_page_url:
                     yield scrapy.Request(
                         url=movie_page_url, 
                         callback=self.parse_movie_page, 
@@ -89,6 +110,9 @@ class JpboxSpider(scrapy.Spider):
                 else:
                     yield movie_card
 
+        if n_rows == 0:
+            self.logger.warning(f'No ranking row found in {response.url}, markup may have changed')
+
         # Get pagination choices at the page bottom 
         pagination_options = response.xpath('//div[@class="pagination"]/a')
 
@@ -134,7 +158,7 @@ class JpboxSpider(scrapy.Spider):
 
         Parameters
         ----------
-        number_as_str: str
+        number_as_str: Optional[str]
             Value you'd like to cast into Int
 
         Returns
@@ -142,6 +166,8 @@ class JpboxSpider(scrapy.Spider):
         value: Optional[int]
             Int if cast was successful
         '''
+        if number_as_str is None:
+            return None
         value = number_as_str.replace(' ', '')
         try:
             value = int(value)
@@ -163,12 +189,7 @@ class JpboxSpider(scrapy.Spider):
         movie_card['release_date'] = self.extract_data_from_url(release_date_url, 'date')
 
         # Sales
-        rows = response.xpath('//table[@class="tablesmall tablesmall2"]/tr')
-        for row in rows:
-
-            # Decompose rows
-            field = row.xpath('td[@class="col_poster_titre"]//text()').get()
-            value = row.xpath('td[@class="col_poster_contenu_majeur"]/text()').get()
+        for field, value in extract_sales_rows(response.selector.root):
 
             # Add to results
             if field in self.field_renames.keys():
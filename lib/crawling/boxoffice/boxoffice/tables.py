@@ -0,0 +1,172 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from lxml import etree
+from typing import Iterator, Optional
+
+# Compiled once, class names are matched token-wise so that extra whitespace in the markup does not matter
+TABLES_XPATH = etree.XPath(
+    '//table[contains(concat(" ", normalize-space(@class), " "), concat(" ", $table_class, " "))]')
+
+
+def iter_table_rows(root, table_class: str) -> Iterator[dict]:
+    '''
+    Walk the rows of the tables with a given class once, indexing each row cells
+    by their whitespace-stripped class
+
+    Parameters
+    ----------
+    root: lxml.html.HtmlElement
+        root of the parsed page, e.g. `response.selector.root`
+    table_class: str
+        class of the tables, e.g. tablesmall5
+
+    Returns
+    -------
+    rows: Iterator[dict]
+        The cells of each row, by class. Rows without any classed cell (headers) are skipped.
+    '''
+    for table in TABLES_XPATH(root, table_class=table_class):
+        for row in table.iterchildren('tr'):
+            cells = {}
+            for cell in row.iterchildren('td'):
+                cell_class = cell.get('class')
+                if cell_class:
+                    cells.setdefault(cell_class.strip(), cell)
+            if cells:
+                yield cells
+
+
+def get_text(cell, *path: str) -> Optional[str]:
+    '''
+    Get the first non blank direct text of the element reached by following
+    the first child with each tag of path
+
+    Parameters
+    ----------
+    cell: lxml.html.HtmlElement
+        starting element
+    path: str
+        tags of the children to follow, e.g. 'h3', 'a'
+
+    Returns
+    -------
+    text: Optional[str]
+        The stripped text, None if an element or the text is missing
+    '''
+    element = get_descendant(cell, *path)
+    if element is None:
+        return None
+    texts = [element.text] + [child.tail for child in element]
+    for text in texts:
+        if text and text.strip():
+            return text.strip()
+    return None
+
+
+def get_first_text(cell) -> Optional[str]:
+    '''
+    Get the first non blank text node anywhere below cell, like `.//text()`
+
+    Parameters
+    ----------
+    cell: lxml.html.HtmlElement
+        starting element
+
+    Returns
+    -------
+    text: Optional[str]
+        The stripped text, None if there is no text
+    '''
+    if cell is None:
+        return None
+    for text in cell.itertext():
+        if text.strip():
+            return text.strip()
+    return None
+
+
+def get_attribute(cell, attribute: str, *path: str) -> Optional[str]:
+    '''
+    Get an attribute of the element reached by following the first child with each tag of path
+
+    Parameters
+    ----------
+    cell: lxml.html.HtmlElement
+        starting element
+    attribute: str
+        name of the attribute, e.g. href
+    path: str
+        tags of the children to follow
+
+    Returns
+    -------
+    value: Optional[str]
+        The attribute value, None if an element or the attribute is missing
+    '''
+    element = get_descendant(cell, *path)
+    return None if element is None else element.get(attribute)
+
+
+def get_descendant(cell, *path: str):
+    element = cell
+    for tag in path:
+        if element is None:
+            return None
+        element = element.find(tag)
+    return element
+
+
+def extract_ranking_rows(root) -> Iterator[tuple]:
+    '''
+    Extract the movies of a jpbox ranking page (charts_france.php), walking its table once
+
+    Parameters
+    ----------
+    root: lxml.html.HtmlElement
+        root of the parsed page, e.g. `response.selector.root`
+
+    Returns
+    -------
+    rows: Iterator[tuple]
+        rank, title, sales and relative movie page url of each row, as stripped strings.
+        Missing values are None.
+    '''
+    for cells in iter_table_rows(root, 'tablesmall5'):
+        title_cell = cells.get('col_poster_titre')
+        yield (
+            get_text(cells.get('col_poster_compteur'), 'div'),
+            get_text(title_cell, 'h3', 'a'),
+            get_text(cells.get('col_poster_contenu_majeur')),
+            get_attribute(title_cell, 'href', 'h3', 'a'))
+
+
+def extract_sales_rows(root) -> Iterator[tuple]:
+    '''
+    Extract the sales figures of a jpbox movie page (fichfilm.php), walking its table once
+
+    Parameters
+    ----------
+    root: lxml.html.HtmlElement
+        root of the parsed page, e.g. `response.selector.root`
+
+    Returns
+    -------
+    rows: Iterator[tuple]
+        field name and value of each row, as stripped strings. Missing values are None.
+    '''
+    for cells in iter_table_rows(root, 'tablesmall2'):
+        yield get_first_text(cells.get('col_poster_titre')), get_text(cells.get('col_poster_contenu_majeur'))
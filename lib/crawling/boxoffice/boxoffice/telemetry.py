@@ -0,0 +1,194 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bisect
+import datetime
+import json
+import os
+import time
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+# Upper bounds of the latency histograms buckets, in seconds
+LATENCY_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30]
+
+
+class LatencyHistogram:
+
+    def __init__(self, buckets: list = LATENCY_BUCKETS):
+        '''
+        Latencies counted in fixed buckets, so that memory does not grow with the crawl
+
+        Parameters
+        ----------
+        buckets: list, default LATENCY_BUCKETS
+            sorted upper bounds of the buckets, in seconds. Larger latencies go to an overflow bucket.
+        '''
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def observe(self, latency: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def get_quantile(self, q: float) -> float:
+        '''
+        Upper bound of the bucket the q-quantile falls in, the max latency for the overflow bucket
+        '''
+        rank = q * self.count
+        cumulated = 0
+        for i, count in enumerate(self.counts):
+            cumulated += count
+            if count and cumulated >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return 0.
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.,
+            'p50': self.get_quantile(0.5),
+            'p90': self.get_quantile(0.9),
+            'p99': self.get_quantile(0.99),
+            'max': self.max,
+            'total': self.total,
+            'buckets': {f'le_{bound}': count for bound, count in zip(self.buckets + ['inf'], self.counts)}
+        }
+
+
+class CrawlTelemetry:
+
+    def __init__(self, crawler, path: str, interval: float):
+        '''
+        Crawl performance telemetry: callbacks and download latency histograms,
+        scheduler queue depth, items per second, bytes downloaded and retries.
+
+        A snapshot is appended to a json lines file every `interval` seconds, and a
+        summary is written next to it when the spider closes.
+        Callbacks are timed by `CallbackTimingSpiderMiddleware`.
+
+        Parameters
+        ----------
+        crawler: scrapy.crawler.Crawler
+            the crawler
+        path: str
+            path to the snapshots json lines file, the summary goes to `<path>.summary.json`
+        interval: float
+            seconds between snapshots
+        '''
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.path = path
+        self.interval = interval
+        self.callback_latencies = {}
+        self.download_latencies = LatencyHistogram()
+        self.max_queue_depth = 0
+        self.task = None
+        self.start_time = None
+        self.previous_snapshot = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('TELEMETRY_FILEPATH')
+        if not crawler.settings.getbool('TELEMETRY_ENABLED') or not path:
+            raise NotConfigured('TELEMETRY_ENABLED or TELEMETRY_FILEPATH is not set')
+        extension = cls(crawler, path, crawler.settings.getfloat('TELEMETRY_INTERVAL', 60.))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        return extension
+
+    def observe_callback(self, callback_name: str, latency: float) -> None:
+        if callback_name not in self.callback_latencies:
+            self.callback_latencies[callback_name] = LatencyHistogram()
+        self.callback_latencies[callback_name].observe(latency)
+
+    def response_received(self, response, request, spider):
+        download_latency = request.meta.get('download_latency')
+        if download_latency is not None:
+            self.download_latencies.observe(download_latency)
+
+    def get_queue_depth(self) -> int:
+        engine = self.crawler.engine
+        slot = getattr(engine, 'slot', None) or getattr(engine, '_slot', None)
+        return len(slot.scheduler) if slot is not None and slot.scheduler is not None else 0
+
+    def get_snapshot(self) -> dict:
+        '''
+        Current telemetry, rates being computed since the previous snapshot
+
+        Returns
+        -------
+        snapshot: dict
+            Json serializable telemetry
+        '''
+        now = time.monotonic()
+        queue_depth = self.get_queue_depth()
+        self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+        items = self.stats.get_value('item_scraped_count', 0)
+        responses = self.stats.get_value('response_received_count', 0)
+        response_bytes = self.stats.get_value('downloader/response_bytes', 0)
+        previous_time, previous_items, previous_responses, previous_bytes = self.previous_snapshot or (self.start_time, 0, 0, 0)
+        elapsed = max(now - previous_time, 1e-9)
+        self.previous_snapshot = (now, items, responses, response_bytes)
+        downloader = self.crawler.engine.downloader
+        return {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'elapsed_seconds': now - self.start_time,
+            'queue_depth': queue_depth,
+            'requests_in_flight': len(downloader.active),
+            'items': items,
+            'items_per_sec': (items - previous_items) / elapsed,
+            'responses': responses,
+            'responses_per_sec': (responses - previous_responses) / elapsed,
+            'response_bytes': response_bytes,
+            'bytes_per_sec': (response_bytes - previous_bytes) / elapsed,
+            'retries': self.stats.get_value('retry/count', 0),
+            'retries_max_reached': self.stats.get_value('retry/max_reached', 0),
+            'download_latency': self.download_latencies.to_dict(),
+            'callback_latency': {name: histogram.to_dict() for name, histogram in self.callback_latencies.items()},
+        }
+
+    def write_snapshot(self) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.get_snapshot()) + '\n')
+
+    def spider_opened(self, spider):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.start_time = time.monotonic()
+        self.task = task.LoopingCall(self.write_snapshot)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.write_snapshot()
+
+        # Rates of the summary are over the whole crawl
+        self.previous_snapshot = None
+        summary = self.get_snapshot()
+        summary['reason'] = reason
+        summary['max_queue_depth'] = self.max_queue_depth
+        summary['callback_seconds'] = sum(histogram.total for histogram in self.callback_latencies.values())
+        with open(self.path + '.summary.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        spider.logger.info(f'Crawl telemetry written to {self.path}')
@@ -0,0 +1,234 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import textwrap
+from loguru import logger
+from typing import Iterator, Optional
+
+ID_PREFIX = '{"id": '
+
+
+class MovieJournal:
+
+    def __init__(self, path: str, fsync_every: int = 100):
+        '''
+        An append-only json lines journal of crawled movie cards, one per line
+
+        Lines are flushed to the OS as they are written and synced to disk every
+        `fsync_every` records, so that a crash loses at most that many records.
+        A line torn by a crash is cut off when the journal is opened again.
+
+        Parameters
+        ----------
+        path: str
+            Path of the journal
+        fsync_every: int, default 100
+            Number of records between two syncs to disk
+        '''
+        self.path = path
+        self.fsync_every = fsync_every
+        self._pending = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        truncate_torn_line(path)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def append(self, record: dict) -> None:
+        '''
+        Append a record to the journal. Its id is written first, so that
+        ids can be scanned without parsing whole records.
+
+        Parameters
+        ----------
+        record: dict
+            A movie card, with an `id` field
+        '''
+        record = {'id': record['id'], **record}
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+
+    def __enter__(self) -> 'MovieJournal':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def truncate_torn_line(path: str) -> None:
+    '''
+    Cut off the last line of a journal if it was not fully written
+    '''
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b'\n':
+            return
+        # Look backwards for the end of the last complete line
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            step = min(position, 1 << 16)
+            position -= step
+            f.seek(position)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                f.truncate(position + newline + 1)
+                break
+        else:
+            f.truncate(0)
+    logger.warning(f"Cut off a torn line at the end of {path}")
+
+
+def iter_journal(path: str) -> Iterator[dict]:
+    '''
+    Iterate over the records of a journal, in the order they were written
+
+    Parameters
+    ----------
+    path: str
+        Path of the journal
+
+    Returns
+    -------
+    records: Iterator[dict]
+        The records, one at a time
+    '''
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.endswith('\n'):
+                yield json.loads(line)
+
+
+def read_journal_ids(path: str) -> set:
+    '''
+    Ids of the records of a journal, only decoding the id at the start of each line
+
+    Parameters
+    ----------
+    path: str
+        Path of the journal
+
+    Returns
+    -------
+    ids: set
+        The ids already in the journal
+    '''
+    decoder = json.JSONDecoder()
+    ids = set()
+    if not os.path.isfile(path):
+        return ids
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                continue
+            if line.startswith(ID_PREFIX):
+                ids.add(decoder.raw_decode(line, len(ID_PREFIX))[0])
+            else:
+                ids.add(json.loads(line)['id'])
+    return ids
+
+
+def compact_journal(journal_path: str, output_path: str, indent: Optional[int] = 4) -> int:
+    '''
+    Write the records of a journal as a json array, keeping the last record of each id.
+    The output is replaced atomically, so that it is never left half written.
+
+    Parameters
+    ----------
+    journal_path: str
+        Path of the journal
+    output_path: str
+        Path of the json array
+    indent: Optional[int], default 4
+        Indentation of the json array
+
+    Returns
+    -------
+    n_records: int
+        Number of records written
+    '''
+    # Offsets of the last line of each id, so that only those records are kept in memory one at a time
+    decoder = json.JSONDecoder()
+    offsets = {}
+    with open(journal_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.endswith(b'\n'):
+                text = line.decode('utf-8')
+                if text.startswith(ID_PREFIX):
+                    movie_id = decoder.raw_decode(text, len(ID_PREFIX))[0]
+                else:
+                    movie_id = json.loads(text)['id']
+                offsets.pop(movie_id, None)
+                offsets[movie_id] = offset
+            offset += len(line)
+
+    temporary_path = output_path + '.tmp'
+    with open(journal_path, 'rb') as journal, open(temporary_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, offset in enumerate(sorted(offsets.values())):
+            journal.seek(offset)
+            record = json.loads(journal.readline().decode('utf-8'))
+            f.write(',' if i > 0 else '')
+            record = json.dumps(record, ensure_ascii=False, indent=indent)
+            f.write('\n' + (textwrap.indent(record, ' ' * indent) if indent else record))
+        f.write('\n]\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, output_path)
+    return len(offsets)
+
+
+def load_sync_watermark(path: str) -> Optional[str]:
+    '''
+    Date up to which crawled movies are known to be up to date with TMDb,
+    formatted as YYYY-MM-DD, None if never saved
+    '''
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['last_sync']
+
+
+def save_sync_watermark(path: str, date: str) -> None:
+    '''
+    Save the date up to which crawled movies are known to be up to date with TMDb
+
+    Parameters
+    ----------
+    path: str
+        Path of the watermark json
+    date: str
+        The date, formatted as YYYY-MM-DD
+    '''
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump({'last_sync': date}, f)
+    os.replace(temporary_path, path)
@@ -0,0 +1,134 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from typing import Optional, Tuple, Union
+from lib.crawling.movie_features.types import MovieMember
+
+
+class CastMemberRecord:
+    '''
+    A cast member, holding only the fields used by the actor features
+    '''
+    __slots__ = ('tmdb_id', 'name', 'gender', 'tmdb_popularity', 'order')
+
+    def __init__(self, tmdb_id: int, name: str, gender: int, tmdb_popularity: float, order: int):
+        self.tmdb_id = tmdb_id
+        self.name = name
+        self.gender = gender
+        self.tmdb_popularity = tmdb_popularity
+        self.order = order
+
+    def __repr__(self) -> str:
+        return f'CastMemberRecord({self.tmdb_id}, {self.name!r}, order={self.order})'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CastMemberRecord) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def to_dict(self) -> MovieMember:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class MovieRecord:
+    '''
+    A movie, holding only the fields used by the encoder, with flat tuples of
+    names and iso codes instead of nested dicts
+    '''
+    __slots__ = ('tmdb_id', 'title', 'release_date', 'is_adult', 'collection_name', 'budget', 'runtime',
+                 'original_language', 'genres', 'production_countries', 'languages', 'tmdb_popularity',
+                 'tmdb_vote_count', 'tmdb_vote_average', 'cast')
+
+    def __init__(self, tmdb_id: int, title: str, release_date: str, is_adult: bool, collection_name: Optional[str],
+                 budget: int, runtime: Optional[int], original_language: str, genres: Tuple[str, ...],
+                 production_countries: Tuple[str, ...], languages: Tuple[str, ...], tmdb_popularity: float,
+                 tmdb_vote_count: int, tmdb_vote_average: float, cast: Tuple[CastMemberRecord, ...]):
+        self.tmdb_id = tmdb_id
+        self.title = title
+        self.release_date = release_date
+        self.is_adult = is_adult
+        self.collection_name = collection_name
+        self.budget = budget
+        self.runtime = runtime
+        self.original_language = original_language
+        self.genres = genres
+        self.production_countries = production_countries
+        self.languages = languages
+        self.tmdb_popularity = tmdb_popularity
+        self.tmdb_vote_count = tmdb_vote_count
+        self.tmdb_vote_average = tmdb_vote_average
+        self.cast = cast
+
+    def __repr__(self) -> str:
+        return f'MovieRecord({self.tmdb_id}, {self.title!r}, {self.release_date!r})'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, MovieRecord) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def to_dict(self) -> dict:
+        record = {field: getattr(self, field) for field in self.__slots__}
+        record['genres'] = list(self.genres)
+        record['production_countries'] = list(self.production_countries)
+        record['languages'] = list(self.languages)
+        record['cast'] = [member.to_dict() for member in self.cast]
+        return record
+
+
+def parse_movie_record(raw: Union[bytes, str, dict], top_k_cast: Optional[int] = None) -> MovieRecord:
+    '''
+    Parse a TMDb movie details response, with appended credits, straight
+    into a movie record, without building intermediate dicts for each
+    genre, country, language or cast member
+
+    Parameters
+    ----------
+    raw: Union[bytes, str, dict]
+        the raw json body of the details response, or its decoded content
+    top_k_cast: Optional[int], default None
+        number of cast members to keep, by billing order. All of them if None.
+
+    Returns
+    -------
+    record: MovieRecord
+        A movie record
+    '''
+    details = json.loads(raw) if isinstance(raw, (bytes, str)) else raw
+    collection = details.get('belongs_to_collection')
+    credits = details.get('credits') or {}
+    cast = credits.get('cast') or []
+    if top_k_cast is not None:
+        # Credits are usually sorted by order already, in which case this is a cheap copy
+        cast = sorted(cast, key=lambda member: member['order'])[:top_k_cast]
+    return MovieRecord(
+        tmdb_id=details['id'],
+        title=details['title'],
+        release_date=details['release_date'],
+        is_adult=details['adult'],
+        collection_name=collection['name'] if collection else None,
+        budget=details['budget'],
+        runtime=details['runtime'],
+        original_language=details['original_language'],
+        genres=tuple(genre['name'] for genre in details.get('genres') or ()),
+        production_countries=tuple(country['iso_3166_1'] for country in details.get('production_countries') or ()),
+        languages=tuple(language['iso_639_1'] for language in details.get('spoken_languages') or ()),
+        tmdb_popularity=details['popularity'],
+        tmdb_vote_count=details['vote_count'],
+        tmdb_vote_average=details['vote_average'],
+        cast=tuple(
+            CastMemberRecord(member['id'], member['name'], member['gender'], member['popularity'], member['order'])
+            for member in cast),
+    )
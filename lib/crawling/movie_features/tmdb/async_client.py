@@ -0,0 +1,219 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple, Union
+from lib.crawling.movie_features.records import MovieRecord
+from lib.crawling.movie_features.tmdb.cache import ResponseCache
+from lib.crawling.movie_features.tmdb.client import TMDbClient, TMDB_API_URL
+from lib.crawling.movie_features.tmdb.rate_limiter import TokenBucketRateLimiter
+from lib.crawling.movie_features.tmdb.title_index import TitleIndex
+from lib.crawling.movie_features.types import MovieCard
+from loguru import logger
+
+
+class AsyncTMDbClient:
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = TMDB_API_URL, concurrency: int = 10,
+                 cache: Optional[ResponseCache] = None, rate_limiter: Optional[TokenBucketRateLimiter] = None,
+                 append_credits: bool = True, title_index: Optional[TitleIndex] = None):
+        '''
+        An asyncio client for The Movie Database API, querying many movies at once
+
+        Blocking calls of a shared TMDbClient run in a thread pool, so that
+        keep-alive connections are reused, and a semaphore bounds the number
+        of requests in flight.
+
+        Parameters
+        ----------
+        api_key: Optional[str], default None
+            TMDb API key, read from the TMDB_API_KEY environment variable if not provided
+        base_url: str, default TMDB_API_URL
+            Root url of the API, e.g. the one of a local stub server
+        concurrency: int, default 10
+            Maximum number of concurrent requests
+        cache: Optional[ResponseCache], default None
+            A persistent cache of responses, checked before any request
+        rate_limiter: Optional[TokenBucketRateLimiter], default None
+            Rate limiter of the requests, see TMDbClient
+        append_credits: bool, default True
+            Whether movie cards are fetched in a single request, appending credits to details
+        title_index: Optional[TitleIndex], default None
+            A local index of titles already matched, checked before any search request
+        '''
+        self.concurrency = concurrency
+        self.client = TMDbClient(api_key=api_key, base_url=base_url, pool_size=concurrency, cache=cache,
+                                 rate_limiter=rate_limiter, append_credits=append_credits,
+                                 title_index=title_index)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphores = {}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop, so that the client can be reused across asyncio.run calls
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores = {loop: asyncio.Semaphore(self.concurrency)}
+        return self._semaphores[loop]
+
+    async def _run(self, func: Callable, *args):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def find_movie_match(self, movie: str, year: Optional[int] = None) -> Tuple[Union[int, None], Union[str, None]]:
+        return await self._run(self.client.find_movie_match, movie, year)
+
+    async def find_movie_id(self, movie: str, year: Optional[int] = None) -> Union[int, None]:
+        return await self._run(self.client.find_movie_id, movie, year)
+
+    async def get_movie_details(self, movie_id: int) -> dict:
+        return await self._run(self.client.get_movie_details, movie_id)
+
+    async def get_movie_cast(self, movie_id: int) -> list:
+        return await self._run(self.client.get_movie_cast, movie_id)
+
+    async def get_movie_card(self, movie_id: int) -> Union[None, MovieCard]:
+        '''
+        Get a movie details and cast. Unless credits are appended to details,
+        both are requested concurrently.
+
+        Parameters
+        ----------
+        movie_id: int
+            a movie id (the tmdb one)
+
+        Returns
+        -------
+        card: Union[None, MovieCard]
+            A movie card. None if the id is unknown to TMDb
+        '''
+        if self.client.append_credits:
+            return await self._run(self.client.get_movie_card, movie_id)
+        try:
+            card, cast = await asyncio.gather(self.get_movie_details(movie_id), self.get_movie_cast(movie_id))
+        except requests.HTTPError as error:
+            if error.response is not None and error.response.status_code == 404:
+                logger.error(f"Error: Movie id {movie_id} not found")
+                return None
+            raise
+        card['cast'] = cast
+        return card
+
+    async def refresh_movie_card(self, movie_id: int) -> Union[None, MovieCard]:
+        return await self._run(self.client.refresh_movie_card, movie_id)
+
+    async def get_changed_movie_ids(self, start_date: str, end_date: Optional[str] = None) -> set:
+        return await self._run(self.client.get_changed_movie_ids, start_date, end_date)
+
+    async def get_movie_cards(self, movie_ids: List[int]) -> List[Union[None, MovieCard]]:
+        '''
+        Get the cards of known movies concurrently, without searching them
+
+        Parameters
+        ----------
+        movie_ids: List[int]
+            movie ids (the tmdb ones)
+
+        Returns
+        -------
+        cards: List[Union[None, MovieCard]]
+            Movie cards, in the same order as the ids. None if an id is unknown to TMDb
+        '''
+        return await asyncio.gather(*[self.get_movie_card(movie_id) for movie_id in movie_ids])
+
+    async def get_movie_record(self, movie_id: int, top_k_cast: Optional[int] = None) -> Union[None, MovieRecord]:
+        return await self._run(self.client.get_movie_record, movie_id, top_k_cast)
+
+    async def find_movie_record(self, movie: str, year: Optional[int] = None,
+                                top_k_cast: Optional[int] = None) -> Union[None, MovieRecord]:
+        return await self._run(self.client.find_movie_record, movie, year, top_k_cast)
+
+    async def find_movie_features(self, movie: str, year: Optional[int] = None) -> Union[None, MovieCard]:
+        '''
+        Find all relevant features (details and cast) given a movie title
+
+        Parameters
+        ----------
+        movie: str
+            a movie title
+        year: Optional[int], default None
+            a release year hint, see `TMDbClient.find_movie_match`
+
+        Returns
+        -------
+        card: Union[None, MovieCard]
+            A movie card. None if no movie was found
+        '''
+        movie_id, strategy = await self.find_movie_match(movie, year)
+        if movie_id:
+            card = await self.get_movie_card(movie_id)
+            if card:
+                card['match_strategy'] = strategy
+            return card
+        else:
+            return None
+
+    async def find_movies_features(self, movies: List[str],
+                                   years: Optional[List[Optional[int]]] = None) -> List[Union[None, MovieCard]]:
+        '''
+        Find movie cards of several titles concurrently
+
+        Parameters
+        ----------
+        movies: List[str]
+            movie titles
+        years: Optional[List[Optional[int]]], default None
+            release year hints of the titles, if any
+
+        Returns
+        -------
+        cards: List[Union[None, MovieCard]]
+            Movie cards, in the same order as the titles. None if no movie was found
+        '''
+        years = years or [None] * len(movies)
+        return await asyncio.gather(*[self.find_movie_features(movie, year) for movie, year in zip(movies, years)])
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.client.session.close()
+
+
+def find_movies_features(movies: List[str], concurrency: int = 10, **kwargs) -> List[Union[None, MovieCard]]:
+    '''
+    Blocking helper to find movie cards of several titles concurrently
+
+    Parameters
+    ----------
+    movies: List[str]
+        movie titles
+    concurrency: int, default 10
+        Maximum number of concurrent requests
+    kwargs:
+        Other arguments of AsyncTMDbClient
+
+    Returns
+    -------
+    cards: List[Union[None, MovieCard]]
+        Movie cards, in the same order as the titles. None if no movie was found
+    '''
+    client = AsyncTMDbClient(concurrency=concurrency, **kwargs)
+    try:
+        return asyncio.run(client.find_movies_features(movies))
+    finally:
+        client.close()
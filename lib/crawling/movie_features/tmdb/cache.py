@@ -0,0 +1,230 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple, Union
+
+DAY = 24 * 3600
+DEFAULT_TTLS = {
+    '/search/movie': 30 * DAY,
+    '/movie/{id}': 30 * DAY,
+    '/movie/{id}/credits': 30 * DAY,
+}
+NEGATIVE_TTL = 7 * DAY  # Titles not found may be added to TMDb later on
+
+
+def get_endpoint_name(endpoint: str) -> str:
+    '''
+    Endpoint template of a request path, e.g. "/movie/{id}/credits" for "/movie/2332/credits"
+    '''
+    return re.sub(r'/\d+', '/{id}', endpoint)
+
+
+def is_negative_response(response: dict) -> bool:
+    '''
+    Whether a response tells that nothing was found, i.e. a search without results
+    '''
+    return 'results' in response and len(response['results']) == 0
+
+
+class ResponseCache:
+
+    def __init__(self, path: str, ttls: Optional[dict] = None, negative_ttl: float = NEGATIVE_TTL,
+                 max_entries: int = 200000):
+        '''
+        A persistent cache of TMDb responses stored in a SQLite database
+
+        Responses are keyed by endpoint, query parameters and language, and expire
+        after a time to live depending on the endpoint. Least recently used responses
+        are evicted once the cache holds more than `max_entries` responses.
+        The cache can be shared by several threads and processes.
+
+        Parameters
+        ----------
+        path: str
+            Path of the SQLite database, ":memory:" for a cache living in memory
+        ttls: Optional[dict], default None
+            Time to live in seconds of the responses of each endpoint template, e.g. {"/search/movie": 86400}.
+            Defaults to DEFAULT_TTLS, endpoints not listed are not cached.
+        negative_ttl: float, default NEGATIVE_TTL
+            Time to live in seconds of the searches without results
+        max_entries: int, default 200000
+            Maximum number of cached responses
+        '''
+        self.path = path
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._size = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def get_key(endpoint: str, params: dict) -> str:
+        '''
+        Cache key of a request. The api key is left out, so that the cache
+        does not depend on who made the request.
+
+        Parameters
+        ----------
+        endpoint: str
+            API endpoint, e.g. "/movie/2332"
+        params: dict
+            Query parameters, including the language
+
+        Returns
+        -------
+        key: str
+            The cache key
+        '''
+        params = {name: value for name, value in params.items() if name != 'api_key'}
+        return endpoint + '?' + json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+    def is_cached(self, endpoint: str) -> bool:
+        return get_endpoint_name(endpoint) in self.ttls
+
+    def get(self, endpoint: str, params: dict) -> Tuple[bool, Union[dict, None]]:
+        '''
+        Look a response up in the cache
+
+        Parameters
+        ----------
+        endpoint: str
+            API endpoint, e.g. "/movie/2332"
+        params: dict
+            Query parameters, including the language
+
+        Returns
+        -------
+        hit: bool
+            Whether a fresh response was found
+        response: Union[dict, None]
+            The cached response, None if not found
+        '''
+        key = self.get_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT response, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return False, None
+            self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return True, json.loads(row[0])
+
+    def set(self, endpoint: str, params: dict, response: dict) -> None:
+        '''
+        Store a response in the cache, evicting the least recently used ones if the cache is full
+
+        Parameters
+        ----------
+        endpoint: str
+            API endpoint, e.g. "/movie/2332"
+        params: dict
+            Query parameters, including the language
+        response: dict
+            The json response
+        '''
+        ttl = self.negative_ttl if is_negative_response(response) else self.ttls[get_endpoint_name(endpoint)]
+        now = time.time()
+        key, response = self.get_key(endpoint, params), json.dumps(response, ensure_ascii=False)
+        with self._lock:
+            # Expired responses are refreshed in place, only new keys grow the cache
+            cursor = self._connection.execute(
+                'INSERT OR IGNORE INTO responses (key, response, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, response, now + ttl, now))
+            if cursor.rowcount == 0:
+                self._connection.execute(
+                    'UPDATE responses SET response = ?, expires_at = ?, accessed_at = ? WHERE key = ?',
+                    (response, now + ttl, now, key))
+                return
+            self._size += 1
+            if self._size > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Drop expired responses, then the least recently used ones down to 90% of the capacity,
+        # so that eviction does not run on every insert of a full cache
+        self._connection.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),))
+        size = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        target = int(self.max_entries * 0.9)
+        if size > target:
+            self._connection.execute(
+                'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)',
+                (size - target,))
+            size = target
+        self._size = size
+
+    def invalidate(self, endpoint: str) -> None:
+        '''
+        Drop the cached responses of an endpoint and of its sub-endpoints, whatever their parameters,
+        e.g. "/movie/2332" and "/movie/2332/credits" for "/movie/2332"
+
+        Parameters
+        ----------
+        endpoint: str
+            API endpoint, e.g. "/movie/2332"
+        '''
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM responses WHERE substr(key, 1, ?) = ? OR substr(key, 1, ?) = ?",
+                (len(endpoint) + 1, endpoint + '?', len(endpoint) + 1, endpoint + '/'))
+            self._size -= cursor.rowcount
+
+    def stats(self) -> dict:
+        '''
+        Hit and miss counters of this cache instance
+
+        Returns
+        -------
+        stats: dict
+            Number of hits, misses, hit rate and cached responses
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.,
+            'size': self._size,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM responses')
+            self._size = 0
+
+    def close(self) -> None:
+        self._connection.close()
@@ -14,23 +14,193 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import datetime
+import os
+import threading
+import time
+from collections import Counter
 from loguru import logger
-from tmdbv3api import TMDb, Movie, Search
-from typing import Union
-from lib.crawling.movie_features.types import MovieDetails, unmarshal_details, MovieCast, unmarshal_credits, MovieCard
+import requests
+from requests.adapters import HTTPAdapter
+from typing import List, Optional, Tuple, Union
+from config import TMDB_MAX_RETRIES, TMDB_RATE_LIMIT, TMDB_RATE_LIMITER_FILEPATH
+from lib.crawling.movie_features.records import MovieRecord, parse_movie_record
+from lib.crawling.movie_features.tmdb.cache import ResponseCache
+from lib.crawling.movie_features.tmdb.query_planner import parse_title, plan_queries, select_result
+from lib.crawling.movie_features.tmdb.title_index import TitleIndex
+from lib.crawling.movie_features.tmdb.rate_limiter import TokenBucketRateLimiter, get_backoff_delay, get_retry_after
+from lib.crawling.movie_features.types import MovieDetails, unmarshal_details, MovieCast, unmarshal_credits, MovieCard, \
+    unmarshal_card
+
+TMDB_API_URL = 'https://api.themoviedb.org/3'
+
 
 class TMDbClient:
 
-    def __init__(self):
+    def __init__(self, api_key: Optional[str] = None, base_url: str = TMDB_API_URL, pool_size: int = 10,
+                 cache: Optional[ResponseCache] = None, rate_limiter: Optional[TokenBucketRateLimiter] = None,
+                 max_retries: int = TMDB_MAX_RETRIES, append_credits: bool = True,
+                 title_index: Optional[TitleIndex] = None):
         '''
         A custom client for The Movie Database API for French movies
+
+        Requests go through one HTTP session, so that connections are kept
+        alive between calls, and a rate limiter. Requests answered with a 429
+        or 5xx status are retried after the Retry-After delay, or with an
+        exponential backoff. The client can be shared between threads.
+
+        Parameters
+        ----------
+        api_key: Optional[str], default None
+            TMDb API key, read from the TMDB_API_KEY environment variable if not provided
+        base_url: str, default TMDB_API_URL
+            Root url of the API, e.g. the one of a local stub server
+        pool_size: int, default 10
+            Maximum number of connections kept alive
+        cache: Optional[ResponseCache], default None
+            A persistent cache of responses, checked before any request
+        rate_limiter: Optional[TokenBucketRateLimiter], default None
+            Rate limiter of the requests. Defaults to one allowing TMDB_RATE_LIMIT requests per second,
+            shared by all the processes of the host
+        max_retries: int, default TMDB_MAX_RETRIES
+            Number of retries of a request answered with a 429 or 5xx status
+        append_credits: bool, default True
+            Whether movie cards are fetched in a single request, appending credits to details,
+            rather than with one request for details and one for credits
+        title_index: Optional[TitleIndex], default None
+            A local index of titles already matched, checked before any search request
+            and filled with the results of new searches
+        '''
+        self.api_key = api_key or os.environ.get('TMDB_API_KEY')
+        self.base_url = base_url.rstrip('/')
+        self.language = 'fr-FR'
+        self.cache = cache
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter(TMDB_RATE_LIMIT, path=TMDB_RATE_LIMITER_FILEPATH)
+        self.max_retries = max_retries
+        self.append_credits = append_credits
+        self.title_index = title_index
+        self.strategy_counts = Counter()  # Number of movies found by each search strategy
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, endpoint: str, params: Optional[dict] = None) -> dict:
+        '''
+        Send a GET request to TMDb API
+
+        Parameters
+        ----------
+        endpoint: str
+            API endpoint, e.g. "/movie/2332"
+        params: Optional[dict], default None
+            Query parameters, besides api key and language
+
+        Returns
+        -------
+        response: dict
+            The json response
+        '''
+        params = {'api_key': self.api_key, 'language': self.language, **(params or {})}
+        use_cache = self.cache is not None and self.cache.is_cached(endpoint)
+        if use_cache:
+            hit, cached_response = self.cache.get(endpoint, params)
+            if hit:
+                return cached_response
+        response = self.send(endpoint, params)
+        if use_cache:
+            self.cache.set(endpoint, params, response)
+        return response
+
+    def send(self, endpoint: str, params: dict) -> dict:
+        '''
+        Send a GET request through the rate limiter, retrying on 429, 5xx statuses and connection errors
+
+        Parameters
+        ----------
+        endpoint: str
+            API endpoint, e.g. "/movie/2332"
+        params: dict
+            All query parameters
+
+        Returns
+        -------
+        response: dict
+            The json response
+        '''
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.get(self.base_url + endpoint, params=params, timeout=30)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt == self.max_retries:
+                    raise
+                delay = get_backoff_delay(attempt)
+                logger.warning(f"{error} on {endpoint}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if (response.status_code != 429 and response.status_code < 500) or attempt == self.max_retries:
+                break
+            retry_after = get_retry_after(response.headers)
+            if retry_after is not None:
+                # TMDb tells how long the whole host should wait
+                self.rate_limiter.block(retry_after)
+                delay = retry_after
+            else:
+                delay = get_backoff_delay(attempt)
+                time.sleep(delay)
+            logger.warning(f"Status {response.status_code} on {endpoint}, retrying in {delay:.1f}s")
+        response.raise_for_status()
+        return response.json()
+
+    def find_movie_match(self, movie: str, year: Optional[int] = None) -> Tuple[Union[int, None], Union[str, None]]:
+        '''
+        Looks for a particular movie in TMDb, trying the searches planned by
+        `plan_queries` one after the other until one returns results
+
+        Parameters
+        ----------
+        movie: str
+            a movie title, possibly followed by its year, e.g. "Le Roi Lion (2019)"
+        year: Optional[int], default None
+            a release year hint, e.g. the year of the box office chart
+
+        Returns
+        -------
+        id: Union[int, None]
+            the most relevant movie id if we found one, or None
+        strategy: Union[str, None]
+            the name of the search which found the movie, "title_index" if found locally, or None
         '''
-        self.client = TMDb()
-        self.client.language = 'fr-FR'
-        self.movie_db = Movie()
-        self.search = Search()
+        parsed = parse_title(movie, year)
+        if self.title_index is not None:
+            movie_id = self.title_index.find(parsed['title'], parsed['year'])
+            if movie_id is not None:
+                self._count_strategy('title_index')
+                return movie_id, 'title_index'
+        for strategy in plan_queries(movie, year):
+            results = self.request('/search/movie', strategy['params'])['results']
+            if len(results) == 0:
+                continue
+            movie_id = select_result(results, strategy, parsed['year'])
+            if movie_id is None:
+                # Only results released far from the wanted year, the most relevant one is kept
+                self._count_strategy('any_year')
+                return results[0]['id'], 'any_year'
+            if self.title_index is not None:
+                release_date = next(result.get('release_date') for result in results if result['id'] == movie_id)
+                self.title_index.add(parsed['title'], movie_id, int(release_date[:4]) if release_date else None)
+            self._count_strategy(strategy['name'])
+            return movie_id, strategy['name']
+        self._count_strategy(None)
+        return None, None
 
-    def find_movie_id(self, movie: str) -> Union[int, None]:
+    def _count_strategy(self, strategy: Union[str, None]) -> None:
+        with self._lock:
+            self.strategy_counts[strategy or 'not_found'] += 1
+
+    def find_movie_id(self, movie: str, year: Optional[int] = None) -> Union[int, None]:
         '''
         Looks for a particular movie in TMDb
 
@@ -38,15 +208,16 @@ class TMDbClient:
         ----------
         movie: str
             a movie title
+        year: Optional[int], default None
+            a release year hint, see `find_movie_match`
 
         Returns
         -------
         id: Union[int, None]
             the most relevant movie id if we found one, or None
         '''
-        results = self.search.movies({'query': movie})
-        if len(results) > 0:
-            return results[0].id
+        movie_id, _ = self.find_movie_match(movie, year)
+        return movie_id
 
     def get_movie_details(self, movie_id: int) -> MovieDetails:
         '''
@@ -62,7 +233,7 @@ class TMDbClient:
         details: MovieDetails
             A movie details
         '''
-        details = self.movie_db.details(movie_id)
+        details = self.request(f'/movie/{movie_id}')
         details = unmarshal_details(details)
         return details
 
@@ -80,11 +251,152 @@ class TMDbClient:
         cast: MovieCast
             A movie cast
         '''
-        credits = self.movie_db.credits(movie_id)
+        credits = self.request(f'/movie/{movie_id}/credits')
         cast = unmarshal_credits(credits)
         return cast
 
-    def find_movie_features(self, movie: str) -> Union[None, MovieCard]:
+    def get_movie_card(self, movie_id: int) -> Union[None, MovieCard]:
+        '''
+        Get a movie details and cast
+
+        Parameters
+        ----------
+        movie_id: int
+            a movie id (the tmdb one)
+
+        Returns
+        -------
+        card: Union[None, MovieCard]
+            A movie card. None if the id is unknown to TMDb
+        '''
+        try:
+            if self.append_credits:
+                return unmarshal_card(self.request(f'/movie/{movie_id}', {'append_to_response': 'credits'}))
+            card = self.get_movie_details(movie_id)
+            card['cast'] = self.get_movie_cast(movie_id)
+            return card
+        except requests.HTTPError as error:
+            if error.response is not None and error.response.status_code == 404:
+                logger.error(f"Error: Movie id {movie_id} not found")
+                return None
+            raise
+
+    def refresh_movie_card(self, movie_id: int) -> Union[None, MovieCard]:
+        '''
+        Get a movie details and cast from TMDb, ignoring cached responses, e.g. after the movie changed
+
+        Parameters
+        ----------
+        movie_id: int
+            a movie id (the tmdb one)
+
+        Returns
+        -------
+        card: Union[None, MovieCard]
+            A movie card. None if the id is unknown to TMDb
+        '''
+        if self.cache is not None:
+            self.cache.invalidate(f'/movie/{movie_id}')
+        return self.get_movie_card(movie_id)
+
+    def get_movie_cards(self, movie_ids: List[int]) -> List[Union[None, MovieCard]]:
+        '''
+        Get the cards of known movies, without searching them
+
+        Parameters
+        ----------
+        movie_ids: List[int]
+            movie ids (the tmdb ones)
+
+        Returns
+        -------
+        cards: List[Union[None, MovieCard]]
+            Movie cards, in the same order as the ids. None if an id is unknown to TMDb
+        '''
+        return [self.get_movie_card(movie_id) for movie_id in movie_ids]
+
+    def get_movie_record(self, movie_id: int, top_k_cast: Optional[int] = None) -> Union[None, MovieRecord]:
+        '''
+        Get a lean record of a movie, in a single request, with only the fields used by the encoder
+
+        Parameters
+        ----------
+        movie_id: int
+            a movie id (the tmdb one)
+        top_k_cast: Optional[int], default None
+            number of cast members to keep, by billing order. All of them if None.
+
+        Returns
+        -------
+        record: Union[None, MovieRecord]
+            A movie record. None if the id is unknown to TMDb
+        '''
+        try:
+            details = self.request(f'/movie/{movie_id}', {'append_to_response': 'credits'})
+        except requests.HTTPError as error:
+            if error.response is not None and error.response.status_code == 404:
+                logger.error(f"Error: Movie id {movie_id} not found")
+                return None
+            raise
+        return parse_movie_record(details, top_k_cast)
+
+    def find_movie_record(self, movie: str, year: Optional[int] = None,
+                          top_k_cast: Optional[int] = None) -> Union[None, MovieRecord]:
+        '''
+        Find the lean record of a movie given its title
+
+        Parameters
+        ----------
+        movie: str
+            a movie title
+        year: Optional[int], default None
+            a release year hint, see `find_movie_match`
+        top_k_cast: Optional[int], default None
+            number of cast members to keep, by billing order. All of them if None.
+
+        Returns
+        -------
+        record: Union[None, MovieRecord]
+            A movie record. None if no movie was found
+        '''
+        movie_id = self.find_movie_id(movie, year)
+        if movie_id:
+            return self.get_movie_record(movie_id, top_k_cast)
+        return None
+
+    def get_changed_movie_ids(self, start_date: str, end_date: Optional[str] = None) -> set:
+        '''
+        Ids of the movies changed on TMDb between two dates, e.g. their popularity, cast or budget
+
+        Parameters
+        ----------
+        start_date: str
+            first day of changes, formatted as YYYY-MM-DD
+        end_date: Optional[str], default None
+            last day of changes, formatted as YYYY-MM-DD, today if None
+
+        Returns
+        -------
+        ids: set
+            tmdb ids of the changed movies
+        '''
+        start = datetime.date.fromisoformat(start_date)
+        end = datetime.date.fromisoformat(end_date) if end_date else datetime.date.today()
+        movie_ids = set()
+        # TMDb only serves changes 14 days at a time
+        while start <= end:
+            window_end = min(end, start + datetime.timedelta(days=13))
+            page, total_pages = 1, 1
+            while page <= total_pages:
+                changes = self.request('/movie/changes', {
+                    'start_date': start.isoformat(), 'end_date': window_end.isoformat(), 'page': page})
+                movie_ids.update(change['id'] for change in changes['results'])
+                total_pages = changes.get('total_pages', 1)
+                page += 1
+            start = window_end + datetime.timedelta(days=1)
+        return movie_ids
+
+    def find_movie_features(self, movie: str, year: Optional[int] = None) -> Union[None, MovieCard]:
         '''
         Find all relevant features (details and cast)
         given a movie title
@@ -93,16 +405,19 @@ class TMDbClient:
         ----------
         movie: str
             a movie title
+        year: Optional[int], default None
+            a release year hint, see `find_movie_match`
 
         Returns
         -------
         card: Union[None, MovieCard]
             A movie card. None if no movie was found
         '''
-        movie_id = self.find_movie_id(movie)
+        movie_id, strategy = self.find_movie_match(movie, year)
         if movie_id:
-            card = self.get_movie_details(movie_id)
-            card['cast'] = self.get_movie_cast(movie_id)
+            card = self.get_movie_card(movie_id)
+            if card:
+                card['match_strategy'] = strategy
             return card
         else:
             return None
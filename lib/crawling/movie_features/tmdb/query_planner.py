@@ -0,0 +1,137 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+from typing import List, Optional, Union
+try:
+    from typing import TypedDict
+except ImportError:
+    from typing_extensions import TypedDict
+
+ARTICLES = {'le', 'la', 'les', "l'", 'un', 'une', 'des', 'the', 'a', 'an'}
+YEAR_PATTERN = re.compile(r'^(19|20)\d{2}$')
+PARENTHESES_PATTERN = re.compile(r'\s*[(\[]([^)\]]*)[)\]]')
+
+
+class ParsedTitle(TypedDict):
+    title: str # Title to search, without year nor disambiguators
+    year: Optional[int] # Year found in the title, or given as a hint
+    disambiguators: List[str] # Other parenthesized mentions, e.g. "3D", "reprise"
+
+
+class SearchStrategy(TypedDict):
+    name: str # Recorded with the matched movie
+    params: dict # Query parameters of the search endpoint
+    max_year_gap: Optional[int] # Maximum gap between the result and the wanted release years, None for any
+
+
+def parse_title(title: str, year: Optional[int] = None) -> ParsedTitle:
+    '''
+    Decompose a jpbox-office title such as "Roi Lion (Le) (2019)" into a
+    search query "Le Roi Lion" and a release year
+
+    Parameters
+    ----------
+    title: str
+        a movie title, as listed by jpbox-office
+    year: Optional[int], default None
+        a release year hint, e.g. the year of the box office chart. A year
+        written in the title takes precedence.
+
+    Returns
+    -------
+    parsed: ParsedTitle
+        The title to search, its year and the dropped disambiguators
+    '''
+    article = None
+    disambiguators = []
+    for mention in PARENTHESES_PATTERN.findall(title):
+        mention = mention.strip()
+        if YEAR_PATTERN.match(mention):
+            year = int(mention)
+        elif mention.lower() in ARTICLES:
+            article = mention
+        elif mention:
+            disambiguators.append(mention)
+    query = ' '.join(PARENTHESES_PATTERN.sub(' ', title).split())
+    if article:
+        separator = '' if article.endswith("'") else ' '
+        query = article + separator + query
+    return {'title': query, 'year': year, 'disambiguators': disambiguators}
+
+
+def plan_queries(title: str, year: Optional[int] = None) -> List[SearchStrategy]:
+    '''
+    List the searches to try for a title, from the most to the least precise.
+    Later searches are only sent when earlier ones returned no results at all.
+
+    Parameters
+    ----------
+    title: str
+        a movie title, as listed by jpbox-office
+    year: Optional[int], default None
+        a release year hint, see `parse_title`
+
+    Returns
+    -------
+    strategies: List[SearchStrategy]
+        The searches to try, in order
+    '''
+    parsed = parse_title(title, year)
+    query, year = parsed['title'], parsed['year']
+    strategies = []
+    if year is not None:
+        strategies += [
+            # The year of the first release anywhere, usually the French one for French movies
+            {'name': 'primary_release_year', 'params': {'query': query, 'primary_release_year': year},
+             'max_year_gap': None},
+            # Release dates differ by a year between countries or festivals, e.g. the French release of a foreign movie
+            {'name': 'nearby_year', 'params': {'query': query}, 'max_year_gap': 1},
+        ]
+    else:
+        strategies.append({'name': 'title', 'params': {'query': query}, 'max_year_gap': None})
+    if query != title:
+        strategies.append({'name': 'raw_title', 'params': {'query': title}, 'max_year_gap': None})
+    return strategies
+
+
+def select_result(results: List[dict], strategy: SearchStrategy, year: Optional[int]) -> Union[int, None]:
+    '''
+    Pick the most relevant movie id among search results
+
+    Parameters
+    ----------
+    results: List[dict]
+        search results, sorted by relevance
+    strategy: SearchStrategy
+        the search which returned the results
+    year: Optional[int]
+        the wanted release year
+
+    Returns
+    -------
+    id: Union[int, None]
+        the first result released close enough to the wanted year, None if there is none
+    '''
+    max_year_gap = strategy['max_year_gap']
+    for result in results:
+        if max_year_gap is None or year is None:
+            return result['id']
+        release_date = result.get('release_date')
+        if release_date and abs(int(release_date[:4]) - year) <= max_year_gap:
+            return result['id']
+    return None
+
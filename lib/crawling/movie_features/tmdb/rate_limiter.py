@@ -0,0 +1,157 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Optional, Union
+
+
+class TokenBucketRateLimiter:
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, path: Optional[str] = None):
+        '''
+        A token bucket limiting the rate of requests
+
+        The bucket holds at most `capacity` tokens and is refilled at `rate` tokens
+        per second, each request consuming one token. When `path` is given, the
+        bucket lives in a SQLite database so that all the processes of a host using
+        the same path share one budget. Otherwise it is shared by the threads of
+        the current process only.
+
+        Parameters
+        ----------
+        rate: float
+            Number of requests allowed per second on average
+        capacity: Optional[float], default None
+            Maximum burst of requests, `rate` if not provided
+        path: Optional[str], default None
+            Path of the SQLite database holding the bucket state
+        '''
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.path = path
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+        self._blocked_until = 0.
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS bucket (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL
+                )''')
+            self._connection.execute('INSERT OR IGNORE INTO bucket VALUES (0, ?, ?, 0)', (self.capacity, time.time()))
+
+    def _take(self, tokens: float, updated_at: float, blocked_until: float, now: float) -> tuple:
+        # Refill the bucket since the last update, then try to take one token.
+        # Returns the new bucket state and how long to wait before trying again.
+        if now < blocked_until:
+            return tokens, updated_at, blocked_until - now
+        tokens = min(self.capacity, tokens + (now - max(updated_at, blocked_until)) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, now, 0.
+        return tokens, now, (1 - tokens) / self.rate
+
+    def _try_acquire(self) -> float:
+        now = time.time()
+        with self._lock:
+            if self.path is None:
+                self._tokens, self._updated_at, wait = self._take(
+                    self._tokens, self._updated_at, self._blocked_until, now)
+                return wait
+            # BEGIN IMMEDIATE locks the database, making the update atomic across processes
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                tokens, updated_at, blocked_until = self._connection.execute(
+                    'SELECT tokens, updated_at, blocked_until FROM bucket WHERE id = 0').fetchone()
+                tokens, updated_at, wait = self._take(tokens, updated_at, blocked_until, now)
+                self._connection.execute(
+                    'UPDATE bucket SET tokens = ?, updated_at = ? WHERE id = 0', (tokens, updated_at))
+            finally:
+                self._connection.execute('COMMIT')
+            return wait
+
+    def acquire(self) -> None:
+        '''
+        Block until a request is allowed
+        '''
+        wait = self._try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self._try_acquire()
+
+    def block(self, seconds: float) -> None:
+        '''
+        Pause all requests sharing this bucket, e.g. when TMDb answers with a Retry-After header
+
+        Parameters
+        ----------
+        seconds: float
+            Number of seconds to wait before the next request
+        '''
+        blocked_until = time.time() + seconds
+        with self._lock:
+            if self.path is None:
+                self._blocked_until = max(self._blocked_until, blocked_until)
+                self._tokens = 0.
+            else:
+                self._connection.execute(
+                    'UPDATE bucket SET blocked_until = MAX(blocked_until, ?), tokens = 0 WHERE id = 0',
+                    (blocked_until,))
+
+    def close(self) -> None:
+        if self.path is not None:
+            self._connection.close()
+
+
+def get_retry_after(headers: dict) -> Union[float, None]:
+    '''
+    Number of seconds to wait given by a Retry-After header, None if missing or not a number of seconds
+    '''
+    try:
+        return max(0., float(headers['Retry-After']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_backoff_delay(attempt: int, base: float = 0.5, maximum: float = 30.) -> float:
+    '''
+    Exponential backoff with full jitter, so that concurrent clients do not retry all at once
+
+    Parameters
+    ----------
+    attempt: int
+        Number of failed attempts so far, starting at 0
+    base: float, default 0.5
+        Delay in seconds of the first retry, before jitter
+    maximum: float, default 30.
+        Maximum delay in seconds, before jitter
+
+    Returns
+    -------
+    delay: float
+        Number of seconds to wait before the next attempt
+    '''
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
@@ -0,0 +1,261 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import re
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple, Union
+from urllib.parse import urlparse, parse_qs
+
+GENRES = ['Action', 'Comédie', 'Drame', 'Animation', 'Thriller', 'Familial']
+COUNTRIES = [('FR', 'France'), ('US', 'United States of America'), ('GB', 'United Kingdom')]
+
+
+def get_stub_movie_id(title: str) -> Union[int, None]:
+    '''
+    Deterministic movie id of a title. Titles starting with "unknown"
+    are never found, to mimic empty search results.
+    '''
+    if title.lower().startswith('unknown'):
+        return None
+    return zlib.crc32(title.encode('utf-8')) % 1000000 + 1
+
+
+def get_stub_movie_details(movie_id: int) -> dict:
+    genre = GENRES[movie_id % len(GENRES)]
+    country_code, country = COUNTRIES[movie_id % len(COUNTRIES)]
+    return {
+        'id': movie_id,
+        'imdb_id': f'tt{movie_id:07d}',
+        'title': f'Movie {movie_id}',
+        'original_title': f'Movie {movie_id}',
+        'original_language': country_code.lower(),
+        'overview': 'Stub movie',
+        'tagline': '',
+        'poster_path': f'/{movie_id}.jpg',
+        'popularity': float(movie_id % 100) / 3,
+        'vote_average': float(movie_id % 10),
+        'vote_count': movie_id % 1000,
+        'budget': movie_id * 100,
+        'revenue': movie_id * 300,
+        'runtime': 80 + movie_id % 60,
+        'release_date': f'{2000 + movie_id % 21}-{1 + movie_id % 12:02d}-{1 + movie_id % 28:02d}',
+        'adult': False,
+        'video': False,
+        'status': 'Released',
+        'belongs_to_collection': {'id': movie_id % 50, 'name': f'Collection {movie_id % 50}'} if movie_id % 5 == 0 else None,
+        'genres': [{'id': GENRES.index(genre), 'name': genre}],
+        'production_companies': [{'id': movie_id % 30, 'name': f'Company {movie_id % 30}', 'origin_country': country_code}],
+        'production_countries': [{'iso_3166_1': country_code, 'name': country}],
+        'spoken_languages': [{'iso_639_1': country_code.lower(), 'name': country}],
+    }
+
+
+def get_stub_movie_credits(movie_id: int) -> dict:
+    cast = []
+    for order in range(8):
+        actor_id = (movie_id * 7 + order * 13) % 5000
+        cast.append({
+            'adult': False,
+            'id': actor_id,
+            'name': f'Actor {actor_id}',
+            'gender': actor_id % 3,
+            'popularity': float(actor_id % 40) / 4,
+            'known_for_department': 'Acting',
+            'character': f'Character {order}',
+            'order': order,
+        })
+    return {'id': movie_id, 'cast': cast, 'crew': []}
+
+
+class StubTMDbHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def route(self, path: str, params: dict) -> Tuple[int, dict]:
+        if path == '/3/search/movie':
+            movie_id = get_stub_movie_id(params.get('query', [''])[0])
+            results = [] if movie_id is None else [{
+                'id': movie_id,
+                'title': params['query'][0],
+                'release_date': get_stub_movie_details(movie_id)['release_date'],
+            }]
+            for year_filter in ['year', 'primary_release_year']:
+                if year_filter in params:
+                    results = [result for result in results if result['release_date'][:4] == params[year_filter][0]]
+            return 200, {'page': 1, 'results': results, 'total_results': len(results), 'total_pages': 1}
+        if path == '/3/movie/changes':
+            return self.server.get_changes(
+                params['start_date'][0], params['end_date'][0], int(params.get('page', ['1'])[0]))
+        match = re.fullmatch(r'/3/movie/(\d+)(/credits)?', path)
+        if match and 0 < int(match.group(1)) <= 1000000:
+            movie_id = int(match.group(1))
+            if match.group(2):
+                return 200, get_stub_movie_credits(movie_id)
+            details = get_stub_movie_details(movie_id)
+            # Changed movies drift in popularity
+            details['popularity'] += self.server.versions[movie_id]
+            details['vote_count'] += self.server.versions[movie_id]
+            if 'credits' in params.get('append_to_response', [''])[0].split(','):
+                details['credits'] = get_stub_movie_credits(movie_id)
+            return 200, details
+        return 404, {'status_code': 34, 'status_message': 'The resource you requested could not be found.'}
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        retry_after = self.server.count_request()
+        if retry_after:
+            status, payload = 429, {'status_code': 25, 'status_message': 'Your request count is over the allowed limit.'}
+        else:
+            url = urlparse(self.path)
+            status, payload = self.route(url.path, parse_qs(url.query))
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        if retry_after:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubTMDbServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0., rate_limit: Optional[int] = None):
+        '''
+        A local HTTP server mimicking the TMDb API endpoints used by TMDbClient,
+        returning deterministic synthetic movies
+
+        Parameters
+        ----------
+        port: int, default 0
+            Port to listen to, a free one if 0
+        latency: float, default 0.
+            Delay in seconds added to each response, to mimic network round trips
+        rate_limit: Optional[int], default None
+            Number of requests allowed per second, the others are answered
+            with a 429 status and a Retry-After header. Unlimited if None.
+        '''
+        super().__init__(('127.0.0.1', port), StubTMDbHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests_count = 0
+        self.rejected_count = 0
+        self.changes = defaultdict(set)  # date -> ids of the movies changed that day
+        self.versions = Counter()  # id -> number of changes of the movie
+        self._window = (0, 0)
+        self._lock = threading.Lock()
+
+    def change_movie(self, movie_id: int, date: Optional[str] = None) -> None:
+        '''
+        Mark a movie as changed, its popularity and vote count drifting
+
+        Parameters
+        ----------
+        movie_id: int
+            a movie id (the tmdb one)
+        date: Optional[str], default None
+            date of the change, formatted as YYYY-MM-DD, today if None
+        '''
+        with self._lock:
+            self.changes[date or datetime.date.today().isoformat()].add(movie_id)
+            self.versions[movie_id] += 1
+
+    def get_changes(self, start_date: str, end_date: str, page: int, page_size: int = 100) -> Tuple[int, dict]:
+        # Same paging as TMDb changes, which only allows 14 days ranges
+        start, end = datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date)
+        if (end - start).days > 14:
+            return 422, {'success': False, 'status_code': 47, 'status_message': 'The input is not valid.'}
+        with self._lock:
+            ids = sorted({movie_id for date, movie_ids in self.changes.items()
+                          if start_date <= date <= end_date for movie_id in movie_ids})
+        results = [{'id': movie_id, 'adult': False} for movie_id in ids[(page - 1) * page_size:page * page_size]]
+        return 200, {'results': results, 'page': page, 'total_pages': max(1, -(-len(ids) // page_size)),
+                     'total_results': len(ids)}
+
+    def count_request(self) -> int:
+        # Fixed one second windows, returns the Retry-After delay of rejected requests
+        with self._lock:
+            self.requests_count += 1
+            if self.rate_limit is None:
+                return 0
+            second = int(time.time())
+            window, count = self._window
+            count = count + 1 if window == second else 1
+            self._window = (second, count)
+            if count > self.rate_limit:
+                self.rejected_count += 1
+                return 1
+            return 0
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/3'
+
+
+def start_stub_server(port: int = 0, latency: float = 0., rate_limit: Optional[int] = None) -> StubTMDbServer:
+    '''
+    Start a stub TMDb server in a background thread. Stop it with server.shutdown()
+
+    Parameters
+    ----------
+    port: int, default 0
+        Port to listen to, a free one if 0
+    latency: float, default 0.
+        Delay in seconds added to each response
+    rate_limit: Optional[int], default None
+        Number of requests allowed per second, unlimited if None
+
+    Returns
+    -------
+    server: StubTMDbServer
+        The running server, its API root url is server.url
+    '''
+    server = StubTMDbServer(port=port, latency=latency, rate_limit=rate_limit)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a local stub of TMDb API')
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.)
+    parser.add_argument("--rate-limit", type=int, default=None)
+    parser.add_argument("--changed-ids", type=int, nargs='*', default=[],
+        help='Ids of movies marked as changed today')
+    args = parser.parse_args()
+
+    server = StubTMDbServer(port=args.port, latency=args.latency, rate_limit=args.rate_limit)
+    for movie_id in args.changed_ids:
+        server.change_movie(movie_id)
+    print(f"Serving stub TMDb API on {server.url}")
+    server.serve_forever()
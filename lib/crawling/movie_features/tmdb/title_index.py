@@ -0,0 +1,306 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Iterable, Optional, Union
+from lib.crawling.movie_features.tmdb.query_planner import parse_title
+
+NGRAM_SIZE = 3
+# Release years differ by a year between countries or festivals, and between TMDb and the box office chart
+MAX_YEAR_GAP = 1
+ROMAN_NUMERALS = {'i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix', 'x'}
+
+
+def normalize_title(title: str) -> str:
+    '''
+    Normalize a movie title so that spelling variants share one key:
+    lower case, no accents, no punctuation and single spaces
+
+    Parameters
+    ----------
+    title: str
+        a movie title, e.g. "Astérix & Obélix : Mission Cléopâtre"
+
+    Returns
+    -------
+    title: str
+        the normalized title, e.g. "asterix obelix mission cleopatre"
+    '''
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(char for char in title if not unicodedata.combining(char)).lower()
+    return ' '.join(re.findall(r'\w+', title))
+
+
+def get_ngrams(title: str, n: int = NGRAM_SIZE) -> set:
+    '''
+    Character n-grams of a normalized title, padded with spaces so that short titles have some
+    '''
+    title = f' {title} '
+    return {title[i:i + n] for i in range(max(1, len(title) - n + 1))}
+
+
+def get_numbers(title: str) -> frozenset:
+    '''
+    Numbers of a normalized title, which tell sequels apart, e.g. {"2"} for "toy story 2"
+    '''
+    return frozenset(re.findall(r'\d+', title)) | frozenset(word for word in title.split() if word in ROMAN_NUMERALS)
+
+
+def get_shard_index_path(path: str, shard: int) -> str:
+    '''
+    Path of the title index saved by one shard of a crawl, e.g. "data/tmdb_title_index_shard2.json"
+    for shard 2 of "data/tmdb_title_index.json". Shards save their own index, since concurrent
+    saves of a shared one would keep only the entries of the last writer.
+    '''
+    root, extension = os.path.splitext(path)
+    return f'{root}_shard{shard}{extension}'
+
+
+class TitleIndex:
+
+    def __init__(self, min_similarity: float = 0.8):
+        '''
+        A local index of TMDb ids by normalized title and release year, so that
+        titles matched in earlier crawls do not need a search request
+
+        Exact lookups use a dictionary of normalized titles. Approximate lookups
+        compare character n-grams of the candidate titles sharing an n-gram with
+        the query, found through an inverted index. Candidates must have the same
+        numbers as the query, so that sequels are not mistaken for each other.
+        Both accept release years up to MAX_YEAR_GAP away from the wanted one.
+
+        Parameters
+        ----------
+        min_similarity: float, default 0.8
+            Minimum Dice similarity between n-gram sets of an approximate match
+        '''
+        self.min_similarity = min_similarity
+        self.entries = []  # (normalized title, year, tmdb id)
+        self.ids_by_title = defaultdict(dict)  # normalized title -> {year: tmdb id}
+        self.entries_by_ngram = defaultdict(list)
+        self.ngram_counts = []
+        self.numbers = []
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        # Lookups and additions happen on the threads of the async client, find nests get and search
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, title: str, tmdb_id: int, year: Optional[int] = None) -> None:
+        '''
+        Add a matched title to the index
+
+        Parameters
+        ----------
+        title: str
+            a movie title, as queried or as found in TMDb
+        tmdb_id: int
+            the tmdb id of the movie
+        year: Optional[int], default None
+            the release year of the movie
+        '''
+        title = normalize_title(title)
+        if not title:
+            return
+        with self._lock:
+            if self.ids_by_title[title].get(year) == tmdb_id:
+                return
+            self.ids_by_title[title][year] = tmdb_id
+            entry = len(self.entries)
+            self.entries.append((title, year, tmdb_id))
+            ngrams = get_ngrams(title)
+            for ngram in ngrams:
+                self.entries_by_ngram[ngram].append(entry)
+            self.ngram_counts.append(len(ngrams))
+            self.numbers.append(get_numbers(title))
+            self.dirty = True
+
+    def add_movie_features(self, movies: Iterable[dict]) -> None:
+        '''
+        Add crawled movie cards to the index, under their query (without year nor
+        disambiguators), French and original titles
+
+        Parameters
+        ----------
+        movies: Iterable[dict]
+            movie cards, as saved by bin/get_movie_features.py
+        '''
+        for movie in movies:
+            year = int(movie['release_date'][:4]) if movie.get('release_date') else None
+            if movie.get('query'):
+                self.add(parse_title(movie['query'])['title'], movie['tmdb_id'], year)
+            for field in ['title', 'original_title']:
+                if movie.get(field):
+                    self.add(movie[field], movie['tmdb_id'], year)
+
+    def get(self, title: str, year: Optional[int] = None) -> Union[int, None]:
+        '''
+        Exact lookup of a title
+
+        Parameters
+        ----------
+        title: str
+            a movie title
+        year: Optional[int], default None
+            the release year of the movie, if known
+
+        Returns
+        -------
+        id: Union[int, None]
+            the tmdb id, None if the title is unknown or ambiguous, e.g. several
+            movies released under this title and no year to tell them apart
+        '''
+        title = normalize_title(title)
+        with self._lock:
+            ids = self.ids_by_title.get(title)
+            if not ids:
+                return None
+            if year is not None:
+                if year in ids:
+                    return ids[year]
+                distinct_ids = {ids[gap_year] for gap_year in range(year - MAX_YEAR_GAP, year + MAX_YEAR_GAP + 1)
+                                if gap_year in ids}
+                if not distinct_ids:
+                    return ids.get(None)
+            else:
+                distinct_ids = set(ids.values())
+        if len(distinct_ids) == 1:
+            return distinct_ids.pop()
+        return None
+
+    def search(self, title: str, year: Optional[int] = None) -> Union[int, None]:
+        '''
+        Approximate lookup of a title, for spelling variants
+
+        Parameters
+        ----------
+        title: str
+            a movie title
+        year: Optional[int], default None
+            the release year of the movie, if known. Candidates released more than
+            MAX_YEAR_GAP years away are ignored.
+
+        Returns
+        -------
+        id: Union[int, None]
+            the tmdb id of the most similar title, None if none is similar enough or if the best
+            matches point to different movies
+        '''
+        title = normalize_title(title)
+        ngrams, numbers = get_ngrams(title), get_numbers(title)
+        # A title similar enough shares at least `min_shared` n-grams with the query, hence one of its
+        # len(ngrams) - min_shared + 1 rarest n-grams: only their postings are scanned to find candidates,
+        # the frequent n-grams are then looked up in their sorted postings for these candidates only
+        min_shared = math.ceil(self.min_similarity * len(ngrams) / (2 - self.min_similarity))
+        best_similarity, best_ids = 0., set()
+        with self._lock:
+            postings = sorted((self.entries_by_ngram.get(ngram, []) for ngram in ngrams), key=len)
+            nb_scanned = len(ngrams) - max(min_shared, 1) + 1
+            shared_counts = Counter()
+            for entries in postings[:nb_scanned]:
+                shared_counts.update(entries)
+            for entries in postings[nb_scanned:]:
+                for entry in shared_counts:
+                    position = bisect.bisect_left(entries, entry)
+                    if position < len(entries) and entries[position] == entry:
+                        shared_counts[entry] += 1
+            for entry, shared_count in shared_counts.items():
+                entry_title, entry_year, tmdb_id = self.entries[entry]
+                if year is not None and entry_year is not None and abs(entry_year - year) > MAX_YEAR_GAP:
+                    continue
+                if self.numbers[entry] != numbers:
+                    continue
+                similarity = 2 * shared_count / (len(ngrams) + self.ngram_counts[entry])
+                if similarity > best_similarity:
+                    best_similarity, best_ids = similarity, {tmdb_id}
+                elif similarity == best_similarity:
+                    best_ids.add(tmdb_id)
+        if best_similarity >= self.min_similarity and len(best_ids) == 1:
+            return best_ids.pop()
+        return None
+
+    def find(self, title: str, year: Optional[int] = None) -> Union[int, None]:
+        '''
+        Exact lookup of a title, falling back on an approximate one
+
+        Parameters
+        ----------
+        title: str
+            a movie title
+        year: Optional[int], default None
+            the release year of the movie, if known
+
+        Returns
+        -------
+        id: Union[int, None]
+            the tmdb id, None if not found
+        '''
+        with self._lock:
+            tmdb_id = self.get(title, year)
+            if tmdb_id is None:
+                tmdb_id = self.search(title, year)
+            if tmdb_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return tmdb_id
+
+    def save(self, path: str) -> None:
+        '''
+        Save the index entries to a json file
+        '''
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            payload = {'min_similarity': self.min_similarity, 'entries': self.entries}
+            # Written aside then moved, so that an interrupted save keeps the previous index
+            temporary_path = f'{path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(temporary_path, path)
+            self.dirty = False
+
+    def update(self, other: 'TitleIndex') -> None:
+        '''
+        Add the entries of another index, e.g. the one saved by a shard of a crawl
+        '''
+        with other._lock:
+            entries = list(other.entries)
+        for title, year, tmdb_id in entries:
+            self.add(title, tmdb_id, year)
+
+    @classmethod
+    def load(cls, path: str) -> 'TitleIndex':
+        '''
+        Load an index saved with `save`, rebuilding its n-gram postings
+        '''
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        index = cls(min_similarity=payload['min_similarity'])
+        for title, year, tmdb_id in payload['entries']:
+            index.add(title, tmdb_id, year)
+        index.dirty = False
+        return index
@@ -87,6 +87,7 @@ class MovieDetails(TypedDict):
 
 class MovieCard(MovieDetails):
     cast: MovieCast
+    match_strategy: str # Search which found the movie from its title
 
 
 def unmarshal_credits(credits: dict) -> MovieCast:
@@ -113,7 +114,7 @@ def unmarshal_credits(credits: dict) -> MovieCast:
             'tmdb_popularity': cast['popularity'],
             'order': cast['order']
         }
-    for cast in credits.cast ] if credits.cast else []
+    for cast in credits['cast'] ] if credits.get('cast') else []
 
 
 def unmarshal_details(details: dict) -> MovieDetails:
@@ -132,41 +133,61 @@ def unmarshal_details(details: dict) -> MovieDetails:
         A movie card
     '''
     return {
-        'tmdb_id': details.id,
-        'adult': details.adult,
-        'belongs_to_collection': unmarshal_collection(details.belongs_to_collection) \
-            if details.belongs_to_collection \
+        'tmdb_id': details['id'],
+        'adult': details['adult'],
+        'belongs_to_collection': unmarshal_collection(details['belongs_to_collection']) \
+            if details.get('belongs_to_collection') \
             else {},
-        'budget': details.budget,
-        'genres': unmarshal_genres(details.genres) \
-            if details.genres \
+        'budget': details['budget'],
+        'genres': unmarshal_genres(details['genres']) \
+            if details.get('genres') \
             else [],
-        'imdb_id': details.imdb_id,
-        'original_language': details.original_language,
-        'original_title': details.original_title,
-        'overview': details.overview,
-        'tmdb_popularity': details.popularity,
-        'production_companies': unmarshal_prodcompanies(details.production_companies) \
-            if details.production_companies \
+        'imdb_id': details['imdb_id'],
+        'original_language': details['original_language'],
+        'original_title': details['original_title'],
+        'overview': details['overview'],
+        'tmdb_popularity': details['popularity'],
+        'production_companies': unmarshal_prodcompanies(details['production_companies']) \
+            if details.get('production_companies') \
             else [],
-        'production_countries': unmarshal_prodcountries(details.production_countries) \
-            if details.production_countries \
+        'production_countries': unmarshal_prodcountries(details['production_countries']) \
+            if details.get('production_countries') \
             else [],
-        'release_date': details.release_date,
-        'revenue': details.revenue,
-        'runtime': details.runtime, 
-        'languages': unmarshal_languages(details.spoken_languages) \
-            if details.spoken_languages \
+        'release_date': details['release_date'],
+        'revenue': details['revenue'],
+        'runtime': details['runtime'], 
+        'languages': unmarshal_languages(details['spoken_languages']) \
+            if details.get('spoken_languages') \
             else [],
-        'status': details.status,
-        'tagline': details.tagline,
-        'title': details.title,
-        'tmdb_vote_count': details.vote_count,
-        'tmdb_vote_average': details.vote_average,
-        'poster_path': details.poster_path
+        'status': details['status'],
+        'tagline': details['tagline'],
+        'title': details['title'],
+        'tmdb_vote_count': details['vote_count'],
+        'tmdb_vote_average': details['vote_average'],
+        'poster_path': details['poster_path']
     }
 
 
+def unmarshal_card(details: dict) -> MovieCard:
+    '''
+    Decompose a TMDb movie details response with appended
+    credits into a movie card
+
+    Parameters
+    ----------
+    details: dict
+        the movie details response, requested with append_to_response=credits
+
+    Returns
+    -------
+    card: MovieCard
+        A movie card, with its cast
+    '''
+    card = unmarshal_details(details)
+    card['cast'] = unmarshal_credits(details.get('credits') or {})
+    return card
+
+
 def unmarshal_prodcompanies(companies: List[dict]) -> List[ProdCompany]:
     '''
     Decompose a TMDb production companies array 
@@ -0,0 +1,152 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+from functools import lru_cache
+import holidays
+import numpy as np
+import pandas as pd
+from config import CALENDAR_COLS, CALENDAR_END_YEAR, CALENDAR_FILEPATH, CALENDAR_START_YEAR
+from loguru import logger
+from vacances_scolaires_france import SchoolHolidayDates, UnsupportedYearException
+
+
+def build_calendar_table(start_year: int, end_year: int) -> np.ndarray:
+    '''
+    Build the French calendar features for every day
+    from January 1st of `start_year` to December 31st of `end_year`
+
+    Columns follow `CALENDAR_COLS`:
+    - vacances_zone_a, vacances_zone_b, vacances_zone_c: 1 if the zone is on school holiday
+    - jour_ferie: 1 if it is a bank holiday
+    - holiday: sum of the four features above, on days listed in the school holidays
+      data only (0 on bank holidays outside of it, as in the original encoding)
+    - month, cos_month: month of the year and its cosine over a 12 months period
+
+    Years without school holidays data (e.g. too far in the future) only get bank holidays.
+
+    Parameters
+    ----------
+    start_year: int
+        First year of the table
+    end_year: int
+        Last year of the table (included)
+
+    Returns
+    -------
+    table: np.ndarray
+        (n_days, len(CALENDAR_COLS)) float32 array, one row per day
+    '''
+    dates = pd.date_range(f'{start_year}-01-01', f'{end_year}-12-31', freq='D')
+    table = np.zeros((len(dates), len(CALENDAR_COLS)), dtype=np.float32)
+    start = np.datetime64(f'{start_year}-01-01', 'D')
+    zone_cols = ['vacances_zone_a', 'vacances_zone_b', 'vacances_zone_c']
+    in_school_holidays = np.zeros(len(dates), dtype=bool)
+
+    # Load school holidays for France
+    fr_holidays = SchoolHolidayDates()
+    for year in range(start_year, end_year + 1):
+        try:
+            school_holidays = fr_holidays.holidays_for_year(year)
+        except UnsupportedYearException:
+            logger.warning(f'No school holidays data for year {year}')
+            continue
+        rows = (np.array(list(school_holidays), dtype='datetime64[D]') - start).astype(int)
+        in_school_holidays[rows] = True
+        for zone_col in zone_cols:
+            table[rows, CALENDAR_COLS.index(zone_col)] = [day[zone_col] for day in school_holidays.values()]
+
+    # Load bank holidays for France
+    bank_holidays = holidays.FRA(years=range(start_year, end_year + 1))
+    rows = (np.array(list(bank_holidays), dtype='datetime64[D]') - start).astype(int)
+    table[rows, CALENDAR_COLS.index('jour_ferie')] = 1
+
+    # Combined school and bank holidays feature. The original encoding merged bank holidays
+    # into the school holidays days, leaving it missing, then 0, on the other days
+    table[:, CALENDAR_COLS.index('holiday')] = table[:, [CALENDAR_COLS.index(col) for col in zone_cols + ['jour_ferie']]] \
+        .sum(axis=1) * in_school_holidays
+    table[:, CALENDAR_COLS.index('month')] = dates.month
+    table[:, CALENDAR_COLS.index('cos_month')] = 2 * np.cos(2 * np.pi * dates.month / 12)
+    return table
+
+
+@lru_cache(maxsize=None)
+def load_calendar_table(start_year: int = CALENDAR_START_YEAR, end_year: int = CALENDAR_END_YEAR) -> np.ndarray:
+    '''
+    Memory-map the calendar features table, building and saving it
+    to `CALENDAR_FILEPATH` on first use
+
+    Parameters
+    ----------
+    start_year: int, default CALENDAR_START_YEAR
+        First year of the table
+    end_year: int, default CALENDAR_END_YEAR
+        Last year of the table (included)
+
+    Returns
+    -------
+    table: np.ndarray
+        Read-only (n_days, len(CALENDAR_COLS)) float32 array, see `build_calendar_table`
+    '''
+    path = CALENDAR_FILEPATH.format(start_year=start_year, end_year=end_year)
+    if not os.path.isfile(path):
+        logger.info(f'building calendar features from {start_year} to {end_year}...')
+        table = build_calendar_table(start_year, end_year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, table)
+        logger.info(f'Calendar features saved to {path}')
+    return np.load(path, mmap_mode='r')
+
+
+def get_calendar_features(
+        release_dates: np.ndarray,
+        start_year: int = CALENDAR_START_YEAR,
+        end_year: int = CALENDAR_END_YEAR) -> np.ndarray:
+    '''
+    Look up the calendar features of each release date
+
+    Dates outside of the precomputed range, or missing, get no holiday
+    features but still get their month features.
+
+    Parameters
+    ----------
+    release_dates: np.ndarray
+        Array of release dates, castable to datetime64[D]
+    start_year: int, default CALENDAR_START_YEAR
+        First year of the table
+    end_year: int, default CALENDAR_END_YEAR
+        Last year of the table (included)
+
+    Returns
+    -------
+    features: np.ndarray
+        (n_dates, len(CALENDAR_COLS)) float32 array
+    '''
+    table = load_calendar_table(start_year, end_year)
+    release_dates = np.asarray(release_dates, dtype='datetime64[D]')
+    rows = (release_dates - np.datetime64(f'{start_year}-01-01', 'D')).astype(np.int64)
+    in_range = ~np.isnat(release_dates) & (rows >= 0) & (rows < len(table))
+
+    features = np.zeros((len(release_dates), len(CALENDAR_COLS)), dtype=np.float32)
+    features[in_range] = table[rows[in_range]]
+
+    out_of_range = ~in_range & ~np.isnat(release_dates)
+    if out_of_range.any():
+        logger.warning(f'{out_of_range.sum()} release dates out of calendar range {start_year}-{end_year}')
+        months = release_dates[out_of_range].astype('datetime64[M]').astype(int) % 12 + 1
+        features[out_of_range, CALENDAR_COLS.index('month')] = months
+        features[out_of_range, CALENDAR_COLS.index('cos_month')] = 2 * np.cos(2 * np.pi * months / 12)
+    return features
@@ -0,0 +1,280 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+from lib.crawling.movie_features.records import MovieRecord
+from lib.crawling.movie_features.types import MovieCast
+from lib.utils.io import iter_json_records
+from loguru import logger
+
+
+class CastTable:
+
+    def __init__(
+            self,
+            movie_ids: np.ndarray,
+            offsets: np.ndarray,
+            actor_ids: np.ndarray,
+            popularity: np.ndarray,
+            gender: np.ndarray,
+            order: np.ndarray,
+            actor_names: Dict[int, str]):
+        '''
+        Columnar storage of the cast of many movies, instead of one list
+        of `MovieMember` dicts per movie.
+
+        Members of the movie `movie_ids[i]` are the rows
+        `offsets[i]:offsets[i+1]` of the member columns, in credits order.
+        Actor names are interned in one `actor_id -> name` table.
+
+        Parameters
+        ----------
+        movie_ids: np.ndarray
+            (n_movies,) int64 movie ids (the dataset ones)
+        offsets: np.ndarray
+            (n_movies + 1,) int32 start of each movie cast
+        actor_ids: np.ndarray
+            (n_members,) int32 TMDb ids of the cast members
+        popularity: np.ndarray
+            (n_members,) float32 TMDb popularities
+        gender: np.ndarray
+            (n_members,) int8 genders (2 for male)
+        order: np.ndarray
+            (n_members,) int16 orders in credits (the lower the most important)
+        actor_names: Dict[int, str]
+            Name of each actor id
+        '''
+        self.movie_ids = movie_ids
+        self.offsets = offsets
+        self.actor_ids = actor_ids
+        self.popularity = popularity
+        self.gender = gender
+        self.order = order
+        self.actor_names = actor_names
+        self._movie_rows = {movie_id: row for row, movie_id in enumerate(movie_ids.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.movie_ids)
+
+    @classmethod
+    def from_casts(cls, movie_ids: Iterable[int], casts: Iterable[MovieCast]) -> 'CastTable':
+        '''
+        Build a cast table from movie casts, as found in the movie features
+
+        Parameters
+        ----------
+        movie_ids: Iterable[int]
+            Movie ids
+        casts: Iterable[MovieCast]
+            Cast of each movie
+
+        Returns
+        -------
+        cast_table: CastTable
+            The cast table
+        '''
+        return cls.from_movie_casts(zip(movie_ids, casts))
+
+    @classmethod
+    def from_movie_casts(cls, movie_casts: Iterable[Tuple[int, MovieCast]]) -> 'CastTable':
+        '''
+        Build a cast table from (movie id, cast) pairs, consumed one at a time into
+        typed column buffers, so that the casts never need to be all in memory
+
+        Parameters
+        ----------
+        movie_casts: Iterable[Tuple[int, MovieCast]]
+            Id and cast of each movie
+
+        Returns
+        -------
+        cast_table: CastTable
+            The cast table
+        '''
+        movie_ids, offsets = array('q'), array('q', [0])
+        actor_ids, popularity, gender, order = array('i'), array('f'), array('b'), array('h')
+        actor_names = {}
+        for movie_id, cast in movie_casts:
+            movie_ids.append(movie_id)
+            offsets.append(offsets[-1] + len(cast))
+            for member in cast:
+                actor_ids.append(member['tmdb_id'])
+                popularity.append(member['tmdb_popularity'])
+                gender.append(member['gender'])
+                order.append(member['order'])
+                actor_names.setdefault(member['tmdb_id'], member['name'])
+        return cls(
+            np.array(movie_ids, dtype=np.int64),
+            np.array(offsets, dtype=np.int32),
+            np.array(actor_ids, dtype=np.int32),
+            np.array(popularity, dtype=np.float32),
+            np.array(gender, dtype=np.int8),
+            np.array(order, dtype=np.int16),
+            actor_names)
+
+    @classmethod
+    def from_records(cls, movie_ids: Iterable[int], records: Iterable[MovieRecord]) -> 'CastTable':
+        '''
+        Build a cast table from movie records, see `TMDbClient.get_movie_record`
+
+        Parameters
+        ----------
+        movie_ids: Iterable[int]
+            Movie ids
+        records: Iterable[MovieRecord]
+            Record of each movie
+
+        Returns
+        -------
+        cast_table: CastTable
+            The cast table
+        '''
+        movie_ids = np.fromiter(movie_ids, dtype=np.int64)
+        cast_sizes = [0]
+        members = []
+        for record in records:
+            cast_sizes.append(len(record.cast))
+            members.extend(record.cast)
+        return cls(
+            movie_ids,
+            np.cumsum(cast_sizes, dtype=np.int64).astype(np.int32),
+            np.array([member.tmdb_id for member in members], dtype=np.int32),
+            np.array([member.tmdb_popularity for member in members], dtype=np.float32),
+            np.array([member.gender for member in members], dtype=np.int8),
+            np.array([member.order for member in members], dtype=np.int16),
+            {member.tmdb_id: member.name for member in reversed(members)})
+
+    @classmethod
+    def from_movie_features_json(cls, path: str) -> 'CastTable':
+        '''
+        Build a cast table from a movie features json, as written by
+        bin/get_movie_features.py, parsing one movie at a time
+
+        Parameters
+        ----------
+        path: str
+            path to the movie features json
+
+        Returns
+        -------
+        cast_table: CastTable
+            The cast table
+        '''
+        return cls.from_movie_casts((int(item['id']), item['cast']) for item in iter_json_records(path))
+
+    def save(self, path: str):
+        '''
+        Save the cast table as a .npz file
+
+        Parameters
+        ----------
+        path: str
+            path to the .npz file
+        '''
+        names_actor_ids = np.fromiter(self.actor_names.keys(), dtype=np.int32, count=len(self.actor_names))
+        np.savez(
+            path,
+            movie_ids=self.movie_ids,
+            offsets=self.offsets,
+            actor_ids=self.actor_ids,
+            popularity=self.popularity,
+            gender=self.gender,
+            order=self.order,
+            names_actor_ids=names_actor_ids,
+            names=np.array(list(self.actor_names.values()), dtype=str))
+        logger.info(f'Cast table saved to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'CastTable':
+        '''
+        Load a cast table saved with `save`
+
+        Parameters
+        ----------
+        path: str
+            path to the .npz file
+
+        Returns
+        -------
+        cast_table: CastTable
+            The cast table
+        '''
+        with np.load(path) as arrays:
+            return cls(
+                arrays['movie_ids'],
+                arrays['offsets'],
+                arrays['actor_ids'],
+                arrays['popularity'],
+                arrays['gender'],
+                arrays['order'],
+                dict(zip(arrays['names_actor_ids'].tolist(), arrays['names'].tolist())))
+
+    def get_movie_rows(self, movie_ids: Iterable[int]) -> np.ndarray:
+        '''
+        Row of each movie in the table, -1 for unknown movies
+        '''
+        return np.fromiter((self._movie_rows.get(movie_id, -1) for movie_id in movie_ids), dtype=np.int64)
+
+    def get_top_members(self, movie_ids: Iterable[int], top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Rows of the top `top_n` members of each movie, as a ragged array
+
+        Parameters
+        ----------
+        movie_ids: Iterable[int]
+            Movie ids, unknown movies get an empty cast
+        top_n: int
+            Maximum number of members per movie
+
+        Returns
+        -------
+        members: Tuple[np.ndarray, np.ndarray]
+            Member rows, and (n_movies + 1,) offsets of each movie in them
+        '''
+        rows = self.get_movie_rows(movie_ids)
+        starts = np.where(rows >= 0, self.offsets[:-1][rows], 0)
+        cast_sizes = np.where(rows >= 0, np.minimum(np.diff(self.offsets)[rows], top_n), 0)
+        offsets = np.concatenate([[0], np.cumsum(cast_sizes)])
+        member_rows = np.repeat(starts - offsets[:-1], cast_sizes) + np.arange(offsets[-1])
+        return member_rows, offsets
+
+    def get_top_actors(self, movie_ids: Iterable[int], top_n: int) -> np.ndarray:
+        '''
+        Ids of the top `top_n` actors of each movie
+
+        Parameters
+        ----------
+        movie_ids: Iterable[int]
+            Movie ids
+        top_n: int
+            Number of actors per movie
+
+        Returns
+        -------
+        actors: np.ndarray
+            (n_movies, top_n) float array of actor ids, NaN when the cast is shorter
+        '''
+        member_rows, offsets = self.get_top_members(movie_ids, top_n)
+        actors = np.full((len(offsets) - 1, top_n), np.nan)
+        cast_sizes = np.diff(offsets)
+        movies = np.repeat(np.arange(len(cast_sizes)), cast_sizes)
+        actors[movies, np.arange(len(member_rows)) - offsets[:-1][movies]] = self.actor_ids[member_rows]
+        return actors
+
+    def get_actor_names(self, actor_ids: Iterable[int]) -> List[str]:
+        return [self.actor_names.get(actor_id) for actor_id in actor_ids]
@@ -0,0 +1,196 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from collections import deque
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+
+class CollectionState:
+    __slots__ = ['nb_movies', 'recent_sales', 'recent_sales_sum', 'nb_recent_sales', 'last_release_date']
+
+    def __init__(self, window: int):
+        '''
+        Movies released so far in one collection: their number and
+        a ring buffer with the sales of the `window` most recent ones,
+        NaN if unknown, with the sum and count of the known ones
+        '''
+        self.nb_movies = 0
+        self.recent_sales = deque(maxlen=window)
+        self.recent_sales_sum = 0.
+        self.nb_recent_sales = 0
+        self.last_release_date = None
+
+    def push(self, sales: float):
+        if len(self.recent_sales) == self.recent_sales.maxlen and not np.isnan(self.recent_sales[0]):
+            self.recent_sales_sum -= self.recent_sales[0]
+            self.nb_recent_sales -= 1
+        self.recent_sales.append(sales)
+        if not np.isnan(sales):
+            self.recent_sales_sum += sales
+            self.nb_recent_sales += 1
+
+
+class CollectionStore:
+
+    def __init__(self, window: int = 10):
+        '''
+        Per collection state used to compute collection features
+        point-in-time, without rescanning history:
+        - nb_movie_collection: number of movies of the collection released so far
+        - rolling_sales_collection: mean of the known sales of the `window` previous movies of the collection
+
+        Movies must be added in chronological order, each one in O(1).
+
+        Parameters
+        ----------
+        window: int, default 10
+            Number of previous movies averaged in rolling_sales_collection
+        '''
+        self.window = window
+        self.collections: Dict[str, CollectionState] = {}
+
+    def add(self, collection_name: str, release_date: str, sales: Optional[float]):
+        '''
+        Add a released movie to its collection
+
+        Parameters
+        ----------
+        collection_name: str
+            Name of the collection
+        release_date: str
+            Release date as "YYYY-MM-DD"
+        sales: Optional[float]
+            First week sales, None or NaN if unknown (the movie still takes a place in the window)
+        '''
+        state = self.collections.get(collection_name)
+        if state is None:
+            state = self.collections[collection_name] = CollectionState(self.window)
+        if state.last_release_date is not None and release_date < state.last_release_date:
+            raise ValueError(
+                f'Movies of collection {collection_name} must be added in chronological order: '
+                f'{release_date} < {state.last_release_date}')
+        state.nb_movies += 1
+        state.last_release_date = release_date
+        state.push(np.nan if sales is None else float(sales))
+
+    def query(self, collection_name: str) -> Tuple[int, float]:
+        '''
+        Collection features of a movie about to be released in `collection_name`
+
+        Parameters
+        ----------
+        collection_name: str
+            Name of the collection
+
+        Returns
+        -------
+        features: Tuple[int, float]
+            nb_movie_collection, counting the movie itself, and
+            rolling_sales_collection, NaN if no sales of the previous movies are known
+        '''
+        state = self.collections.get(collection_name)
+        if state is None or state.nb_recent_sales == 0:
+            return (state.nb_movies if state else 0) + 1, np.nan
+        return state.nb_movies + 1, state.recent_sales_sum / state.nb_recent_sales
+
+    def get_nb_movies(self, collection_name: str) -> int:
+        '''
+        Number of movies of `collection_name` added so far
+        '''
+        state = self.collections.get(collection_name)
+        return 0 if state is None else state.nb_movies
+
+    def get_and_update_features(self, data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Compute the collection features of movies, then add them to the store
+
+        Each movie only gets features from movies released before it,
+        either already in the store or earlier in `data`.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Movies with `collection_name`, `release_date` and `sales`
+
+        Returns
+        -------
+        features: pd.DataFrame
+            nb_movie_collection and rolling_sales_collection of each movie, with the index of `data`
+            (0 and NaN for movies that are not part of a collection)
+        '''
+        features = pd.DataFrame({'nb_movie_collection': 0, 'rolling_sales_collection': np.nan}, index=data.index)
+        in_collection = data.loc[data['collection_name'].notna(), ['collection_name', 'release_date', 'sales']] \
+            .sort_values('release_date', kind='mergesort')
+        nb_movies = np.zeros(len(in_collection), dtype=int)
+        rolling_sales = np.full(len(in_collection), np.nan)
+        for i, (collection_name, release_date, sales) in enumerate(in_collection.itertuples(index=False)):
+            nb_movies[i], rolling_sales[i] = self.query(collection_name)
+            self.add(collection_name, release_date, sales)
+        features.loc[in_collection.index, 'nb_movie_collection'] = nb_movies
+        features.loc[in_collection.index, 'rolling_sales_collection'] = rolling_sales
+        return features
+
+    def save(self, path: str):
+        '''
+        Save the store as json
+
+        Parameters
+        ----------
+        path: str
+            path to the json file
+        '''
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'window': self.window,
+                'collections': {
+                    name: {
+                        'nb_movies': state.nb_movies,
+                        'recent_sales': [None if np.isnan(sales) else sales for sales in state.recent_sales],
+                        'last_release_date': state.last_release_date,
+                    } for name, state in self.collections.items()
+                }
+            }, f, ensure_ascii=False)
+        logger.info(f'Collection store saved to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'CollectionStore':
+        '''
+        Load a store saved with `save`
+
+        Parameters
+        ----------
+        path: str
+            path to the json file
+
+        Returns
+        -------
+        store: CollectionStore
+            The collection store
+        '''
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        store = cls(payload['window'])
+        for name, saved_state in payload['collections'].items():
+            state = store.collections[name] = CollectionState(store.window)
+            state.nb_movies = saved_state['nb_movies']
+            for sales in saved_state['recent_sales']:
+                state.push(np.nan if sales is None else sales)
+            state.last_release_date = saved_state['last_release_date']
+        return store
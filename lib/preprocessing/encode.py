@@ -14,14 +14,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Sequence
 from loguru import logger
-import holidays
 import numpy as np
 import pandas as pd
-from config import COUNTRY_TO_KEEP, DICT_GENRES, LANG_TO_KEEP, FEATURE_COLS_TO_KEEP
+from config import CALENDAR_COLS, COUNTRY_TO_KEEP, DICT_GENRES, LANG_TO_KEEP, FEATURE_COLS_TO_KEEP
+from lib.preprocessing.calendar_features import get_calendar_features
+from lib.preprocessing.cast_table import CastTable
+from lib.preprocessing.collection_features import CollectionStore
 from sklearn.preprocessing import MultiLabelBinarizer
-from vacances_scolaires_france import SchoolHolidayDates
 
 
 def dummy_encode(
@@ -187,18 +188,10 @@ def encode_movie_data(
     data = fill_null_and_zero_values(data, 'runtime', runtime_mean)
     data = fill_null_and_zero_values_for_countries(data)
     data['original_language'] = data['original_language'].map(lambda x: x if x in LANG_TO_KEEP else 'other')
-    data['languages'] = data['languages'].map(lambda x: reduce_lang_categories(x))
-    data['production_countries'] = data['production_countries'].map(lambda x: reduce_country_categories(x))
-    data['genres'] = data['genres'].map(lambda x: reduce_genre_categories(x))
     data = encode_bool_to_numerical(data, 'is_part_of_collection')
     data_final = pd.get_dummies(data, prefix='original_lang', columns=['original_language'], drop_first=True)
     data_final = data_final.set_index('id')
-    df_lang = get_encoded_languages_df(data_final)
-    df_genre = get_encoded_genre_df(data_final)
-    df_country = get_encoded_country_df(data_final)
-    data_final = pd.merge(data_final, df_lang, left_index=True, right_index=True) \
-               .merge(df_genre, left_index=True, right_index=True) \
-               .merge(df_country, left_index=True, right_index=True)
+    data_final = data_final.join(get_encoded_multilabel_df(data_final))
     data_final_cal = get_encoded_calendar_df(data_final)
     if drop_cols:
         data_final_cal = data_final_cal.reindex(columns=FEATURE_COLS_TO_KEEP)
@@ -218,24 +211,27 @@ def reduce_genre_categories(genre_list, dict_genres=DICT_GENRES):
     return list(set([dict_genres[el] for el in genre_list]))
 
 
+MULTILABEL_ENCODINGS = [
+    # (column to encode, prefix of the encoded columns, reduction of its categories)
+    ('languages', 'available_lang_', reduce_lang_categories),
+    ('genres', '', reduce_genre_categories),
+    ('production_countries', 'prod_', reduce_country_categories),
+]
+
+
 def fill_null_and_zero_values(data, col_name, value):
     data.loc[(data[col_name] == 0) | (data[col_name].isnull()), col_name] = value
     return data
 
 
 def fill_null_and_zero_values_for_countries(data):
-    # For all movies where the production country is empty and the original language is french, we suppose that the
-    # production country is France
-    data.loc[(data.astype(str)['production_countries'] == '[]') & (
-        data['original_language'] == 'fr'), 'production_countries'] = ['FR']
-
-    # For all movies where the production country is empty and the original language is english, we suppose that the
-    # production country is USA
-    data.loc[(data.astype(str)['production_countries'] == '[]') & (
-        data['original_language'] == 'en'), 'production_countries'] = ['US']
-
-    # Elsewhere we put 'Other'
-    data.loc[(data.astype(str)['production_countries'] == '[]'), 'production_countries'] = ['OTHER']
+    # For all movies where the production country is empty, we suppose that the production country is France if the
+    # original language is french, USA if it is english, and 'Other' elsewhere
+    is_empty = data['production_countries'].str.len() == 0
+    default_countries = {'fr': ['FR'], 'en': ['US']}
+    data.loc[is_empty, 'production_countries'] = pd.Series(
+        [default_countries.get(language, ['OTHER']) for language in data.loc[is_empty, 'original_language']],
+        index=data.index[is_empty], dtype=object)
     return data
 
 
@@ -248,73 +244,101 @@ def encode_bool_to_numerical(data, col_name):
     return data
 
 
-def get_encoded_languages_df(data_final):
-    # Languages
-    mlb = MultiLabelBinarizer()
-    # Create a new dataset 'df_lang' that will contain one binary column for each language
-    # (ex: available_lang_fr takes 1 if 'fr' was in the column 'languages', else 0)
-    df_lang = pd.DataFrame(mlb.fit_transform(data_final['languages']), columns=mlb.classes_, index=data_final.index)
-    df_lang.columns = ['available_lang_' + col for col in df_lang.columns]
-    return df_lang
+def get_encoded_multilabel_df(data_final):
+    # Languages, genres and production countries are encoded together: raw TMDb codes are mapped to the column of
+    # their reduced category through lookup tables (ex: available_lang_fr takes 1 if 'fr' was in the column
+    # 'languages', else 0), then all columns are filled in a single pass
+    columns = []
+    lookups = []
+    for col_name, prefix, reduce_categories in MULTILABEL_ENCODINGS:
+        raw_categories = set(category for categories in set(map(tuple, data_final[col_name])) for category in categories)
+        reduced_categories = {category: reduce_categories([category])[0] for category in raw_categories}
+        field_columns = sorted(set(reduced_categories.values()))
+        offset = len(columns)
+        lookups.append({
+            category: offset + field_columns.index(reduced) for category, reduced in reduced_categories.items()
+        })
+        columns.extend([prefix + col for col in field_columns])
+    block = multi_hot_encode(
+        [data_final[col_name] for col_name, _, _ in MULTILABEL_ENCODINGS], lookups, len(data_final), len(columns))
+    return pd.DataFrame(block, columns=columns, index=data_final.index)
+
+
+def multi_hot_encode(
+        columns: List[Iterable[Iterable[str]]],
+        lookups: List[Dict[str, int]],
+        n_rows: int,
+        n_cols: int,
+        unknown_cols: Optional[List[int]] = None,
+        out: Optional[np.ndarray] = None) -> np.ndarray:
+    '''
+    Encodes several multilabel columns into one multi-hot block in a single pass.
 
+    Each raw category is mapped to its column index through the lookup table
+    of its field. Identical lists of categories are only resolved once.
 
-def get_encoded_genre_df(data_final):
-    # Genres
-    mlb = MultiLabelBinarizer()
-    df_genre = pd.DataFrame(mlb.fit_transform(data_final['genres']), columns=mlb.classes_, index=data_final.index)
-    return df_genre
+    E.g:
+        multi_hot_encode(
+            [[['fr'], ['en', 'fr']], [['FR'], ['US']]],
+            [{'en': 0, 'fr': 1}, {'FR': 2, 'US': 3}],
+            2,
+            4
+        )
 
+            ```
+            [[0, 1, 1, 0],
+             [1, 1, 0, 1]]
+            ```
 
-def get_encoded_country_df(data_final):
-    # Production countries
-    mlb = MultiLabelBinarizer()
-    df_country = pd.DataFrame(mlb.fit_transform(data_final['production_countries']), columns=mlb.classes_,
-                            index=data_final.index)
-    df_country.columns = ['prod_' + col for col in df_country.columns]
-    return df_country
+    Parameters
+    ----------
+    columns: List[Iterable[Iterable[str]]]
+        For each field, the list of categories of each row
+    lookups: List[Dict[str, int]]
+        For each field, raw category -> column index
+    n_rows: int
+        Number of rows
+    n_cols: int
+        Number of columns of the block
+    unknown_cols: Optional[List[int]], default None
+        For each field, column index of categories missing from the lookup table.
+        -1, the default, ignores them
+    out: Optional[np.ndarray], default None
+        If provided, an (n_rows, n_cols) array to fill instead of a new uint8 block
+
+    Returns
+    -------
+    block: np.ndarray
+        (n_rows, n_cols) multi-hot block
+    '''
+    if unknown_cols is None:
+        unknown_cols = [-1] * len(columns)
+    interned = [{} for _ in columns]
+    rows = []
+    cols = []
+    for row, row_categories in enumerate(zip(*columns)):
+        for field, categories in enumerate(row_categories):
+            key = tuple(categories)
+            indices = interned[field].get(key)
+            if indices is None:
+                lookup = lookups[field]
+                indices = tuple(set(lookup.get(category, unknown_cols[field]) for category in key) - {-1})
+                interned[field][key] = indices
+            rows.extend([row] * len(indices))
+            cols.extend(indices)
+    block = np.zeros((n_rows, n_cols), dtype=np.uint8) if out is None else out
+    block[rows, cols] = 1
+    return block
 
 
 def get_encoded_calendar_df(data_final):
-    # Load school holidays for France
-    fr_holidays = SchoolHolidayDates()
-    df_vacances = pd.DataFrame()
-    for year in list(set(data_final['year'])):
-        df_vacances = pd.concat([df_vacances, pd.DataFrame.from_dict(fr_holidays.holidays_for_year(year)).T])
-
-    # Load bank holidays for France
-    df_jf = pd.DataFrame()
-    for year in list(set(data_final['year'])):
-        df_jf = pd.concat([df_jf, pd.DataFrame([
-            {'date': el[0], 'jour_ferie': el[1]} for el in sorted(holidays.FRA(years=year).items())])])
-        
-    # Merge school and bank holidays
-    df_holidays = pd.merge(df_vacances, df_jf, how='outer', on='date')
-    # Create features from df_holidays dataframes (school holidays and bank holidays):
-    # - 3 binary features for school holidays, taking 1 if the given zone is on holiday, else 0 (vacances_zone_a, 
-    # vacances_zone_b, vacances_zone_c)
-
-    # Definition of a dictionary to encode boolean into numeric
-    dict_map_vac = {
-        True: 1,
-        False: 0
-    }
-    # Apply dictionary to each holiday column for the three zones (A, B, C)
-    df_holidays['vacances_zone_a'] = df_holidays['vacances_zone_a'].map(dict_map_vac)
-    df_holidays['vacances_zone_b'] = df_holidays['vacances_zone_b'].map(dict_map_vac)
-    df_holidays['vacances_zone_c'] = df_holidays['vacances_zone_c'].map(dict_map_vac)
-
-    # - 1 binary feature for bank holiday, taking 1 if it is a bank holiday, else 0
-    # The column "jour ferie" contains either the name of the holiday or a missing value (NaN)
-    # The idea is to put a '1' when it's a holiday (i.e. when the value is different from nan, else 0)
-    df_holidays['jour_ferie'] = df_holidays['jour_ferie'].map(lambda x: 1 if str(x) != 'nan' else 0)
-
-    # - To go further: Try to create a combined feature with school and bank holidays
-    df_holidays['holiday'] = df_holidays['vacances_zone_a'] + df_holidays['vacances_zone_b'] + df_holidays[
-        'vacances_zone_c'] + df_holidays['jour_ferie']
-    df_holidays['date'] = df_holidays['date'].map(lambda x: str(x))
-    data_final_cal = pd.merge(data_final, df_holidays, how='left', left_on='release_date', right_on='date').fillna(0)
-    data_final_cal['month'] = data_final_cal['release_date'].map(lambda x: int(x[5:7]))
-    data_final_cal = apply_cos(data_final_cal, 'month', 'cos_month', 12)
+    # Features from school holidays (vacances_zone_a, vacances_zone_b, vacances_zone_c), bank holidays (jour_ferie),
+    # both combined (holiday) and from the month of release (month, cos_month) are precomputed for every day and
+    # looked up by release date
+    calendar_features = get_calendar_features(pd.to_datetime(data_final['release_date'], errors='coerce').values)
+    data_final_cal = data_final.copy()
+    for i, col in enumerate(CALENDAR_COLS):
+        data_final_cal[col] = calendar_features[:, i]
     return data_final_cal
 
 
@@ -326,47 +350,35 @@ def apply_cos(df: pd.DataFrame,
     return df    
 
 
-def get_encoded_collections_df(data_final_cal):
+def get_encoded_collections_df(data_final_cal, collection_store: Optional[CollectionStore] = None):
 
     # Collection with an high number of movies are often sagas that have worked well (ex: Star Wars, Fast and
     # Furious, ...)
-    # We can therefore use the variable "is_part_of_collection" to compute the number of movies per collection
-    # Hint: to create this kind of feature, you can use the .value_counts() method
-
-    # Exclude collections with only one movie
-
-    # We count the number of movies per collection
-    df_count_col = data_final_cal.groupby(['collection_name']).count().reset_index()
-    # We define a list of collection names with less than 2 movies (we won't take them into account)
-    not_collection = list(set(df_count_col.loc[df_count_col['year'] < 2]['collection_name']))
-    # For movies with less than 2 movies per collection, we set the values of "is_part_of_colleciton" to 0
-    data_final_cal.loc[data_final_cal['collection_name'].isin(not_collection), 'is_part_of_collection'] = 0
-    # For movies with less than 2 movies per collection, we set the values of "collection_name" to None
-    data_final_cal.loc[data_final_cal['collection_name'].isin(not_collection), 'collection_name'] = None
-
-    # Create the feature: number of movies per collection
-    # We define a dictionary with the number of movies per collection (only collections with at least 2 movies since
-    # we excluded the other ones just before)
-    map_col_count = dict(data_final_cal['collection_name'].value_counts())
-    # We remove the "None" collection (i.e. the first item of the dictionary that corresponds to all movies that are
-    # not part of a collection)
-    if len(map_col_count) > 0:
-        del map_col_count[0]
-        # We map the dictionary into a new feature: the number of movies per collection
-        data_final_cal['nb_movie_collection'] = data_final_cal['collection_name'].map(map_col_count)
-    else:
-        data_final_cal['nb_movie_collection'] = 0
+    # We can therefore use the variable "collection_name" to compute, for each movie and only from the movies
+    # released before it (as we would at prediction time):
+    # - the number of movies of its collection
+    # - the rolling average of the sales of the 10 previous movies of its collection
+    # Movies are added to the collection store as we go, so that it can be saved and queried later on for new movies
+    # without rescanning history
+    if collection_store is None:
+        collection_store = CollectionStore(window=10)
+    collection_features = collection_store.get_and_update_features(data_final_cal)
+    data_final_cal['nb_movie_collection'] = collection_features['nb_movie_collection']
+    data_final_cal['rolling_sales_collection'] = collection_features['rolling_sales_collection']
+
+    # Exclude collections with only one movie: we set the values of "is_part_of_collection" to 0 and
+    # "collection_name" to None, as for movies that are not part of a collection
+    is_single = data_final_cal['collection_name'].map(collection_store.get_nb_movies, na_action='ignore') < 2
+    data_final_cal.loc[is_single, 'is_part_of_collection'] = 0
+    data_final_cal.loc[is_single, 'collection_name'] = None
+    data_final_cal.loc[is_single, 'nb_movie_collection'] = 0
 
     # We isolate the movies that are part of a collection and we store it into df_collection
     df_collection = data_final_cal.loc[data_final_cal['is_part_of_collection'] == 1]
-    # We compute the rolling average of the sales of the 10 previous movies per collection 
-    df_collection['rolling_sales_collection'] = df_collection.sort_values(by=['collection_name', 'release_date']) \
-                .groupby('collection_name')['sales'] \
-                .transform(lambda x: x.rolling(10, 1).mean().shift())
     return df_collection
 
 
-def get_encoded_actors_df(df_all):
+def get_encoded_actors_df(df_all, k: int = 5, cast_table: Optional[CastTable] = None):
     # To go (much much) further:
     # In the same vein, we could create features taking into account sales of previous movies per actor and create 
     # features that represent:
@@ -378,35 +390,22 @@ def get_encoded_actors_df(df_all):
 
     # /!\ For more details, this process is presented in the main deck, at the end of the feature engineering part 
 
-    # We create three new columns with the names of the top 3 actors for each movie
-    df_all['actor_1'] = df_all['cast'].map(lambda x: x[0]['name'] if len(x) > 0 else None) # name of actor #1
-    df_all['actor_2'] = df_all['cast'].map(lambda x: x[1]['name'] if len(x) > 1 else None) # name of actor #2
-    df_all['actor_3'] = df_all['cast'].map(lambda x: x[2]['name'] if len(x) > 2 else None) # name of actor #3
-    # We define a list of all actors that appear in either #1, #2 or #3 positions for all movies
-    actors_list = set(list(set(df_all['actor_1'])) + list(set(df_all['actor_2'])) + list(set(df_all['actor_3'])))
-
-    k = 5
-    df_all = df_all.sort_values('release_date')
-    # For each actor we will compute the average of sales of its previous movies and we will copy this value to our
-    # main dataframe when the given actor is in #1 or #2 or #3 position.
-    for actor in list(actors_list):
-        # We find all the movies where a given actor is in either #1, #2 or #3 position
-        data_actor = df_all.loc[(df_all['actor_1'] == actor) | (df_all['actor_2'] == actor) | (df_all['actor_3'] == actor)]
-        data_actor['actor'] = actor
-        # We compute the average sales on its k previous movies (here k = 5)
-        data_actor['mean_sales'] = data_actor.groupby('actor')['sales'] \
-            .transform(lambda x: x.rolling(k, 1).mean().shift()).fillna(0)
-        # We copy those values in the right place in our main dataframe
-        df_all.loc[df_all['actor_1'] == actor, 'actor_1'] = data_actor.loc[data_actor['actor_1'] == actor, 'mean_sales']
-        df_all.loc[df_all['actor_2'] == actor, 'actor_2'] = data_actor.loc[data_actor['actor_2'] == actor, 'mean_sales']
-        df_all.loc[df_all['actor_3'] == actor, 'actor_3'] = data_actor.loc[data_actor['actor_3'] == actor, 'mean_sales']
-
-    # We rename the columns to make them more understandable
-    df_all = df_all.rename({
-        'actor_1': 'actor_1_sales',
-        'actor_2': 'actor_2_sales',
-        'actor_3': 'actor_3_sales'
-    }, axis=1)
+    df_all = df_all.sort_values('release_date', kind='mergesort')
+    if cast_table is None:
+        # We take the names of the top 3 actors for each movie
+        actors = np.array(
+            [[cast[i]['name'] if len(cast) > i else None for i in range(3)] for cast in df_all['cast']],
+            dtype=object).reshape(len(df_all), 3)
+    else:
+        # We take the ids of the top 3 actors for each movie from the columnar cast table
+        actors = cast_table.get_top_actors(df_all['id'], 3)
+
+    # For each actor we compute the average of sales of its k previous movies (here k = 5) and we copy this value to
+    # our main dataframe when the given actor is in #1 or #2 or #3 position.
+    actors_sales = get_actors_rolling_sales(actors, df_all['sales'].to_numpy(dtype=float), k)
+    df_all['actor_1_sales'] = actors_sales[:, 0]
+    df_all['actor_2_sales'] = actors_sales[:, 1]
+    df_all['actor_3_sales'] = actors_sales[:, 2]
 
     # We create two new features based on the ones created just above: the mean of the sales of the 3 main actors
     df_all['mean_sales_actor'] = (df_all['actor_1_sales'] + df_all['actor_2_sales'] + df_all['actor_3_sales']) / 3
@@ -415,8 +414,129 @@ def get_encoded_actors_df(df_all):
     return df_all    
 
 
-def get_mean_popularity(df_all, top_n: int):
-    df_all[f'mean_{top_n}_popularity'] = df_all['cast'].map(
-        lambda x: np.mean([np.log(el['tmdb_popularity']) if np.log(el['tmdb_popularity']) > 0 else 0 for el in x[:top_n]])) \
-            .fillna(0)
-    return df_all    
+def get_actors_rolling_sales(actors: np.ndarray, sales: np.ndarray, k: int = 5) -> np.ndarray:
+    '''
+    Computes, for every (movie, actor slot), the mean sales of the `k`
+    previous movies of the actor in that slot.
+
+    Movies must already be sorted chronologically. The cast is exploded
+    into a long (movie, actor) table once, sorted by actor, and the rolling
+    means are derived from cumulative sums, so the cost is linear in the
+    number of movies instead of in actors x movies.
+
+    An actor's first movie gets 0, as do movies where none of the `k`
+    previous sales is known. Empty slots (no actor) get NaN.
+
+    Parameters
+    ----------
+    actors: np.ndarray
+        (n_movies, n_slots) array of actor names or ids, None or NaN for empty slots
+    sales: np.ndarray
+        (n_movies,) array of sales, NaN when unknown
+    k: int, default 5
+        Number of previous movies to average
+
+    Returns
+    -------
+    actors_sales: np.ndarray
+        (n_movies, n_slots) float array of rolling mean sales
+    '''
+    n_movies, n_slots = actors.shape
+    actors_sales = np.full((n_movies, n_slots), np.nan)
+
+    # Explode top cast into long form: one row per (movie, slot) with an actor
+    df_long = pd.DataFrame({
+        'movie': np.tile(np.arange(n_movies), n_slots),
+        'slot': np.repeat(np.arange(n_slots), n_movies),
+        'actor': actors.T.ravel(),
+    }).dropna(subset=['actor'])
+    if df_long.empty:
+        return actors_sales
+
+    # An actor listed twice for the same movie must only count once in its history
+    df_unique = df_long.drop_duplicates(['movie', 'actor']) \
+        .sort_values(['actor', 'movie'], kind='mergesort')
+    movies = df_unique['movie'].to_numpy()
+    actor_codes = pd.factorize(df_unique['actor'])[0]
+    actor_sales = sales[movies]
+
+    # Position of each row inside its actor group
+    n_rows = len(movies)
+    is_group_start = np.ones(n_rows, dtype=bool)
+    is_group_start[1:] = actor_codes[1:] != actor_codes[:-1]
+    group_start = np.maximum.accumulate(np.where(is_group_start, np.arange(n_rows), 0))
+    window = np.minimum(np.arange(n_rows) - group_start, k)
+
+    # Sum and count of known sales over the `window` previous rows, through cumulative sums
+    is_known = ~np.isnan(actor_sales)
+    cum_sales = np.concatenate([[0.], np.cumsum(np.where(is_known, actor_sales, 0.))])
+    cum_count = np.concatenate([[0], np.cumsum(is_known)])
+    end = np.arange(n_rows)
+    sum_sales = cum_sales[end] - cum_sales[end - window]
+    count_sales = cum_count[end] - cum_count[end - window]
+    mean_sales = np.divide(sum_sales, count_sales, out=np.zeros(n_rows), where=count_sales > 0)
+
+    # Pivot back to one column per slot
+    df_unique = df_unique.assign(mean_sales=mean_sales)
+    df_long = df_long.merge(df_unique[['movie', 'actor', 'mean_sales']], on=['movie', 'actor'], how='left')
+    actors_sales[df_long['movie'].to_numpy(), df_long['slot'].to_numpy()] = df_long['mean_sales'].to_numpy()
+    return actors_sales
+
+
+def get_mean_popularity(df_all, top_n: int, cast_table: Optional[CastTable] = None):
+    return get_mean_popularities(df_all, [top_n], cast_table)
+
+
+def get_mean_popularities(df_all, top_ns: Sequence[int] = (3, 5), cast_table: Optional[CastTable] = None):
+    # For each movie and each N, mean of the log TMDb popularity of its top N cast members (log popularities are
+    # clipped at 0), computed at once for all N over the flattened popularities of the cast
+    max_top_n = max(top_ns)
+    if cast_table is None:
+        cast_sizes = np.fromiter(
+            (min(len(cast), max_top_n) for cast in df_all['cast']), dtype=np.int64, count=len(df_all))
+        popularity = np.fromiter(
+            (member['tmdb_popularity'] for cast in df_all['cast'] for member in cast[:max_top_n]),
+            dtype=float, count=cast_sizes.sum())
+        offsets = np.concatenate([[0], np.cumsum(cast_sizes)])
+    else:
+        member_rows, offsets = cast_table.get_top_members(df_all['id'], max_top_n)
+        popularity = cast_table.popularity[member_rows].astype(float)
+    mean_popularities = get_top_n_mean_log_popularities(popularity, offsets, top_ns)
+    for i, top_n in enumerate(top_ns):
+        df_all[f'mean_{top_n}_popularity'] = mean_popularities[:, i]
+    return df_all
+
+
+def get_top_n_mean_log_popularities(popularity: np.ndarray, offsets: np.ndarray, top_ns: Sequence[int]) -> np.ndarray:
+    '''
+    Computes the mean of the clipped log popularities of the top N
+    cast members of each movie, for several N at once.
+
+    The cast of all movies is given as a ragged array: members of movie `i`
+    are `popularity[offsets[i]:offsets[i+1]]`, sorted by order of importance.
+
+    Parameters
+    ----------
+    popularity: np.ndarray
+        Flattened TMDb popularities of the cast members
+    offsets: np.ndarray
+        (n_movies + 1,) start of the cast of each movie in `popularity`
+    top_ns: Sequence[int]
+        Numbers of top cast members to average
+
+    Returns
+    -------
+    mean_popularities: np.ndarray
+        (n_movies, len(top_ns)) means, 0 for movies without cast
+    '''
+    # log(popularity) if it is positive, else 0
+    log_popularity = np.log(np.fmax(popularity, 1.))
+    cum_log_popularity = np.concatenate([[0.], np.cumsum(log_popularity)])
+    starts = offsets[:-1]
+    cast_sizes = np.diff(offsets)
+    mean_popularities = np.zeros((len(starts), len(top_ns)))
+    for i, top_n in enumerate(top_ns):
+        n_members = np.minimum(cast_sizes, top_n)
+        sums = cum_log_popularity[starts + n_members] - cum_log_popularity[starts]
+        np.divide(sums, n_members, out=mean_popularities[:, i], where=n_members > 0)
+    return mean_popularities
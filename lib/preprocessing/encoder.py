@@ -0,0 +1,252 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from config import (CALENDAR_COLS, CALENDAR_END_YEAR, CALENDAR_FILEPATH, CALENDAR_START_YEAR, COUNTRY_TO_KEEP,
+                    DICT_GENRES, FEATURE_COLS_TO_KEEP, LANG_TO_KEEP)
+from lib.preprocessing.calendar_features import get_calendar_features
+from lib.preprocessing.encode import multi_hot_encode
+from loguru import logger
+
+# Model features, i.e. FEATURE_COLS_TO_KEEP without the date and the target
+FEATURE_COLS = [col for col in FEATURE_COLS_TO_KEEP if col not in ('release_date', 'sales')]
+CATEGORICAL_FIELDS = ['original_language', 'languages', 'genres', 'production_countries']
+# Other features are dummies or small counts (month, holiday) that fit in uint8
+NUMERICAL_COLS = ['budget', 'runtime', 'cos_month']
+DATASET_SCHEMA = {
+    'id': 'int64',
+    'release_date': 'datetime64[D]',
+    'sales': 'float32',
+    **{col: 'float32' if col in NUMERICAL_COLS else 'uint8' for col in FEATURE_COLS}
+}
+# Everything the processed dataset depends on, besides raw data
+ENCODING_CONFIG = {
+    'feature_cols_to_keep': FEATURE_COLS_TO_KEEP,
+    'lang_to_keep': LANG_TO_KEEP,
+    'country_to_keep': COUNTRY_TO_KEEP,
+    'dict_genres': DICT_GENRES,
+    'calendar_years': [CALENDAR_START_YEAR, CALENDAR_END_YEAR],
+    'calendar_table': os.path.basename(CALENDAR_FILEPATH),
+    'dataset_schema': DATASET_SCHEMA,
+}
+
+
+def get_feature_col(field: str, category: str) -> str:
+    '''
+    Name of the feature column a raw TMDb category is encoded into
+
+    Parameters
+    ----------
+    field: str
+        One of CATEGORICAL_FIELDS
+    category: str
+        A raw category, e.g. a language iso code for `languages`
+
+    Returns
+    -------
+    col: str
+        Feature column name (that may not be part of FEATURE_COLS)
+    '''
+    if field == 'original_language':
+        return 'original_lang_' + (category if category in LANG_TO_KEEP else 'other')
+    if field == 'languages':
+        return 'available_lang_' + (category if category in LANG_TO_KEEP else 'other')
+    if field == 'genres':
+        return DICT_GENRES.get(category, 'Other')
+    if field == 'production_countries':
+        return 'prod_' + (category if category in COUNTRY_TO_KEEP else 'OTHER')
+    raise ValueError(f'Unknown categorical field {field}')
+
+
+class MovieFeatureEncoder:
+
+    def __init__(self):
+        '''
+        Encodes movie data (sales and movie dataset merged) into the model
+        features, in FEATURE_COLS order.
+
+        Unlike `encode_movie_data`, vocabularies and missing values imputations
+        are learnt once with `fit` and then frozen, so that a movie is always
+        encoded the same way whatever the batch it belongs to.
+        '''
+        self.budget_median = None
+        self.runtime_mean = None
+        # For each categorical field, raw category -> feature column index (-1 if not encoded)
+        self.vocabularies: Dict[str, Dict[str, int]] = {}
+        # For each categorical field, column index of categories unseen during fit (-1 if not encoded)
+        self.unknown_cols: Dict[str, int] = {}
+
+    def fit(self, movie_data: pd.DataFrame) -> 'MovieFeatureEncoder':
+        '''
+        Learn imputation values and categories vocabularies
+
+        Parameters
+        ----------
+        movie_data: pd.DataFrame
+            sales and movie dataset merged
+
+        Returns
+        -------
+        encoder: MovieFeatureEncoder
+            The fitted encoder
+        '''
+        budget = pd.to_numeric(movie_data['budget'], errors='coerce').to_numpy(dtype=float)
+        self.budget_median = float(np.median(budget[(budget != 0) & ~np.isnan(budget)]))
+        logger.info(f'budget median: {self.budget_median}')
+        runtime = pd.to_numeric(movie_data['runtime'], errors='coerce').to_numpy(dtype=float)
+        self.runtime_mean = float(np.mean(runtime[(runtime != 0) & ~np.isnan(runtime)]))
+        logger.info(f'runtime_mean: {self.runtime_mean}')
+
+        for field in CATEGORICAL_FIELDS:
+            if field == 'original_language':
+                categories = set(movie_data[field].dropna())
+            else:
+                categories = set(category for categories in movie_data[field] for category in categories)
+            self.vocabularies[field] = {
+                category: self._get_col_index(field, category) for category in sorted(categories)
+            }
+            self.unknown_cols[field] = self._get_col_index(field, None)
+        return self
+
+    def transform(self, movie_data: pd.DataFrame) -> np.ndarray:
+        '''
+        Encode movies into a float32 features matrix
+
+        Parameters
+        ----------
+        movie_data: pd.DataFrame
+            sales and movie dataset merged
+
+        Returns
+        -------
+        features: np.ndarray
+            (n_movies, len(FEATURE_COLS)) float32 matrix
+        '''
+        if self.budget_median is None:
+            raise ValueError('MovieFeatureEncoder must be fitted before calling transform')
+
+        features = np.zeros((len(movie_data), len(FEATURE_COLS)), dtype=np.float32)
+        col_index = {col: i for i, col in enumerate(FEATURE_COLS)}
+
+        # Numerical features, filling missing values
+        features[:, col_index['is_part_of_collection']] = movie_data['is_part_of_collection'].to_numpy(dtype=bool)
+        for col, fill_value in [('budget', self.budget_median), ('runtime', self.runtime_mean)]:
+            values = pd.to_numeric(movie_data[col], errors='coerce').to_numpy(dtype=float)
+            features[:, col_index[col]] = np.where((values == 0) | np.isnan(values), fill_value, values)
+
+        # Categorical features
+        original_languages = movie_data['original_language'].to_list()
+        # When the production country is empty, we suppose that it is France for french movies, USA for english ones
+        # and 'Other' elsewhere
+        default_countries = {'fr': ['FR'], 'en': ['US']}
+        production_countries = [
+            countries if len(countries) > 0 else default_countries.get(language, ['OTHER'])
+            for countries, language in zip(movie_data['production_countries'], original_languages)
+        ]
+        multi_hot_encode(
+            [
+                [(language,) for language in original_languages],
+                movie_data['languages'],
+                movie_data['genres'],
+                production_countries,
+            ],
+            [self.vocabularies[field] for field in CATEGORICAL_FIELDS],
+            len(movie_data),
+            len(FEATURE_COLS),
+            unknown_cols=[self.unknown_cols[field] for field in CATEGORICAL_FIELDS],
+            out=features)
+
+        # Calendar features
+        calendar_features = get_calendar_features(
+            pd.to_datetime(movie_data['release_date'], errors='coerce').values)
+        features[:, [col_index[col] for col in CALENDAR_COLS]] = calendar_features
+        return features
+
+    def fit_transform(self, movie_data: pd.DataFrame) -> np.ndarray:
+        return self.fit(movie_data).transform(movie_data)
+
+    def transform_df(self, movie_data: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Encode movies as a dataframe with FEATURE_COLS_TO_KEEP columns,
+        as `encode_movie_data` does
+
+        Parameters
+        ----------
+        movie_data: pd.DataFrame
+            sales and movie dataset merged
+
+        Returns
+        -------
+        df: pd.DataFrame
+            release date, sales and features of each movie
+        '''
+        data = pd.DataFrame(self.transform(movie_data), columns=FEATURE_COLS, index=movie_data.index)
+        data.insert(0, 'sales', movie_data['sales'].fillna(0))
+        data.insert(0, 'release_date', movie_data['release_date'])
+        return data
+
+    def save(self, path: str):
+        '''
+        Save the fitted encoder as json
+
+        Parameters
+        ----------
+        path: str
+            path to the json file, usually next to the model
+        '''
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'feature_cols': FEATURE_COLS,
+                'budget_median': self.budget_median,
+                'runtime_mean': self.runtime_mean,
+                'vocabularies': self.vocabularies,
+                'unknown_cols': self.unknown_cols,
+            }, f, ensure_ascii=False, indent=4)
+        logger.info(f'Encoder saved to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'MovieFeatureEncoder':
+        '''
+        Load an encoder saved with `save`
+
+        Parameters
+        ----------
+        path: str
+            path to the json file
+
+        Returns
+        -------
+        encoder: MovieFeatureEncoder
+            The fitted encoder
+        '''
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['feature_cols'] != FEATURE_COLS:
+            raise ValueError(f'Encoder {path} was fitted with other feature columns, please fit it again')
+        encoder = cls()
+        encoder.budget_median = state['budget_median']
+        encoder.runtime_mean = state['runtime_mean']
+        encoder.vocabularies = state['vocabularies']
+        encoder.unknown_cols = state['unknown_cols']
+        return encoder
+
+    def _get_col_index(self, field: str, category: Optional[str]) -> int:
+        col = get_feature_col(field, category)
+        return FEATURE_COLS.index(col) if col in FEATURE_COLS else -1
@@ -0,0 +1,151 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Optional, Set, Tuple
+import pandas as pd
+from lib.utils.io import read_from_json, read_projected_json, read_projected_partitions
+from loguru import logger
+
+RECORD_HASHES_FILENAME = 'record_hashes.json'
+
+
+def read_records_with_hashes(
+        path: str,
+        project: Callable[[dict], dict],
+        dtypes: Optional[Dict[str, str]] = None) -> Tuple[pd.DataFrame, Dict[int, str]]:
+    '''
+    Read a json dataset like `read_projected_json`, and hash each raw
+    record in the same streaming pass
+
+    Parameters
+    ----------
+    path: str
+        Path to json or jsonl file, or to a dataset partitioned by year
+    project: Callable[[dict], dict]
+        Extracts the fields to keep from a record
+    dtypes: Optional[Dict[str, str]], default None
+        Types to cast columns to
+
+    Returns
+    -------
+    data: Tuple[pd.DataFrame, Dict[int, str]]
+        Projected records, and the hash of the raw record(s) of each movie id
+    '''
+    hashes = {}
+
+    def project_with_hash(record: dict) -> dict:
+        row = project(record)
+        record_hash = hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        # A movie may have several records, hash them all
+        if row['id'] in hashes:
+            record_hash.update(hashes[row['id']].encode('utf-8'))
+        hashes[row['id']] = record_hash.hexdigest()
+        return row
+
+    read_projected = read_projected_partitions if os.path.isdir(path) else read_projected_json
+    data = read_projected(path, project_with_hash, dtypes)
+    return data, hashes
+
+
+def combine_hashes(*hashes: Dict[int, str]) -> Dict[int, str]:
+    '''
+    Hash of all the raw records of each movie id found in every `hashes`
+    '''
+    movie_ids = set.intersection(*[set(movie_hashes) for movie_hashes in hashes])
+    return {
+        movie_id: hashlib.sha1(''.join(movie_hashes[movie_id] for movie_hashes in hashes).encode('utf-8')).hexdigest()
+        for movie_id in movie_ids
+    }
+
+
+def save_record_hashes(dataset_path: str, hashes: Dict[int, str], encoding_config_key: str):
+    '''
+    Save the raw records hashes of a processed dataset, next to it
+
+    Parameters
+    ----------
+    dataset_path: str
+        Directory of the processed dataset
+    hashes: Dict[int, str]
+        Hash of the raw records of each movie id
+    encoding_config_key: str
+        Hash of the encoding configuration the dataset was built with
+    '''
+    with open(os.path.join(dataset_path, RECORD_HASHES_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump({'encoding_config_key': encoding_config_key, 'records': hashes}, f)
+
+
+def remove_record_hashes(dataset_path: str):
+    '''
+    Remove the raw records hashes of a processed dataset rebuilt without hashing,
+    so that the next incremental run falls back to a full run
+    '''
+    path = os.path.join(dataset_path, RECORD_HASHES_FILENAME)
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def load_record_hashes(dataset_path: str, encoding_config_key: str) -> Optional[Dict[int, str]]:
+    '''
+    Load the raw records hashes of a processed dataset
+
+    Parameters
+    ----------
+    dataset_path: str
+        Directory of the processed dataset
+    encoding_config_key: str
+        Hash of the current encoding configuration
+
+    Returns
+    -------
+    hashes: Optional[Dict[int, str]]
+        Hash of the raw records of each movie id, None if there are none
+        or if the dataset was built with another encoding configuration
+    '''
+    path = os.path.join(dataset_path, RECORD_HASHES_FILENAME)
+    if not os.path.isfile(path):
+        return None
+    payload = read_from_json(path)
+    if payload['encoding_config_key'] != encoding_config_key:
+        logger.info('Encoding configuration changed since last run')
+        return None
+    return {int(movie_id): record_hash for movie_id, record_hash in payload['records'].items()}
+
+
+def get_movies_to_encode(previous_hashes: Dict[int, str], hashes: Dict[int, str]) -> Set[int]:
+    '''
+    Ids of the movies that need to be encoded again: new or changed movies.
+    Encoded features only depend on the record of the movie itself, so other movies
+    are unaffected, and removed movies are dropped when the dataset is patched.
+
+    Parameters
+    ----------
+    previous_hashes: Dict[int, str]
+        Raw records hashes when the processed dataset was built
+    hashes: Dict[int, str]
+        Current raw records hashes
+
+    Returns
+    -------
+    movie_ids: Set[int]
+        Ids of the movies to encode
+    '''
+    movie_ids = {movie_id for movie_id, record_hash in hashes.items() if previous_hashes.get(movie_id) != record_hash}
+    logger.info(f'{len(movie_ids)} new or changed movies to encode')
+    return movie_ids
@@ -15,11 +15,13 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import pandas as pd
-from lib.utils.io import read_from_json
-from typing import List
+from lib.crawling.movie_features.records import MovieRecord
+from lib.utils.io import MOVIE_ENTREES_DTYPES, project_movie_entree, read_projected_json, read_projected_partitions
+from typing import List, Optional
+import os
 
 
-def read_movies_entrees(path: str) -> pd.DataFrame:
+def read_movies_entrees(path: str, years: Optional[List[int]] = None, latest_crawl: bool = False) -> pd.DataFrame:
     '''
     Read the box office dataset 
     and casts it as an usable pandas DataFrame
@@ -27,16 +29,20 @@ def read_movies_entrees(path: str) -> pd.DataFrame:
     Parameters
     ----------
     path: str
-        path to the dataset
+        path to the dataset, a json file or a directory partitioned by year
+    years: Optional[List[int]], default None
+        Years to read from a partitioned dataset, all of them if None
+    latest_crawl: bool, default False
+        Only read the movies new or changed in the latest crawl of a partitioned dataset
 
     Returns
     -------
     df: pd.DataFrame
         Data as DataFrame
     '''
-    bo = read_from_json(path)
-    bo = read_movies_entrees_from_loaded_json(bo)
-    return bo
+    if os.path.isdir(path):
+        return read_projected_partitions(path, project_movie_entree, MOVIE_ENTREES_DTYPES, years, latest_crawl)
+    return read_projected_json(path, project_movie_entree, MOVIE_ENTREES_DTYPES)
 
 
 def read_movies_features(path: str) -> pd.DataFrame:
@@ -56,9 +62,27 @@ def read_movies_features(path: str) -> pd.DataFrame:
     df: pd.DataFrame
         Data as DataFrame
     '''
-    features = read_from_json(path)
-    features = read_movies_features_from_loaded_json(features)
-    return features
+    return read_projected_json(path, project_movie_features)
+
+
+def project_movie_features(item: dict) -> dict:
+    return {
+        "is_adult": item['adult'],
+        "is_part_of_collection": not not item['belongs_to_collection'], # Currently simple bool, may be interesting to use a more complex feature later
+        "budget": item['budget'],
+        "genres": [ genre['name'] for genre in item['genres'] ], 
+        "original_language": item['original_language'],
+        # "title": item['title'], # Can be challenged but chose to use title (french one) instead of original_title (in original language) as to have one single language for this feature
+        # "overview": item['overview'], # Not used yet. Blob of text
+        # "production_companies": item['production_companies'], # Not used yet. List of dicts with company id, country and name. 
+        "production_countries": [ country['iso_code'] for country in item['production_countries'] ],
+        "languages": [ language['iso_code'] for language in item['languages'] ],
+        # "tagline": item['tagline'], # Not used yet. Blob of text
+        # "production_companies": [ prod_comp['name'] for prod_comp in item['production_companies'] ],
+        "runtime": item['runtime'],
+        # "cast": item['cast'], # Not used yet. List of dicts with actor gender, name, id...
+        "id": int(item['id'])
+    }
 
 
 def read_movies_features_from_loaded_json(features: List[dict]) -> pd.DataFrame:
@@ -78,26 +102,42 @@ def read_movies_features_from_loaded_json(features: List[dict]) -> pd.DataFrame:
     df: pd.DataFrame
         Data as DataFrame
     '''
-    features = [
-        {
-            "is_adult": item['adult'],
-            "is_part_of_collection": not not item['belongs_to_collection'], # Currently simple bool, may be interesting to use a more complex feature later
-            "budget": item['budget'],
-            "genres": [ genre['name'] for genre in item['genres'] ], 
-            "original_language": item['original_language'],
-            # "title": item['title'], # Can be challenged but chose to use title (french one) instead of original_title (in original language) as to have one single language for this feature
-            # "overview": item['overview'], # Not used yet. Blob of text
-            # "production_companies": item['production_companies'], # Not used yet. List of dicts with company id, country and name. 
-            "production_countries": [ country['iso_code'] for country in item['production_countries'] ],
-            "languages": [ language['iso_code'] for language in item['languages'] ],
-            # "tagline": item['tagline'], # Not used yet. Blob of text
-            # "production_companies": [ prod_comp['name'] for prod_comp in item['production_companies'] ],
-            "runtime": item['runtime'],
-            # "cast": item['cast'], # Not used yet. List of dicts with actor gender, name, id...
-            "id": int(item['id'])
-        } for item in features
-    ]
-    return pd.DataFrame(features)
+    return pd.DataFrame([ project_movie_features(item) for item in features ])
+
+
+def project_movie_record(record: MovieRecord, movie_id: int) -> dict:
+    # Same projection as `project_movie_features`, straight from the record fields
+    return {
+        "is_adult": record.is_adult,
+        "is_part_of_collection": record.collection_name is not None,
+        "budget": record.budget,
+        "genres": list(record.genres),
+        "original_language": record.original_language,
+        "production_countries": list(record.production_countries),
+        "languages": list(record.languages),
+        "runtime": record.runtime,
+        "id": int(movie_id)
+    }
+
+
+def read_movies_features_from_records(records: List[MovieRecord], movie_ids: List[int]) -> pd.DataFrame:
+    '''
+    Cast movie records, as returned by `TMDbClient.get_movie_record`,
+    as an usable pandas DataFrame
+
+    Parameters
+    ----------
+    records: List[MovieRecord]
+        movie records
+    movie_ids: List[int]
+        custom id of each movie
+
+    Returns
+    -------
+    df: pd.DataFrame
+        Data as DataFrame
+    '''
+    return pd.DataFrame([ project_movie_record(record, movie_id) for record, movie_id in zip(records, movie_ids) ])
 
 
 def read_movies_entrees_from_loaded_json(bo: List[dict]) -> pd.DataFrame:
@@ -115,16 +155,7 @@ def read_movies_entrees_from_loaded_json(bo: List[dict]) -> pd.DataFrame:
     df: pd.DataFrame
         Data as DataFrame
     '''
-    bo = [
-        {
-            "year": item['year'], 
-            "title": item['title'], 
-            "id": int(item['id']), 
-            "sales": item['first_week_sales'],
-            "release_date": item['release_date']
-        } for item in bo
-    ]
-    return pd.DataFrame(bo)
+    return pd.DataFrame([ project_movie_entree(item) for item in bo ])
 
 
 def get_dataset_from_api_res(movie_card: dict) -> pd.DataFrame:
@@ -14,9 +14,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from lib.crawling.boxoffice.boxoffice.partitions import INDEX_FILENAME, iter_partitions
 from lib.crawling.movie_features.tmdb.client import TMDbClient
 from loguru import logger
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional
+import hashlib
 import json
+import os
+import numpy as np
 import pandas as pd
 
 
@@ -34,17 +40,289 @@ def read_from_json(path):
     data: Union[dict, list]
         Json casted as python object
     '''
-    data = json.load(open(path, 'r', encoding='utf-8', errors="ignore"))
+    with open(path, 'r', encoding='utf-8', errors="ignore") as f:
+        data = json.load(f)
     return data
 
 
+def iter_json_records(path: str, buffer_size: int = 1 << 20) -> Iterator[dict]:
+    '''
+    Iterate over the records of a json array, or of a json lines file,
+    parsing it incrementally instead of loading the whole file
+
+    Parameters
+    ----------
+    path: str
+        Path to json or jsonl file
+    buffer_size: int, default 1MB
+        Number of characters read at once
+
+    Returns
+    -------
+    records: Iterator[dict]
+        The records, one at a time
+    '''
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8', errors="ignore") as f:
+        buffer = f.read(buffer_size).lstrip()
+        is_array = buffer.startswith('[')
+        pos = 1 if is_array else 0
+        while True:
+            # Skip separators between records
+            while pos < len(buffer) and (buffer[pos].isspace() or (is_array and buffer[pos] == ',')):
+                pos += 1
+            if pos == len(buffer):
+                buffer = f.read(buffer_size)
+                pos = 0
+                if not buffer:
+                    return
+                continue
+            if is_array and buffer[pos] == ']':
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Record is incomplete, read more of the file
+                more = f.read(max(buffer_size, len(buffer) - pos))
+                if not more:
+                    raise
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            yield record
+            if pos > buffer_size:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def read_projected_json(
+        path: str,
+        project: Callable[[dict], dict],
+        dtypes: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    '''
+    Read a json array or json lines file as a DataFrame,
+    keeping only the fields returned by `project` for each record.
+
+    Records are parsed one at a time and only their projected fields are kept,
+    column by column, so the raw records are never all in memory.
+
+    Parameters
+    ----------
+    path: str
+        Path to json or jsonl file
+    project: Callable[[dict], dict]
+        Extracts the fields to keep from a record
+    dtypes: Optional[Dict[str, str]], default None
+        Types to cast columns to
+
+    Returns
+    -------
+    df: pd.DataFrame
+        Projected records
+    '''
+    columns = defaultdict(list)
+    for record in iter_json_records(path):
+        for field, value in project(record).items():
+            columns[field].append(value)
+    return _to_typed_df(columns, dtypes)
+
+
+def read_projected_partitions(
+        dirpath: str,
+        project: Callable[[dict], dict],
+        dtypes: Optional[Dict[str, str]] = None,
+        years: Optional[List[int]] = None,
+        latest_crawl: bool = False) -> pd.DataFrame:
+    '''
+    Read a box office dataset partitioned by year as a DataFrame,
+    keeping only the fields returned by `project` for each record.
+    Only the partitions of the requested years are parsed.
+
+    Parameters
+    ----------
+    dirpath: str
+        Path to the dataset directory
+    project: Callable[[dict], dict]
+        Extracts the fields to keep from a record
+    dtypes: Optional[Dict[str, str]], default None
+        Types to cast columns to
+    years: Optional[List[int]], default None
+        Years to read, all of them if None
+    latest_crawl: bool, default False
+        Only read the movies new or changed in the latest crawl
+
+    Returns
+    -------
+    df: pd.DataFrame
+        Projected records
+    '''
+    columns = defaultdict(list)
+    for record in iter_partitions(dirpath, years, latest_crawl):
+        for field, value in project(record).items():
+            columns[field].append(value)
+    return _to_typed_df(columns, dtypes)
+
+
+def _to_typed_df(columns: Dict[str, list], dtypes: Optional[Dict[str, str]]) -> pd.DataFrame:
+    df = pd.DataFrame(dict(columns))
+    if dtypes and len(df) > 0:
+        df = df.astype(dtypes)
+    return df
+
+
+def get_dataset_cache_key(source_paths: List[str], encoding_config: dict) -> str:
+    '''
+    Hash of the source files contents and of the encoding configuration
+    a processed dataset was built from
+
+    Parameters
+    ----------
+    source_paths: List[str]
+        Paths to the raw data files
+    encoding_config: dict
+        Json serializable configuration of the encoding
+
+    Returns
+    -------
+    cache_key: str
+        sha256 hex digest
+    '''
+    cache_key = hashlib.sha256()
+    for path in source_paths:
+        # Partitioned datasets are only appended to, along with their index
+        if os.path.isdir(path):
+            path = os.path.join(path, INDEX_FILENAME)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                cache_key.update(chunk)
+    cache_key.update(json.dumps(encoding_config, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return cache_key.hexdigest()
+
+
+def get_dataset_cache_key_on_disk(path: str) -> Optional[str]:
+    '''
+    Cache key of the processed dataset saved at `path`, None if there is none
+    '''
+    schema_path = os.path.join(path, 'schema.json')
+    if not os.path.isfile(schema_path):
+        return None
+    return read_from_json(schema_path)['cache_key']
+
+
+def save_dataset(data: pd.DataFrame, path: str, schema: Dict[str, str], cache_key: str):
+    '''
+    Save a processed dataset as binary columnar blocks: one .npy file
+    per dtype, plus a schema.json file describing them
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        The processed dataset
+    path: str
+        Directory to save the dataset to
+    schema: Dict[str, str]
+        dtype of each column to save, e.g. {'release_date': 'datetime64[D]', 'sales': 'float32'}
+    cache_key: str
+        Key of the dataset, see `get_dataset_cache_key`
+    '''
+    os.makedirs(path, exist_ok=True)
+    blocks = defaultdict(list)
+    for col, dtype in schema.items():
+        blocks[dtype].append(col)
+    for dtype, cols in blocks.items():
+        np.save(os.path.join(path, f'{dtype}.npy'), data[cols].to_numpy().astype(dtype))
+    with open(os.path.join(path, 'schema.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'cache_key': cache_key,
+            'columns': list(schema.keys()),
+            'blocks': blocks,
+        }, f, ensure_ascii=False, indent=4)
+    logger.info(f'Dataset saved to {path}')
+
+
 def load_dataset(path: str) -> pd.DataFrame:
+    '''
+    Load a processed dataset, either saved by `save_dataset` or as csv
+
+    Binary blocks are memory-mapped rather than parsed.
+
+    Parameters
+    ----------
+    path: str
+        Directory of the dataset, or path to a csv file
+
+    Returns
+    -------
+    data: pd.DataFrame
+        The processed dataset
+    '''
     logger.info(f"loading raw data {path}...")
-    data = pd.read_csv(path)
-    return data
+    if path.endswith('.csv'):
+        return pd.read_csv(path)
+    schema = read_from_json(os.path.join(path, 'schema.json'))
+    data = pd.concat([
+        pd.DataFrame(np.load(os.path.join(path, f'{dtype}.npy'), mmap_mode='r'), columns=cols, copy=False)
+        for dtype, cols in schema['blocks'].items()
+    ], axis=1, copy=False)
+    return data[schema['columns']]
+
+
+def patch_dataset(path: str, encoded: pd.DataFrame, movie_ids: np.ndarray, schema: Dict[str, str], cache_key: str):
+    '''
+    Update a processed dataset saved by `save_dataset` with newly encoded movies
+
+    When the set of movies does not change, rows are overwritten in place
+    in the memory-mapped blocks, else blocks are written again.
+
+    Parameters
+    ----------
+    path: str
+        Directory of the dataset
+    encoded: pd.DataFrame
+        Newly encoded movies, with an `id` column
+    movie_ids: np.ndarray
+        Ids of all the movies the dataset must contain afterwards
+    schema: Dict[str, str]
+        dtype of each column, as given to `save_dataset`
+    cache_key: str
+        New key of the dataset, see `get_dataset_cache_key`
+    '''
+    schema_path = os.path.join(path, 'schema.json')
+    saved_schema = read_from_json(schema_path)
+    stored_ids = load_dataset(path)['id'].to_numpy()
+    stored_rows = pd.Series(np.arange(len(stored_ids)), index=stored_ids)
+
+    if stored_rows.index.is_unique and set(stored_ids) == set(movie_ids) and encoded['id'].isin(stored_ids).all():
+        rows = stored_rows[encoded['id']].to_numpy()
+        for dtype, cols in saved_schema['blocks'].items():
+            block = np.load(os.path.join(path, f'{dtype}.npy'), mmap_mode='r+')
+            block[rows] = encoded[cols].to_numpy().astype(dtype)
+            block.flush()
+        saved_schema['cache_key'] = cache_key
+        with open(schema_path, 'w', encoding='utf-8') as f:
+            json.dump(saved_schema, f, ensure_ascii=False, indent=4)
+        logger.info(f'{len(rows)} rows of {path} updated in place')
+    else:
+        stored = load_dataset(path)
+        is_kept = stored['id'].isin(movie_ids) & ~stored['id'].isin(encoded['id'])
+        data = pd.concat([stored.loc[is_kept], encoded[stored.columns].astype(stored.dtypes.to_dict())], ignore_index=True)
+        save_dataset(data.sort_values('release_date', kind='mergesort'), path, schema, cache_key)
+
+
+def project_movie_entree(item: dict) -> dict:
+    return {
+        "year": item['year'], 
+        "title": item['title'], 
+        "id": int(item['id']), 
+        "sales": item['first_week_sales'],
+        "release_date": item['release_date']
+    }
+
+
+MOVIE_ENTREES_DTYPES = {"year": "int64", "id": "int64", "sales": "float64"}
 
 
-def read_movies_entrees(path):
+def read_movies_entrees(path, years=None, latest_crawl=False):
     '''
     Read the box office dataset 
     and casts it as an usable pandas DataFrame
@@ -52,24 +330,41 @@ def read_movies_entrees(path):
     Parameters
     ----------
     path: str
-        path to the dataset
+        path to the dataset, a json file or a directory partitioned by year
+    years: Optional[List[int]], default None
+        Years to read from a partitioned dataset, all of them if None
+    latest_crawl: bool, default False
+        Only read the movies new or changed in the latest crawl of a partitioned dataset
 
     Returns
     -------
     df: pd.DataFrame
         Data as DataFrame
     '''
-    bo = read_from_json(path)
-    bo = [
-        {
-            "year": item['year'], 
-            "title": item['title'], 
-            "id": int(item['id']), 
-            "sales": item['first_week_sales'],
-            "release_date": item['release_date']
-        } for item in bo
-    ]
-    return pd.DataFrame(bo)
+    if os.path.isdir(path):
+        return read_projected_partitions(path, project_movie_entree, MOVIE_ENTREES_DTYPES, years, latest_crawl)
+    return read_projected_json(path, project_movie_entree, MOVIE_ENTREES_DTYPES)
+
+
+def project_movie_features(item: dict) -> dict:
+    return {
+        "is_adult": item['adult'],
+        "is_part_of_collection": not not item['belongs_to_collection'],
+        "collection_name": item['belongs_to_collection']['name'] if item['belongs_to_collection'] != {} else None, # Currently simple bool, may be interesting to use a more complex feature later
+        "budget": item['budget'],
+        "genres": [ genre['name'] for genre in item['genres'] ], 
+        "original_language": item['original_language'],
+        "overview": item['overview'], # Not used yet. Blob of text
+        "production_countries": [ country['iso_code'] for country in item['production_countries'] ],
+        "languages": [ language['iso_code'] for language in item['languages'] ],
+        "tagline": item['tagline'], # Not used yet. Blob of text
+        "runtime": item['runtime'],
+        "cast": item['cast'], # Not used yet. List of dicts with actor gender, name, id...
+        "id": int(item['id'])
+    }
+
+
+MOVIE_FEATURES_DTYPES = {"budget": "float64", "runtime": "float64", "id": "int64"}
 
 
 def read_movies_features(path):
@@ -86,22 +381,4 @@ def read_movies_features(path):
     df: pd.DataFrame
         Data as DataFrame
     '''
-    features = read_from_json(path)
-    features = [
-        {
-            "is_adult": item['adult'],
-            "is_part_of_collection": not not item['belongs_to_collection'],
-            "collection_name": item['belongs_to_collection']['name'] if item['belongs_to_collection'] != {} else None, # Currently simple bool, may be interesting to use a more complex feature later
-            "budget": item['budget'],
-            "genres": [ genre['name'] for genre in item['genres'] ], 
-            "original_language": item['original_language'],
-            "overview": item['overview'], # Not used yet. Blob of text
-            "production_countries": [ country['iso_code'] for country in item['production_countries'] ],
-            "languages": [ language['iso_code'] for language in item['languages'] ],
-            "tagline": item['tagline'], # Not used yet. Blob of text
-            "runtime": item['runtime'],
-            "cast": item['cast'], # Not used yet. List of dicts with actor gender, name, id...
-            "id": int(item['id'])
-        } for item in features
-    ]
-    return pd.DataFrame(features)
+    return read_projected_json(path, project_movie_features, MOVIE_FEATURES_DTYPES)
@@ -0,0 +1,63 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import numpy as np
+from lib.preprocessing.cast_table import CastTable
+
+
+def make_member(tmdb_id: int, order: int) -> dict:
+    return {'tmdb_id': tmdb_id, 'name': f'Actor {tmdb_id}', 'tmdb_popularity': tmdb_id / 10,
+            'gender': 2 if tmdb_id % 2 else 1, 'order': order}
+
+
+CASTS = {
+    10: [make_member(1, 0), make_member(2, 1), make_member(3, 2), make_member(4, 3)],
+    11: [],
+    12: [make_member(3, 0)],
+}
+
+
+def test_cast_table_round_trip(tmp_path):
+    cast_table = CastTable.from_casts(CASTS.keys(), CASTS.values())
+    path = str(tmp_path / 'cast_table.npz')
+    cast_table.save(path)
+    loaded = CastTable.load(path)
+
+    assert len(loaded) == 3
+    for column in ['movie_ids', 'offsets', 'actor_ids', 'popularity', 'gender', 'order']:
+        np.testing.assert_array_equal(getattr(loaded, column), getattr(cast_table, column))
+        assert getattr(loaded, column).dtype == getattr(cast_table, column).dtype
+    assert loaded.actor_names == {actor_id: f'Actor {actor_id}' for actor_id in [1, 2, 3, 4]}
+    np.testing.assert_array_equal(loaded.offsets, [0, 4, 4, 5])
+
+
+def test_cast_table_from_movie_features_json(tmp_path):
+    path = str(tmp_path / 'movie-features.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([{'id': str(movie_id), 'cast': cast} for movie_id, cast in CASTS.items()], f)
+    cast_table = CastTable.from_movie_features_json(path)
+    expected = CastTable.from_casts(CASTS.keys(), CASTS.values())
+    np.testing.assert_array_equal(cast_table.movie_ids, expected.movie_ids)
+    np.testing.assert_array_equal(cast_table.actor_ids, expected.actor_ids)
+
+
+def test_cast_table_top_actors_of_short_casts_and_unknown_movies():
+    cast_table = CastTable.from_casts(CASTS.keys(), CASTS.values())
+    np.testing.assert_array_equal(
+        cast_table.get_top_actors([12, 10, 99, 11], top_n=3),
+        [[3, np.nan, np.nan], [1, 2, 3], [np.nan] * 3, [np.nan] * 3])
+    assert cast_table.get_actor_names([2, 5]) == ['Actor 2', None]
@@ -0,0 +1,63 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+import pytest
+from lib.preprocessing.collection_features import CollectionStore
+
+
+def test_collection_store_rolling_window():
+    store = CollectionStore(window=2)
+    nb_movies, rolling_sales = store.query('Toy Story')
+    assert nb_movies == 1 and np.isnan(rolling_sales)
+    store.add('Toy Story', '1995-11-22', 100.)
+    store.add('Toy Story', '1999-11-24', np.nan)
+    assert store.query('Toy Story') == (3, 100.)
+    # Movies with unknown sales still take their place in the window
+    store.add('Toy Story', '2010-06-16', None)
+    nb_movies, rolling_sales = store.query('Toy Story')
+    assert nb_movies == 4 and np.isnan(rolling_sales)
+    store.add('Toy Story', '2019-06-19', 300.)
+    store.add('Toy Story', '2022-06-22', 500.)
+    assert store.query('Toy Story') == (6, 400.)
+
+
+def test_collection_store_requires_chronological_order():
+    store = CollectionStore()
+    store.add('Taxi', '2000-03-25', 100.)
+    with pytest.raises(ValueError):
+        store.add('Taxi', '1998-04-08', 100.)
+
+
+def test_collection_store_round_trip(tmp_path):
+    data = pd.DataFrame({
+        'collection_name': ['Taxi', None, 'Taxi', 'Astérix', 'Taxi', 'Astérix'],
+        'release_date': ['1998-04-08', '1999-01-01', '2000-03-25', '1999-02-03', '2003-03-26', '2002-01-30'],
+        'sales': [100., 50., np.nan, 300., 200., 500.],
+    })
+    store = CollectionStore(window=2)
+    features = store.get_and_update_features(data.iloc[:3])
+    assert features['nb_movie_collection'].tolist() == [1, 0, 2]
+    path = str(tmp_path / 'collection_store.json')
+    store.save(path)
+
+    # Saved then loaded state gives the same features as one pass over all the movies
+    features = CollectionStore.load(path).get_and_update_features(data.iloc[3:])
+    expected = CollectionStore(window=2).get_and_update_features(data).iloc[3:]
+    pd.testing.assert_frame_equal(features, expected)
+    assert features['nb_movie_collection'].tolist() == [1, 3, 2]
+    np.testing.assert_array_equal(features['rolling_sales_collection'], [np.nan, 100., 300.])
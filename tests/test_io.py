@@ -0,0 +1,73 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import numpy as np
+import pandas as pd
+from lib.utils.io import get_dataset_cache_key_on_disk, load_dataset, patch_dataset, save_dataset
+
+SCHEMA = {'id': 'int64', 'release_date': 'datetime64[D]', 'sales': 'float32', 'budget': 'float32', 'is_drama': 'uint8'}
+
+
+def make_dataset(movie_ids: list) -> pd.DataFrame:
+    return pd.DataFrame({
+        'id': movie_ids,
+        'release_date': pd.to_datetime([f'2019-01-{day:02d}' for day in movie_ids]),
+        'sales': [1000. * movie_id for movie_id in movie_ids],
+        'budget': [1e6 * movie_id for movie_id in movie_ids],
+        'is_drama': [movie_id % 2 for movie_id in movie_ids],
+    })
+
+
+def test_dataset_round_trip(tmp_path):
+    path = str(tmp_path / 'dataset')
+    data = make_dataset([1, 2, 3])
+    save_dataset(data, path, SCHEMA, 'key')
+    loaded = load_dataset(path)
+
+    assert list(loaded.columns) == list(SCHEMA)
+    for col, dtype in SCHEMA.items():
+        np.testing.assert_array_equal(loaded[col].to_numpy(), data[col].to_numpy().astype(dtype))
+    # One block per dtype
+    assert sorted(os.listdir(path)) == sorted([f'{dtype}.npy' for dtype in set(SCHEMA.values())] + ['schema.json'])
+    assert np.load(os.path.join(path, 'uint8.npy')).dtype == np.uint8
+    assert get_dataset_cache_key_on_disk(path) == 'key'
+    assert get_dataset_cache_key_on_disk(str(tmp_path / 'missing')) is None
+
+
+def test_empty_dataset_round_trip(tmp_path):
+    path = str(tmp_path / 'dataset')
+    save_dataset(make_dataset([]), path, SCHEMA, 'key')
+    loaded = load_dataset(path)
+    assert len(loaded) == 0
+    assert list(loaded.columns) == list(SCHEMA)
+
+
+def test_patch_dataset(tmp_path):
+    path = str(tmp_path / 'dataset')
+    save_dataset(make_dataset([1, 2, 3]), path, SCHEMA, 'key')
+    changed = make_dataset([2])
+    changed['sales'] = 5.
+
+    # Same movies: rows are overwritten in place
+    patch_dataset(path, changed, np.array([1, 2, 3]), SCHEMA, 'new key')
+    loaded = load_dataset(path)
+    assert loaded['sales'].tolist() == [1000., 5., 3000.]
+    assert get_dataset_cache_key_on_disk(path) == 'new key'
+
+    # Removed and new movies: blocks are written again
+    patch_dataset(path, make_dataset([4]), np.array([2, 3, 4]), SCHEMA, 'newer key')
+    assert load_dataset(path)['id'].tolist() == [2, 3, 4]
@@ -0,0 +1,68 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from lib.crawling.movie_features.journal import MovieJournal, compact_journal, iter_journal, read_journal_ids
+
+
+def test_journal_round_trip(tmp_path):
+    path = str(tmp_path / 'movie-features.jsonl')
+    cards = [{'title': 'Taxi 2', 'id': '1', 'tmdb_id': 2332}, {'id': '2', 'title': 'Amélie', 'tmdb_id': 194}]
+    with MovieJournal(path, fsync_every=1) as journal:
+        for card in cards:
+            journal.append(card)
+    assert list(iter_journal(path)) == cards
+    assert read_journal_ids(path) == {'1', '2'}
+    # Ids are written first, so that they can be read without parsing whole records
+    with open(path, 'r', encoding='utf-8') as f:
+        assert all(line.startswith('{"id": ') for line in f)
+
+
+def test_journal_cuts_off_torn_line(tmp_path):
+    path = str(tmp_path / 'movie-features.jsonl')
+    with MovieJournal(path) as journal:
+        journal.append({'id': '1', 'tmdb_id': 2332})
+    # A crash in the middle of a write
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"id": "2", "tmdb_id": 19')
+    assert read_journal_ids(path) == {'1'}
+
+    with MovieJournal(path) as journal:
+        journal.append({'id': '3', 'tmdb_id': 5})
+    assert list(iter_journal(path)) == [{'id': '1', 'tmdb_id': 2332}, {'id': '3', 'tmdb_id': 5}]
+
+
+def test_journal_cuts_off_single_torn_line(tmp_path):
+    path = str(tmp_path / 'movie-features.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"id": "1", "tmdb_')
+    with MovieJournal(path):
+        pass
+    assert list(iter_journal(path)) == []
+    assert read_journal_ids(str(tmp_path / 'missing.jsonl')) == set()
+
+
+def test_compact_journal_keeps_last_record_of_each_id(tmp_path):
+    path = str(tmp_path / 'movie-features.jsonl')
+    output_path = str(tmp_path / 'movie-features.json')
+    with MovieJournal(path) as journal:
+        journal.append({'id': '1', 'popularity': 1.})
+        journal.append({'id': '2', 'popularity': 2.})
+        journal.append({'id': '1', 'popularity': 3.})
+    for indent in [4, None]:
+        assert compact_journal(path, output_path, indent) == 2
+        with open(output_path, 'r', encoding='utf-8') as f:
+            assert json.load(f) == [{'id': '2', 'popularity': 2.}, {'id': '1', 'popularity': 3.}]
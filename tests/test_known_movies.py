@@ -0,0 +1,62 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import pytest
+from boxoffice.known_movies import KnownMovies
+from boxoffice.partitions import PartitionedJsonLines
+
+TODAY = datetime.date(2020, 11, 23)
+
+
+def make_movie(jpbox_id: str, release_date: str = '2019-02-06', **sales) -> dict:
+    movie = {'id': jpbox_id, 'year': 2019, 'release_date': release_date,
+             'first_day_sales': 1, 'first_weekend_sales': 2, 'first_week_sales': 3}
+    movie.update(sales)
+    return movie
+
+
+@pytest.mark.parametrize('movie, is_up_to_date', [
+    (make_movie('1'), True),
+    (make_movie('1', first_weekend_sales=None), False),
+    (make_movie('1', release_date=None), False),
+    (make_movie('1', release_date='2020-11-01'), False),
+    (make_movie('1', release_date='unknown'), False),
+])
+def test_known_movies_get_up_to_date(movie, is_up_to_date):
+    known_movies = KnownMovies(refresh_weeks=8, today=TODAY)
+    known_movies.add(movie)
+    assert '1' in known_movies
+    assert (known_movies.get_up_to_date('1') == movie) is is_up_to_date
+    assert known_movies.get_up_to_date('2') is None
+
+
+def test_known_movies_from_dumps(tmp_path):
+    json_path, jsonl_path = str(tmp_path / 'dump.json'), str(tmp_path / 'dump.jsonl')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump([make_movie('1'), make_movie('2', first_day_sales=None)], f)
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(make_movie('2')) + '\n\n' + json.dumps(make_movie('3')) + '\n')
+    partitions = PartitionedJsonLines(str(tmp_path / 'french-box-office'))
+    partitions.open()
+    partitions.append(make_movie('4'))
+    partitions.close()
+
+    known_movies = KnownMovies.from_dumps([json_path, jsonl_path, partitions.dirpath, str(tmp_path / 'missing.json')])
+    assert len(known_movies) == 4
+    # The last dump wins
+    assert known_movies.movies['2'] == make_movie('2')
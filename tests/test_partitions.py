@@ -0,0 +1,87 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+from boxoffice.partitions import PartitionedJsonLines, get_movie, iter_partitions, load_index
+
+
+def make_record(jpbox_id: str, year: int, sales: int) -> dict:
+    return {'id': jpbox_id, 'year': year, 'title': f'Film {jpbox_id}', 'first_week_sales': sales}
+
+
+def test_partitions_round_trip(tmp_path):
+    dirpath = str(tmp_path / 'french-box-office')
+    partitions = PartitionedJsonLines(dirpath)
+    partitions.open()
+    records = [make_record('1', 2019, 100), make_record('2', 2020, 200), make_record('3', 2019, 300)]
+    assert all(partitions.append(record) for record in records)
+    assert partitions.get('2') == records[1]
+    partitions.close()
+
+    assert sorted(os.listdir(dirpath)) == ['2019.jsonl', '2020.jsonl', 'index.json']
+    assert list(iter_partitions(dirpath)) == [records[0], records[2], records[1]]
+    assert list(iter_partitions(dirpath, years=[2020])) == [records[1]]
+    assert get_movie(dirpath, '3') == records[2]
+    assert get_movie(dirpath, '4') is None
+
+
+def test_partitions_only_append_changed_records(tmp_path):
+    dirpath = str(tmp_path / 'french-box-office')
+    partitions = PartitionedJsonLines(dirpath)
+    partitions.open()
+    partitions.append(make_record('1', 2019, 100))
+    partitions.append(make_record('2', 2019, 200))
+    partitions.close()
+
+    partitions.open()
+    assert not partitions.append(make_record('1', 2019, 100))
+    assert partitions.append(make_record('2', 2019, 250))
+    partitions.close()
+    assert list(iter_partitions(dirpath)) == [make_record('1', 2019, 100), make_record('2', 2019, 250)]
+    assert list(iter_partitions(dirpath, latest_crawl=True)) == [make_record('2', 2019, 250)]
+
+    # A crawl that changed nothing has an empty delta
+    partitions.open()
+    partitions.append(make_record('2', 2019, 250))
+    partitions.close()
+    assert list(iter_partitions(dirpath, latest_crawl=True)) == []
+    assert len(load_index(dirpath)['crawls']) == 3
+
+
+def test_partitions_discard_interrupted_crawl(tmp_path):
+    dirpath = str(tmp_path / 'french-box-office')
+    partitions = PartitionedJsonLines(dirpath)
+    partitions.open()
+    partitions.append(make_record('1', 2019, 100))
+    partitions.close()
+    size = os.path.getsize(os.path.join(dirpath, '2019.jsonl'))
+
+    # Killed before close: lines are written, the index is not saved
+    partitions.open()
+    partitions.append(make_record('2', 2019, 200))
+    partitions.append(make_record('3', 2021, 300))
+    for f in partitions.files.values():
+        f.close()
+
+    partitions = PartitionedJsonLines(dirpath)
+    partitions.open()
+    assert os.path.getsize(os.path.join(dirpath, '2019.jsonl')) == size
+    assert os.path.getsize(os.path.join(dirpath, '2021.jsonl')) == 0
+    partitions.close()
+    assert list(iter_partitions(dirpath)) == [make_record('1', 2019, 100)]
+    with open(os.path.join(dirpath, 'index.json'), 'r', encoding='utf-8') as f:
+        assert set(json.load(f)['movies']) == {'1'}
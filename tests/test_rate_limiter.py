@@ -0,0 +1,55 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from lib.crawling.movie_features.tmdb.rate_limiter import TokenBucketRateLimiter, get_retry_after
+
+
+def time_acquire(rate_limiter: TokenBucketRateLimiter) -> float:
+    start = time.monotonic()
+    rate_limiter.acquire()
+    return time.monotonic() - start
+
+
+def test_rate_limiter_allows_bursts_then_waits():
+    rate_limiter = TokenBucketRateLimiter(rate=20, capacity=3)
+    assert sum(time_acquire(rate_limiter) for _ in range(3)) < 0.04
+    # The bucket is empty, a token is refilled every 1 / rate seconds
+    assert time_acquire(rate_limiter) >= 0.04
+
+
+def test_rate_limiter_is_shared_through_its_database(tmp_path):
+    path = str(tmp_path / 'rate_limiter.sqlite')
+    first = TokenBucketRateLimiter(rate=10, capacity=1, path=path)
+    second = TokenBucketRateLimiter(rate=10, capacity=1, path=path)
+    assert time_acquire(first) < 0.04
+    assert time_acquire(second) >= 0.08
+    first.close()
+    second.close()
+
+
+def test_rate_limiter_block_pauses_requests(tmp_path):
+    for path in [None, str(tmp_path / 'rate_limiter.sqlite')]:
+        rate_limiter = TokenBucketRateLimiter(rate=100, capacity=10, path=path)
+        rate_limiter.block(0.2)
+        assert time_acquire(rate_limiter) >= 0.18
+        rate_limiter.close()
+
+
+def test_get_retry_after():
+    assert get_retry_after({'Retry-After': '3'}) == 3.
+    assert get_retry_after({'Retry-After': 'Wed, 21 Oct 2020 07:28:00 GMT'}) is None
+    assert get_retry_after({}) is None
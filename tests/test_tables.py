@@ -0,0 +1,56 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import lxml.html
+from boxoffice.tables import extract_ranking_rows, extract_sales_rows
+
+FIXTURES_DIRPATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'crawling', 'boxoffice', 'fixtures')
+
+
+def parse_fixture(filename: str):
+    return lxml.html.parse(os.path.join(FIXTURES_DIRPATH, filename)).getroot()
+
+
+def test_extract_ranking_rows():
+    rows = list(extract_ranking_rows(parse_fixture('charts_france_2019.html')))
+    assert len(rows) == 100
+    assert rows[0] == ('1', 'Film numéro 1', '1 346 764', 'fichfilm.php?id=17007&view=2')
+
+
+def test_extract_sales_rows():
+    rows = dict(extract_sales_rows(parse_fixture('fichfilm_17007.html')))
+    assert rows['Premier jour'] == '410 259'
+    assert rows['Première semaine'] == '2 378 744'
+
+
+def test_extract_rows_of_empty_pages():
+    # A chart of a year without any movie yet, and a page without table
+    page = lxml.html.fromstring(
+        '<html><body><table class="tablesmall tablesmall5">'
+        '<tr><th>Rang</th><th>Titre</th><th>Entrées</th></tr></table></body></html>')
+    assert list(extract_ranking_rows(page)) == []
+    assert list(extract_sales_rows(lxml.html.fromstring('<html><body><p>Erreur</p></body></html>'))) == []
+
+
+def test_extract_rows_with_missing_cells():
+    page = lxml.html.fromstring(
+        '<html><body><table class="tablesmall  tablesmall5 "><tr>'
+        '<td class="col_poster_compteur "><div> 7 </div></td>'
+        '<td class="col_poster_titre "><h3><a href="fichfilm.php?id=1">Film</a></h3></td>'
+        '</tr></table></body></html>')
+    assert list(extract_ranking_rows(page)) == [('7', 'Film', None, 'fichfilm.php?id=1')]
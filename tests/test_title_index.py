@@ -0,0 +1,53 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from lib.crawling.movie_features.tmdb.title_index import TitleIndex, get_shard_index_path, normalize_title
+
+
+def test_title_index_lookups():
+    title_index = TitleIndex()
+    title_index.add('Astérix & Obélix : Mission Cléopâtre', 2899, 2002)
+    title_index.add('Taxi 2', 2332, 2000)
+    title_index.add('Taxi 3', 2333, 2003)
+    assert normalize_title('Astérix & Obélix : Mission Cléopâtre') == 'asterix obelix mission cleopatre'
+    assert title_index.get('asterix et obelix mission cleopatre') is None
+    assert title_index.find('Asterix et Obelix : Mission Cleopatre', 2002) == 2899
+    # The box office chart year may be a year after the TMDb release
+    assert title_index.get('Taxi 2', 2001) == 2332
+    assert title_index.get('Taxi 2', 2003) is None
+    assert title_index.find('Asterix & Obelix - Mission Cleopatre', 2003) == 2899
+    assert title_index.find('Asterix & Obelix - Mission Cleopatre', 2005) is None
+    # Sequels are not mistaken for each other
+    assert title_index.search('Taxi 4') is None
+    assert (title_index.hits, title_index.misses) == (2, 1)
+
+
+def test_title_index_shards_merge(tmp_path):
+    path = str(tmp_path / 'tmdb_title_index.json')
+    assert get_shard_index_path(path, 1) == str(tmp_path / 'tmdb_title_index_shard1.json')
+    for shard, (title, tmdb_id) in enumerate([('Taxi 2', 2332), ('Le Roi Lion', 420818)]):
+        title_index = TitleIndex()
+        title_index.add(title, tmdb_id, 2019)
+        title_index.save(get_shard_index_path(path, shard))
+
+    merged = TitleIndex()
+    for shard in range(2):
+        merged.update(TitleIndex.load(get_shard_index_path(path, shard)))
+    merged.save(path)
+    loaded = TitleIndex.load(path)
+    assert len(loaded) == 2 and not loaded.dirty
+    assert loaded.get('Taxi 2') == 2332
+    assert loaded.get('le roi lion', 2019) == 420818
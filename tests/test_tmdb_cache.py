@@ -0,0 +1,92 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import types
+import pytest
+from lib.crawling.movie_features.tmdb.cache import ResponseCache
+from lib.crawling.movie_features.tmdb import cache as cache_module
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Responses are stamped with the time they were stored or read, ticking one second per call
+    now = [1e9]
+
+    def tick():
+        now[0] += 1
+        return now[0]
+    monkeypatch.setattr(cache_module, 'time', types.SimpleNamespace(time=tick))
+    return now
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResponseCache(path)
+    response = {'id': 2332, 'title': 'Taxi 2', 'genres': [{'id': 28, 'name': 'Action'}]}
+    cache.set('/movie/2332', {'language': 'fr', 'api_key': 'secret'}, response)
+    assert cache.get('/movie/2332', {'language': 'fr'}) == (True, response)
+    assert cache.get('/movie/2332', {'language': 'en'}) == (False, None)
+    cache.close()
+
+    cache = ResponseCache(path)
+    assert cache.get('/movie/2332', {'language': 'fr', 'api_key': 'other'}) == (True, response)
+    assert cache.stats() == {'hits': 1, 'misses': 0, 'hit_rate': 1., 'size': 1}
+    cache.close()
+
+
+def test_cache_replaced_response_is_counted_once():
+    cache = ResponseCache(':memory:')
+    for popularity in range(3):
+        cache.set('/movie/1', {}, {'id': 1, 'popularity': popularity})
+    assert cache.stats()['size'] == 1
+    assert cache.get('/movie/1', {}) == (True, {'id': 1, 'popularity': 2})
+
+
+def test_cache_negative_responses_expire(clock):
+    cache = ResponseCache(':memory:', negative_ttl=10)
+    cache.set('/search/movie', {'query': 'Unknown'}, {'page': 1, 'results': []})
+    cache.set('/search/movie', {'query': 'Taxi 2'}, {'page': 1, 'results': [{'id': 2332}]})
+    assert cache.get('/search/movie', {'query': 'Unknown'})[0]
+    clock[0] += 3600
+    assert cache.get('/search/movie', {'query': 'Unknown'}) == (False, None)
+    assert cache.get('/search/movie', {'query': 'Taxi 2'})[0]
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = ResponseCache(':memory:', max_entries=10)
+    for movie_id in range(10):
+        cache.set(f'/movie/{movie_id}', {}, {'id': movie_id})
+    # The oldest response is read again, so that it is the most recently used
+    assert cache.get('/movie/0', {})[0]
+    cache.set('/movie/10', {}, {'id': 10})
+
+    # 11 responses are evicted down to 90% of the capacity, the two least recently used ones first
+    assert cache.stats()['size'] == 9
+    kept = [movie_id for movie_id in range(11) if cache.get(f'/movie/{movie_id}', {})[0]]
+    assert kept == [0, 3, 4, 5, 6, 7, 8, 9, 10]
+
+
+def test_cache_invalidate_drops_sub_endpoints():
+    cache = ResponseCache(':memory:')
+    cache.set('/movie/12', {}, {'id': 12})
+    cache.set('/movie/12/credits', {}, {'cast': []})
+    cache.set('/movie/123', {}, {'id': 123})
+    cache.invalidate('/movie/12')
+    assert not cache.get('/movie/12', {})[0]
+    assert not cache.get('/movie/12/credits', {})[0]
+    assert cache.get('/movie/123', {})[0]
+    assert cache.stats()['size'] == 1
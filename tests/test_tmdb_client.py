@@ -0,0 +1,62 @@
+# Copyright (C) 2020 Artefact
+# licence-information@artefact.com
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import pytest
+from lib.crawling.movie_features.tmdb.async_client import AsyncTMDbClient
+from lib.crawling.movie_features.tmdb.client import TMDbClient
+from lib.crawling.movie_features.tmdb.stub_server import start_stub_server
+
+# The stub server answers 404 for ids above 1e6
+UNKNOWN_ID = 2000000
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = start_stub_server()
+    yield f'http://127.0.0.1:{server.server_address[1]}/3'
+    server.shutdown()
+
+
+@pytest.mark.parametrize('append_credits', [True, False])
+def test_client_get_movie_card(base_url, append_credits):
+    client = TMDbClient(api_key='stub', base_url=base_url, append_credits=append_credits)
+    card = client.get_movie_card(5)
+    assert card['title'] == 'Movie 5'
+    assert len(card['cast']) > 0
+    assert client.get_movie_card(UNKNOWN_ID) is None
+
+
+@pytest.mark.parametrize('append_credits', [True, False])
+def test_async_client_get_movie_cards(base_url, append_credits):
+    client = AsyncTMDbClient(api_key='stub', base_url=base_url, append_credits=append_credits)
+
+    async def get_cards():
+        return await asyncio.gather(*[client.get_movie_card(movie_id) for movie_id in [5, UNKNOWN_ID, 7]])
+    cards = asyncio.run(get_cards())
+    client.close()
+    assert [card and card['title'] for card in cards] == ['Movie 5', None, 'Movie 7']
+
+
+def test_client_find_movie_match(base_url):
+    client = TMDbClient(api_key='stub', base_url=base_url)
+    movie_id, strategy = client.find_movie_match('Movie 3')
+    assert strategy == 'title'
+    year = int(client.get_movie_card(movie_id)['release_date'][:4])
+    assert client.find_movie_match('Movie 3', year) == (movie_id, 'primary_release_year')
+    assert client.find_movie_match('Movie 3', year + 1) == (movie_id, 'nearby_year')
+    # Results released far from the wanted year are kept as a last resort
+    assert client.find_movie_match('Movie 3', year + 5) == (movie_id, 'any_year')